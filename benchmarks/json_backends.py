@@ -0,0 +1,57 @@
+# coding: utf-8
+"""
+Compare eor-rest-json encoder backends on a time-heavy grid page.
+
+    python benchmarks/json_backends.py [rows]
+"""
+
+import sys
+import json
+import uuid
+import decimal
+import datetime
+import timeit
+
+from eor_rest.json import backends
+
+
+def make_page(rows):
+    now = datetime.datetime(2020, 1, 1, 12, 0, tzinfo=datetime.timezone.utc)
+    return {
+        'status': 'ok',
+        'count': rows,
+        'data': [{
+            'id': i,
+            'uuid': uuid.UUID(int=i),
+            'name': 'Row %d' % i,
+            'price': decimal.Decimal('%d.99' % i),
+            'created': now + datetime.timedelta(minutes=i),
+            'updated': now + datetime.timedelta(hours=i),
+            'shipped': now + datetime.timedelta(days=i),
+        } for i in range(rows)]
+    }
+
+
+def main(rows=500, repeat=5, number=20):
+    page = make_page(rows)
+    reference = None
+
+    for name, factory in sorted(backends.items()):
+        try:
+            renderer = factory()
+        except ImportError as e:
+            print('%-8s not available: %s' % (name, e))
+            continue
+
+        encoded = renderer.dumps(page, None)
+        if reference is None:
+            reference = json.loads(encoded)
+        elif json.loads(encoded) != reference:
+            raise AssertionError('backend %r output differs' % name)
+
+        best = min(timeit.repeat(lambda: renderer.dumps(page, None), repeat=repeat, number=number)) / number
+        print('%-8s %5d rows: %8.3f ms/page %10.0f rows/s' % (name, rows, best * 1000, rows / best))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,343 @@
+# coding: utf-8
+"""
+Microbenchmarks of the serializer, deserializer and query builder hot paths on
+in-memory SQLite fixtures, at several data sizes. Reports ops/s and the peak
+memory allocated by one call (tracemalloc).
+
+    python benchmarks/microbench.py [--sizes 10,100,1000] [--only serialize_obj,...]
+                                    [--save results.json] [--baseline results.json]
+
+--save writes the results, --baseline compares against previously saved results.
+"""
+
+import json
+import time
+import timeit
+import decimal
+import datetime
+import argparse
+import tracemalloc
+
+import sqlalchemy as sa
+from sqlalchemy.orm import relationship, sessionmaker, scoped_session
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.ext.associationproxy import association_proxy
+from voluptuous import Schema, Required, Optional, Any
+
+from eor_rest.config import config
+from eor_rest.model import RestMixin
+from eor_rest.serialize import serialize_sqlalchemy_obj, serialize_sqlalchemy_list
+from eor_rest.deserialize import update_entity_from_appstruct, update_one_to_many
+
+Base = declarative_base()
+Session = scoped_session(sessionmaker())
+
+EPOCH = datetime.datetime(2020, 1, 1, 12, 0)
+
+
+order_tags = sa.Table('order_tags', Base.metadata,
+    sa.Column('order_id', sa.Integer, sa.ForeignKey('order.id'), primary_key=True),
+    sa.Column('tag_id', sa.Integer, sa.ForeignKey('tag.id'), primary_key=True))
+
+
+class Customer(RestMixin, Base):
+    __tablename__ = 'customer'
+
+    id = sa.Column(sa.Integer, primary_key=True)
+    name = sa.Column(sa.Unicode, nullable=False)
+    email = sa.Column(sa.Unicode)
+    phone = sa.Column(sa.Unicode)
+    company = sa.Column(sa.Unicode)
+    street = sa.Column(sa.Unicode)
+    city = sa.Column(sa.Unicode)
+    zip = sa.Column(sa.Unicode)
+    country = sa.Column(sa.Unicode)
+    notes = sa.Column(sa.UnicodeText)
+    active = sa.Column(sa.Boolean)
+    rating = sa.Column(sa.Integer)
+    visits = sa.Column(sa.Integer)
+    balance = sa.Column(sa.Numeric(12, 2))
+    credit_limit = sa.Column(sa.Numeric(12, 2))
+    discount = sa.Column(sa.Numeric(5, 2))
+    birthday = sa.Column(sa.Date)
+    created = sa.Column(sa.DateTime)
+    updated = sa.Column(sa.DateTime)
+    last_login = sa.Column(sa.DateTime)
+    password_hash = sa.Column(sa.Unicode, info={'er_serialize': False})
+
+    orders = relationship('Order', back_populates='customer', cascade='all, delete-orphan', order_by='Order.id')
+
+
+class Order(RestMixin, Base):
+    __tablename__ = 'order'
+
+    id = sa.Column(sa.Integer, primary_key=True)
+    customer_id = sa.Column(sa.Integer, sa.ForeignKey('customer.id'), nullable=False, info={'er_serialize': False})
+    number = sa.Column(sa.Unicode, nullable=False)
+    created = sa.Column(sa.DateTime)
+    total = sa.Column(sa.Numeric(12, 2))
+
+    customer = relationship('Customer', back_populates='orders')
+    lines = relationship('OrderLine', back_populates='order', cascade='all, delete-orphan', order_by='OrderLine.id')
+    tags = relationship('Tag', secondary=order_tags, order_by='Tag.id')
+    tag_names = association_proxy('tags', 'name')
+
+
+class OrderLine(RestMixin, Base):
+    __tablename__ = 'order_line'
+
+    id = sa.Column(sa.Integer, primary_key=True)
+    order_id = sa.Column(sa.Integer, sa.ForeignKey('order.id'), nullable=False, info={'er_serialize': False})
+    sku = sa.Column(sa.Unicode, nullable=False)
+    quantity = sa.Column(sa.Integer)
+    price = sa.Column(sa.Numeric(12, 2))
+
+    order = relationship('Order', back_populates='lines')
+
+
+class Tag(RestMixin, Base):
+    __tablename__ = 'tag'
+
+    id = sa.Column(sa.Integer, primary_key=True)
+    name = sa.Column(sa.Unicode, nullable=False)
+
+
+def customer_values(i, variant=0):
+    return {
+        'name': 'Customer %d' % i,
+        'email': 'c%d.%d@example.org' % (i, variant),
+        'phone': '+1 555 %07d' % (i + variant),
+        'company': 'Company %d' % (i % 50),
+        'street': '%d Main Street' % (i + variant),
+        'city': 'City %d' % (i % 20),
+        'zip': '%05d' % i,
+        'country': 'US',
+        'notes': 'Notes for customer %d, variant %d' % (i, variant),
+        'active': bool((i + variant) % 2),
+        'rating': (i + variant) % 5,
+        'visits': i * 3 + variant,
+        'balance': decimal.Decimal('%d.%02d' % (i, variant % 100)),
+        'credit_limit': decimal.Decimal('1000.00'),
+        'discount': decimal.Decimal('2.50'),
+        'birthday': datetime.date(1980, 1, 1) + datetime.timedelta(days=i),
+        'created': EPOCH + datetime.timedelta(hours=i),
+        'updated': EPOCH + datetime.timedelta(hours=i, minutes=variant),
+        'last_login': EPOCH + datetime.timedelta(days=i, minutes=variant),
+    }
+
+
+def setup(customers, orders_per_customer=0, lines_per_order=2):
+    """
+    fresh in-memory database with customers, their orders with lines and tags
+    """
+    Session.remove()
+    engine = sa.create_engine('sqlite://')
+    Session.configure(bind=engine)
+    Base.metadata.create_all(engine)
+    config.sqlalchemy_session = Session
+
+    session = Session()
+    tags = [Tag(id=i + 1, name='tag%d' % i) for i in range(5)]
+    session.add_all(tags)
+
+    for i in range(customers):
+        customer = Customer(id=i + 1, password_hash='x', **customer_values(i))
+        for o in range(orders_per_customer):
+            order = Order(number='%d-%d' % (i, o), created=EPOCH + datetime.timedelta(minutes=o),
+                total=decimal.Decimal('%d.99' % o), tags=tags[:o % 3 + 1])
+            order.lines = [OrderLine(sku='SKU-%d' % l, quantity=l + 1, price=decimal.Decimal('4.99'))
+                for l in range(lines_per_order)]
+            customer.orders.append(order)
+        session.add(customer)
+
+    session.commit()
+    return session
+
+
+# benchmarks: name -> make(size) -> function to time
+
+ORDER_SPEC = {'*': True, 'lines': {'*': True}, 'tags': {'name': True}, 'tag_names': True}
+
+
+def make_serialize_obj(size):
+    session = setup(1, orders_per_customer=size)
+    customer = session.query(Customer).get(1)
+    field_spec = {'*': True, 'orders': ORDER_SPEC}
+    serialize_sqlalchemy_obj(customer, field_spec=field_spec)  # load relationships
+
+    return lambda: serialize_sqlalchemy_obj(customer, field_spec=field_spec)
+
+
+def make_serialize_list(size):
+    session = setup(size)
+    customers = session.query(Customer).all()
+    field_spec = {'*': True}
+
+    return lambda: serialize_sqlalchemy_list(customers, field_spec=field_spec)
+
+
+def make_deserialize(size):
+    schema = Schema({
+        Required('name'): str,
+        Optional('email'): Any(None, str),
+        Optional('active'): bool,
+        Optional('rating'): int,
+        Optional('balance'): Any(float, int),
+        Optional('orders'): [{
+            Optional('id'): int,
+            Required('number'): str,
+            Optional('total'): Any(float, int),
+            Optional('lines'): [{Optional('id'): int, Required('sku'): str, Optional('quantity'): int}],
+            Optional('tags'): [int],
+        }],
+    }, required=True)
+
+    payload = {
+        'name': 'Customer', 'email': 'c@example.org', 'active': True, 'rating': 3, 'balance': 10.5,
+        'orders': [{
+            'id': o, 'number': 'N-%d' % o, 'total': 9.99,
+            'lines': [{'id': l, 'sku': 'SKU-%d' % l, 'quantity': 1} for l in range(2)],
+            'tags': [1, 2],
+        } for o in range(size)],
+    }
+
+    return lambda: schema(payload)
+
+
+def make_update_entity(size):
+    session = setup(size)
+    customers = session.query(Customer).all()
+    variant = [0]
+
+    def run():
+        variant[0] += 1
+        for customer in customers:
+            update_entity_from_appstruct(customer, customer_values(customer.id - 1, variant[0]))
+        session.flush()
+
+    return run
+
+
+def make_update_one_to_many(size):
+    session = setup(1, orders_per_customer=size)
+    customer = session.query(Customer).get(1)
+    order_ids = [order.id for order in customer.orders]
+    variant = [0]
+
+    def run():
+        # every existing order changed, one new order replacing the previous new one
+        variant[0] += 1
+        appstruct = [{'id': id, 'number': '%d-%d' % (id, variant[0] % 2)} for id in order_ids]
+        appstruct.append({'number': 'new-%d' % variant[0]})
+        with session.no_autoflush:
+            update_one_to_many(customer, 'orders', appstruct)
+        session.flush()
+
+    return run
+
+
+def make_update_one_to_many_sparse(size):
+    session = setup(1, orders_per_customer=size)
+    customer = session.query(Customer).get(1)
+    appstruct = [{'id': order.id, 'number': order.number} for order in customer.orders]
+    variant = [0]
+
+    def run():
+        # one order of size changed
+        variant[0] += 1
+        appstruct[0]['number'] = 'changed-%d' % (variant[0] % 2)
+        with session.no_autoflush:
+            update_one_to_many(customer, 'orders', appstruct)
+        session.flush()
+
+    return run
+
+
+def make_rest_get_list(size):
+    setup(size * 10)
+    query_params = {'start': 0, 'limit': size, 'order': {'col': 'name', 'dir': 'asc'},
+        'filters': {'e_country': 'US'}, 'field_spec': {'*': True}}
+
+    return lambda: Customer.rest_get_list(dict(query_params))
+
+
+benchmarks = [
+    ('serialize_obj', make_serialize_obj),
+    ('serialize_list', make_serialize_list),
+    ('deserialize', make_deserialize),
+    ('update_entity', make_update_entity),
+    ('update_one_to_many', make_update_one_to_many),
+    ('update_one_to_many_sparse', make_update_one_to_many_sparse),
+    ('rest_get_list', make_rest_get_list),
+]
+
+
+def measure(fn, repeat=5, min_time=0.2):
+    """
+    :return: (ops per second of the best repeat, peak KiB allocated by one call)
+    """
+    fn()  # warm up plan and statement caches
+
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        if time.perf_counter() - start >= min_time / repeat or number >= 100000:
+            break
+        number *= 2
+
+    best = min(timeit.repeat(fn, repeat=repeat, number=number)) / number
+
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return 1 / best, peak / 1024
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10,100,1000', help='comma separated data sizes')
+    parser.add_argument('--only', help='comma separated benchmark names')
+    parser.add_argument('--save', help='write results to this JSON file')
+    parser.add_argument('--baseline', help='compare with results saved by --save')
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    only = set(args.only.split(',')) if args.only else None
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results = {}
+    for name, make in benchmarks:
+        if only is not None and name not in only:
+            continue
+
+        for size in sizes:
+            key = '%s[%d]' % (name, size)
+            ops, peak_kib = measure(make(size))
+            results[key] = {'ops': ops, 'peak_kib': peak_kib}
+
+            line = '%-34s %12.1f ops/s %10.1f KiB peak' % (key, ops, peak_kib)
+            if key in baseline:
+                line += '   %+6.1f%% ops/s %+6.1f%% KiB' % (
+                    (ops / baseline[key]['ops'] - 1) * 100,
+                    (peak_kib / baseline[key]['peak_kib'] - 1) * 100 if baseline[key]['peak_kib'] else 0)
+            print(line)
+
+    Session.remove()
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
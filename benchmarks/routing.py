@@ -0,0 +1,58 @@
+# coding: utf-8
+"""
+Compare per-endpoint routes with compact (catch-all) routes: time to route and dispatch
+a GET by id to the first, middle and last registered endpoint of an API with 10, 100
+and 1000 endpoints. Handlers do no database work.
+
+    python benchmarks/routing.py [endpoints,...]
+"""
+
+import sys
+import timeit
+
+from pyramid.config import Configurator
+from pyramid.request import Request
+
+from eor_rest import RestAPI, RestDelegate
+
+
+class BenchDelegate(RestDelegate):
+    etags = False
+
+    def get_item_handler(self):
+        return {'status': 'ok', 'id': self.get_id_from_request()}
+
+
+def make_app(endpoints, compact):
+    api = RestAPI('bench-%d-%s' % (endpoints, 'compact' if compact else 'routes'))
+
+    for i in range(endpoints):
+        entity = type('Entity%d' % i, (object,), {})
+        api.endpoint()(type('Entity%dEndpoint' % i, (BenchDelegate,), {'entity': entity}))
+
+    config = Configurator(settings={'eor_rest.sqlalchemy_session': None, 'eor_rest.do_csrf_checks': 'false'})
+    config.add_request_method(lambda request: None, 'user', reify=True)  # read by RestViews for logging
+    config.include('eor_rest')
+    api.add_routes(config, compact=compact)
+
+    return config.make_wsgi_app()
+
+
+def main(sizes=(10, 100, 1000), repeat=5, number=500):
+    for endpoints in sizes:
+        for compact in (False, True):
+            app = make_app(endpoints, compact)
+
+            for position in (0, endpoints // 2, endpoints - 1):
+                url = '/rest/entity%d/1' % position
+                response = Request.blank(url).get_response(app)
+                assert response.status_int == 200 and b'"ok"' in response.body, response
+
+                best = min(timeit.repeat(lambda: Request.blank(url).get_response(app),
+                    repeat=repeat, number=number)) / number
+                print('%-7s %5d endpoints, endpoint %5d: %8.1f us/request' % (
+                    'compact' if compact else 'routes', endpoints, position, best * 1e6))
+
+
+if __name__ == '__main__':
+    main(*[[int(size) for size in arg.split(',')] for arg in sys.argv[1:2]])
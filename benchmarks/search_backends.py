@@ -0,0 +1,70 @@
+# coding: utf-8
+"""
+Compare search backends for RestMixin.rest_get_list(q=...) on an in-memory SQLite table.
+
+    python benchmarks/search_backends.py [rows]
+"""
+
+import sys
+import random
+import timeit
+
+import sqlalchemy as sa
+from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.ext.declarative import declarative_base
+
+from eor_rest.config import config
+from eor_rest.model import RestMixin
+from eor_rest.search import LikeSearch, SQLiteFTS5Search
+
+Base = declarative_base()
+Session = scoped_session(sessionmaker())
+
+
+class Document(RestMixin, Base):
+    __tablename__ = 'document'
+
+    id = sa.Column(sa.Integer, primary_key=True)
+    title = sa.Column(sa.Unicode, nullable=False)
+    body = sa.Column(sa.Unicode, nullable=False)
+
+    _rest_search_columns = [title, body]
+
+
+def setup(rows):
+    engine = sa.create_engine('sqlite://')
+    Session.configure(bind=engine)
+    Base.metadata.create_all(engine)
+    config.sqlalchemy_session = Session
+
+    rnd = random.Random(0)
+    words = ['%s%d' % (w, n) for w in ('alpha', 'beta', 'gamma', 'delta', 'omega') for n in range(5000)]
+
+    Session().execute(Document.__table__.insert(), [{
+        'id': i + 1,
+        'title': ' '.join(rnd.choice(words) for _ in range(4)),
+        'body': ' '.join(rnd.choice(words) for _ in range(40)),
+    } for i in range(rows)])
+
+    fts = SQLiteFTS5Search()
+    fts.create(Session().connection(), Document)
+    fts.rebuild(Session().connection(), Document)
+    Session.commit()
+
+
+def main(rows=50000, repeat=5, number=10):
+    setup(rows)
+
+    for name, backend in [('like', LikeSearch()), ('fts5', SQLiteFTS5Search())]:
+        Document._rest_search_backend = backend
+
+        for search in ['gamma1234', 'alpha3456 omega42']:
+            query_params = {'search': search, 'limit': 50}
+            count, _ = Document.rest_get_list(query_params)
+
+            best = min(timeit.repeat(lambda: Document.rest_get_list(query_params), repeat=repeat, number=number)) / number
+            print('%-5s %6d rows, q=%-16r %6d matches: %8.2f ms/request' % (name, rows, search, count, best * 1000))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -4,6 +4,7 @@ from . import config as config_module
 from .delegate import RestDelegate
 from .routes import RestAPI
 from .model import RestMixin
+from .aio import AsyncRestDelegate, AsyncRestMixin
 from .exceptions import RESTException, ValidationException
 
 
@@ -14,5 +15,40 @@ def includeme(config):
     from .json import get_json_renderer
     config.add_renderer('eor-rest-json', get_json_renderer(config))
 
+    if config_module.config.sqlalchemy_read_session is not None:
+        from .sessions import install_router
+        install_router()
+
+    if config_module.config.response_cache:
+        _configure_response_cache(config)
+
+    if config_module.config.timing:
+        _configure_timing(config)
+
     from .views import exception_view
     config.add_view(exception_view, context=RESTException)
+
+
+def _configure_response_cache(config):
+    from .cache import response_cache, LRUCache, install_invalidation
+
+    settings = config_module.config
+    if settings.response_cache_backend:
+        # dotted name of a callable returning an object with get(key) and set(key, value)
+        response_cache.backend = config.maybe_dotted(settings.response_cache_backend)()
+    else:
+        response_cache.backend = LRUCache(settings.response_cache_max_bytes)
+
+    install_invalidation()
+
+
+def _configure_timing(config):
+    from . import timing
+
+    settings = config_module.config
+    if settings.timing_sink:
+        settings.timing_sink = config.maybe_dotted(settings.timing_sink)
+    else:
+        settings.timing_sink = timing.stats
+
+    timing.install_sql_counters()
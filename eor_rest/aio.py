@@ -0,0 +1,397 @@
+# coding: utf-8
+
+import contextvars
+
+from .exceptions import *
+from .delegate import RestDelegate, _patch_hooks, _getter_hooks, _list_getter_hooks, _overrides
+from .deserialize import update_entity_from_appstruct, run_hooks_on_delete
+from .model import RestMixin
+
+import logging
+log = logging.getLogger(__name__)
+
+
+# AsyncSession of the current request, set by asgi.RestASGIApp
+current_session = contextvars.ContextVar('eor_rest_async_session', default=None)
+
+
+def get_async_session():
+    session = current_session.get()
+    if session is None:
+        raise RuntimeError('eor_rest: no AsyncSession, not inside a request of asgi.RestASGIApp')
+
+    return session
+
+
+async def run_sync(fn, *args, **kwargs):
+    """
+    Run fn(*args, **kwargs) in a greenlet of the current AsyncSession (AsyncSession.run_sync()):
+    sync ORM code, lazy loads and the RestMixin methods work unchanged while the event loop
+    waits on the database. During the request eor_rest.sqlalchemy_session is the sync Session
+    of the AsyncSession, see SyncSession.
+    """
+    return await get_async_session().run_sync(lambda session: fn(*args, **kwargs))
+
+
+class SyncSession(object):
+    """
+    eor_rest.sqlalchemy_session during a request of asgi.RestASGIApp (see Config.sqlalchemy_session):
+    calls and attributes go to the sync Session of the request's AsyncSession
+    """
+
+    def __init__(self, async_session):
+        self.async_session = async_session
+
+    def __call__(self):
+        return self.async_session.sync_session
+
+    def __getattr__(self, name):
+        return getattr(self.async_session.sync_session, name)
+
+
+class AsyncRestMixin(RestMixin):
+    """
+    RestMixin with coroutine counterparts of its entry points for AsyncRestDelegate. They run
+    the RestMixin methods with run_sync(), so hooks such as _rest_get_inner_query() and the
+    search and filter options apply as they are. The sync methods stay available to RestDelegate.
+    """
+
+    @classmethod
+    async def rest_get_by_id_async(cls, id, field_spec=None, loader_strategies=None):
+        """
+        :param field_spec: see RestMixin.rest_get_by_id(); without it, an override taking the id alone works
+        """
+        if field_spec is None:
+            return await run_sync(cls.rest_get_by_id, id)
+        return await run_sync(cls.rest_get_by_id, id, field_spec=field_spec, loader_strategies=loader_strategies)
+
+    @classmethod
+    async def rest_get_by_ids_async(cls, appstruct, field_spec=None, loader_strategies=None):
+        if field_spec is None:
+            return await run_sync(cls.rest_get_by_ids, appstruct)
+        return await run_sync(cls.rest_get_by_ids, appstruct, field_spec=field_spec, loader_strategies=loader_strategies)
+
+    @classmethod
+    async def rest_get_list_async(cls, query_params):
+        """
+        see RestMixin.rest_get_list(); yield_per is not supported
+        """
+        return await run_sync(cls.rest_get_list, query_params)
+
+    @classmethod
+    async def rest_update_columns_async(cls, id, values):
+        return await run_sync(cls.rest_update_columns, id, values)
+
+    async def rest_add_async(self, flush=False):
+        return await run_sync(self.rest_add, flush)
+
+    async def rest_delete_async(self, flush=False):
+        return await run_sync(self.rest_delete, flush)
+
+
+class AsyncRestDelegate(RestDelegate):
+    """
+    RestDelegate for asgi.RestASGIApp; entity must be an AsyncRestMixin.
+
+    Handlers and the hooks that may read or write the database are coroutines: get_obj_by_id,
+    get_obj_list, is_access_allowed_for_obj, update_obj, before_create, after_populated,
+    after_create, before_update, after_update, before_delete, run_delete_hooks, delete_obj,
+    after_delete and custom methods. Schema, field spec and request parsing methods stay plain
+    methods; serialize_obj(), serialize_coll(), get_list_extras() and the *_response() methods
+    are plain too but run in run_sync(), so lazy loads work there.
+
+    Not supported: etags, cache_responses, stream, allow_bulk, allow_delete_by_filter.
+    """
+
+    entity_getter = 'rest_get_by_id_async'
+    entity_list_getter = 'rest_get_list_async'
+    etags = False
+
+    async def get_obj_by_id(self, field_spec=None):
+        """
+        :param field_spec: if given and eager_load is set, relationships used by field_spec are eager loaded;
+            only by AsyncRestMixin.rest_get_by_id_async(), custom getters and overrides are called with the id alone
+        """
+        obj_id = self.get_id_from_request()
+
+        if (field_spec is not None and self.eager_load and self.entity_getter == 'rest_get_by_id_async'
+                and not _overrides(self.get_entity(), AsyncRestMixin, ['rest_get_by_id_async', 'rest_get_by_id'])):
+            obj = await getattr(self.get_entity(), self.entity_getter)(
+                obj_id, field_spec=field_spec, loader_strategies=self.loader_strategies)
+        else:
+            obj = await getattr(self.get_entity(), self.entity_getter)(obj_id)
+
+        # security check
+        if not await self.is_access_allowed_for_obj(obj, self.request.method):
+            log.debug('is_access_allowed_for_obj() is False, method %s, entity %r, id %r',
+                self.request.method, self.name, obj_id)
+            raise RESTException(code='forbidden')
+
+        return obj
+
+    async def is_access_allowed_for_obj(self, obj, method):
+        return True
+
+    @classmethod
+    def uses_default_getter(cls):
+        """
+        see RestDelegate.uses_default_getter()
+        """
+        return (cls.entity_getter == 'rest_get_by_id_async'
+            and not _overrides(cls, AsyncRestDelegate, _getter_hooks)
+            and not _overrides(cls.entity, AsyncRestMixin, ['rest_get_by_id_async', 'rest_get_by_id']))
+
+    @classmethod
+    def uses_default_list_getter(cls):
+        """
+        see RestDelegate.uses_default_list_getter()
+        """
+        return (cls.entity_list_getter == 'rest_get_list_async'
+            and not _overrides(cls, AsyncRestDelegate, _list_getter_hooks)
+            and not _overrides(cls.entity, AsyncRestMixin, ['rest_get_list_async', 'rest_get_list']))
+
+    async def update_obj(self, obj, deserialized):
+        """
+        Used by create and update handlers
+        """
+        await run_sync(update_entity_from_appstruct, obj, deserialized)
+
+    # get list
+
+    async def get_list_handler(self):
+        ids = self.get_requested_ids()
+        if ids is not None:
+            return await self.get_by_ids_handler(ids)
+
+        count, lst = await self.get_obj_list()
+
+        has_more = None
+        if self.count_strategy == 'none' and 'limit' in self.query_params:
+            # count strategy 'none' fetches limit + 1 objects
+            has_more = len(lst) > self.query_params['limit']
+            lst = lst[:self.query_params['limit']]
+
+        with self.timings.phase('serialize'):
+            data = await run_sync(self.serialize_coll, lst)
+
+        resp = {
+            'status': 'ok',
+            'count': count,
+            'data': data
+        }
+
+        resp.update(await run_sync(self.get_list_extras, len(lst), lst[-1] if lst else None, has_more))
+
+        return resp
+
+    async def get_by_ids_handler(self, ids):
+        """
+        see RestDelegate.get_by_ids_handler()
+        """
+        if not (self.uses_default_getter() and self.uses_default_list_getter()):
+            raise RESTException(code='ids-not-supported', msg='ids= needs the default entity getters')
+
+        appstruct = [{'id': id} for id in ids]
+
+        with self.timings.phase('query'):
+            if self.eager_load and not _overrides(self.get_entity(), AsyncRestMixin,
+                    ['rest_get_by_ids_async', 'rest_get_by_ids']):
+                objs = await self.get_entity().rest_get_by_ids_async(appstruct,
+                    field_spec=self.get_selected_fields_for_coll(), loader_strategies=self.loader_strategies)
+            else:
+                objs = await self.get_entity().rest_get_by_ids_async(appstruct)
+
+        objs_by_id = {str(self.get_id_from_obj(obj)): obj for obj in objs}
+
+        found = []
+        missing = []
+        for id in ids:
+            obj = objs_by_id.get(id)
+            if obj is None or not await self.is_access_allowed_for_obj(obj, self.request.method):
+                missing.append(id)
+            else:
+                found.append(obj)
+
+        self.timings.rows += len(found)
+
+        with self.timings.phase('serialize'):
+            data = await run_sync(self.serialize_coll, found)
+
+        return {
+            'status': 'ok',
+            'count': len(found),
+            'data': data,
+            'missing': missing
+        }
+
+    async def get_obj_list(self):
+        """
+        :return: (total_count, list_of_objects)
+        """
+        query_params = self.get_list_query_params()
+
+        count, lst = await getattr(self.get_entity(), self.entity_list_getter)(query_params)
+        self.timings.rows += len(lst)
+
+        return count, lst
+
+    # get item
+
+    async def get_item_handler(self):
+        with self.timings.phase('query'):
+            obj = await self.get_obj_by_id(field_spec=self.get_selected_fields_for_obj())
+
+        with self.timings.phase('serialize'):
+            data = await run_sync(self.serialize_obj, obj)
+
+        return {
+            'status': 'ok',
+            'data': data
+        }
+
+    # create
+
+    async def create_handler(self):
+        self.mode = 'CREATE'
+
+        # parse request body
+        with self.timings.phase('parse'):
+            json = self.parse_request_body()
+
+        # create object
+        obj = self.create_instance()
+
+        # deserialize
+        deserialized = self.deserialize(json)
+
+        # update object
+        await self.before_create(obj, deserialized)
+        await self.update_obj(obj, deserialized)
+        await self.after_populated(obj, deserialized)
+
+        # save to database
+        await obj.rest_add_async(flush=True)
+        await self.after_create(obj, deserialized)
+
+        return await run_sync(self.create_response, obj)
+
+    async def before_create(self, obj, deserialized):
+        """
+        Can interrupt creation by raising RESTException
+        """
+        pass
+
+    async def after_populated(self, obj, deserialized):
+        pass
+
+    async def after_create(self, obj, deserialized):
+        pass
+
+    # update
+
+    async def update_handler(self):
+        self.mode = 'UPDATE'
+
+        # parse request body
+        with self.timings.phase('parse'):
+            self.request_json = self.parse_request_body()
+
+        # get object by id
+        self.obj = await self.get_obj_by_id_or_create()
+
+        # deserialize
+        self.request_deserialized = self.deserialize(self.request_json)
+
+        # update object
+        await self.before_update(self.obj, self.request_deserialized)
+        await self.update_obj(self.obj, self.request_deserialized)
+        await self.after_populated(self.obj, self.request_deserialized)
+
+        # save to database
+        await self.obj.rest_add_async(flush=True)
+        await self.after_update(self.obj, self.request_deserialized)
+
+        return await run_sync(self.update_response, self.obj)
+
+    # patch
+
+    async def patch_handler(self):
+        self.mode = 'UPDATE'
+        self.partial = True
+
+        # parse request body
+        with self.timings.phase('parse'):
+            self.request_json = self.parse_request_body()
+
+        # deserialize
+        self.request_deserialized = self.deserialize(self.request_json)
+
+        if self.can_patch_without_load(self.request_deserialized):
+            with self.timings.phase('query'):
+                await self.get_entity().rest_update_columns_async(self.get_id_from_request(), self.request_deserialized)
+            return await run_sync(self.update_response, None)
+
+        # get object by id
+        self.obj = await self.get_obj_by_id_or_create()
+
+        # update object
+        await self.before_update(self.obj, self.request_deserialized)
+        await self.update_obj(self.obj, self.request_deserialized)
+        await self.after_populated(self.obj, self.request_deserialized)
+
+        # save to database
+        await self.obj.rest_add_async(flush=True)
+        await self.after_update(self.obj, self.request_deserialized)
+
+        return await run_sync(self.update_response, self.obj)
+
+    def can_patch_without_load(self, deserialized):
+        """
+        see RestDelegate.can_patch_without_load()
+        """
+        if not (self.patch_without_load and deserialized) or self.allow_create_on_update:
+            return False
+
+        if not self.uses_default_getter():
+            return False
+
+        cls = self.__class__
+        if any(getattr(cls, name) is not getattr(AsyncRestDelegate, name) for name in _patch_hooks):
+            return False
+
+        return self.get_entity().rest_can_update_columns(deserialized)
+
+    async def get_obj_by_id_or_create(self):
+        if not self.allow_create_on_update:
+            return await self.get_obj_by_id()
+
+        try:
+            return await self.get_obj_by_id()
+        except:
+            return self.create_instance()
+
+    async def before_update(self, obj, deserialized):
+        """
+        Can interrupt update by raising RESTException
+        """
+        pass
+
+    async def after_update(self, obj, deserialized):
+        pass
+
+    # delete
+
+    async def before_delete(self, obj):
+        """
+        Can interrupt delete by raising RESTException
+        """
+        pass
+
+    async def run_delete_hooks(self, obj):
+        await run_sync(run_hooks_on_delete, obj)
+
+    async def delete_obj(self, obj):
+        await obj.rest_delete_async(flush=True)
+
+    async def after_delete(self):
+        pass
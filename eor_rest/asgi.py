@@ -0,0 +1,386 @@
+# coding: utf-8
+
+import io
+import sys
+
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm.exc import NoResultFound
+
+from pyramid.request import Request
+from pyramid.response import Response
+from pyramid.httpexceptions import HTTPException, HTTPNotFound, HTTPForbidden, HTTPMethodNotAllowed
+from pyramid.path import DottedNameResolver
+
+from .config import Config, request_session
+from .exceptions import *
+from .json import get_json_renderer
+from .timing import RequestTimings, null_timings, stats
+from .aio import AsyncRestDelegate, SyncSession, current_session, run_sync
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class AsyncRestViews(object):
+    """
+    RestViews for AsyncRestDelegate, called by RestASGIApp
+    """
+
+    def __init__(self, request, delegate, route_name, timings):
+        self.request = request
+        self.route_name = route_name
+        self.json = None  # for delegate
+        self.obj = None   # for delegate
+        self.timings = timings
+        self.delegate = delegate(self)
+
+    async def get_list(self):
+        """
+        GET /prefix/{entity}[?qs]
+        """
+
+        log.info('get list %s, %s', self.delegate.name, self._log_user())
+
+        try:
+            return await self.delegate.get_list_handler()
+        except SQLAlchemyError as e:
+            raise RESTException(code='database-error', exc=e)
+
+    async def get_by_id(self):
+        """
+        GET /prefix/{entity}/{id}
+        """
+
+        log.info('get by id %s id %r, %s', self.delegate.name, self.delegate.get_id_from_request(),
+            self._log_user())
+
+        try:
+            return await self.delegate.get_item_handler()
+        except NoResultFound:
+            raise RESTException(code='object-not-found')
+        except SQLAlchemyError as e:
+            raise RESTException(code='database-error', exc=e)
+
+    async def create(self):
+        """
+        POST /prefix/{entity}
+        """
+
+        log.info('create %s, %r', self.delegate.name, self._log_user())
+
+        try:
+            return await self.delegate.create_handler()
+        except SQLAlchemyError as e:
+            raise RESTException(code='database-error', exc=e)
+
+    async def update(self):
+        """
+        PUT /prefix/{entity}/{id}
+        """
+
+        log.info('update %s id %r, %s', self.delegate.name, self.delegate.get_id_from_request(),
+            self._log_user())
+
+        try:
+            return await self.delegate.update_handler()
+        except NoResultFound:
+            raise RESTException(code='object-not-found')
+        except SQLAlchemyError as e:
+            raise RESTException(code='database-error', exc=e)
+
+    async def patch(self):
+        """
+        PATCH /prefix/{entity}/{id}
+        """
+
+        log.info('patch %s id %r, %s', self.delegate.name, self.delegate.get_id_from_request(),
+            self._log_user())
+
+        try:
+            return await self.delegate.patch_handler()
+        except NoResultFound:
+            raise RESTException(code='object-not-found')
+        except SQLAlchemyError as e:
+            raise RESTException(code='database-error', exc=e)
+
+    async def delete(self):
+        """
+        DELETE /prefix/{entity}/{id}
+        """
+
+        log.info('delete %s id %r, %s', self.delegate.name, self.delegate.get_id_from_request(),
+            self._log_user())
+
+        try:
+            obj = self.obj = await self.delegate.get_obj_by_id()
+
+            await self.delegate.before_delete(obj)
+
+            await self.delegate.run_delete_hooks(obj)
+
+            await self.delegate.delete_obj(obj)
+
+            await self.delegate.after_delete()
+
+            return await run_sync(self.delegate.delete_response, obj)
+        except NoResultFound:
+            raise RESTException(code='object-not-found')
+        except SQLAlchemyError as e:
+            raise RESTException(code='database-error', exc=e)
+
+    async def custom_method(self):
+        method = self.route_name.split('.', 4)[3]
+        method = method[len('custom-'):]
+        d = self.delegate.custom_methods[method]
+
+        log.info('custom [%s] %s id %r, %s', method, self.delegate.name,
+            self.request.matchdict.get('id'), self._log_user())
+
+        try:
+            if d['item']:
+                obj = self.obj = await self.delegate.get_obj_by_id()
+                return await getattr(self.delegate, method)(obj)
+            else:
+                return await getattr(self.delegate, method)()
+        except NoResultFound:
+            raise RESTException(code='object-not-found')
+        except SQLAlchemyError as e:
+            raise RESTException(code='database-error', exc=e)
+
+    async def bad_method(self):
+        raise HTTPMethodNotAllowed()
+
+    def _log_user(self):
+        user = getattr(self.request, 'user', None)
+        if user:
+            return user
+        else:
+            return '<no user>'
+
+
+class RestASGIApp(object):
+    """
+    ASGI application serving the AsyncRestDelegate endpoints of a RestAPI at the URLs
+    add_routes() would register; routing works as with add_routes(compact=True).
+
+        api = RestAPI('api')
+        @api.endpoint()
+        class UserEndpoint(AsyncRestDelegate):
+            entity = User  # an AsyncRestMixin
+        app = RestASGIApp(api, {
+            'eor_rest.sqlalchemy_async_session': sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        })
+
+    Each request gets its own AsyncSession, committed after the handler returns and rolled back
+    if it raises; during the request eor_rest.sqlalchemy_session is that session (aio.SyncSession),
+    elsewhere, e.g. in a WSGI app of the same process, it stays as configured. There is no read
+    session routing: eor_rest.sqlalchemy_read_session does not apply to the ASGI app. Errors are
+    answered as by RestViews. There is no CSRF check; route permissions are checked by
+    has_permission(), which denies by default: subclass to authorize, and override make_request()
+    to e.g. set request.user from the headers.
+    """
+
+    def __init__(self, api, settings, url_prefix='/rest'):
+        """
+        :param settings: eor_rest.* settings as for config.include('eor_rest'), kept on the app:
+            the process-wide eor_rest.config.config, e.g. of a WSGI app in the same process, is not
+            changed. eor_rest.sqlalchemy_async_session is required; eor_rest.json_backend and the
+            eor_rest.timing settings apply to the app. Settings read outside of the app, such as
+            eor_rest.file_store and eor_rest.file_delete_threads, stay process-wide.
+        """
+        settings = dict(settings)
+        settings.setdefault('eor_rest.sqlalchemy_session', None)
+        self.config = Config()
+        self.config._from_settings(settings)
+
+        if self.config.sqlalchemy_async_session is None:
+            raise ValueError('RestASGIApp: eor_rest.sqlalchemy_async_session is required')
+
+        if self.config.timing:
+            if self.config.timing_sink:
+                self.config.timing_sink = DottedNameResolver().maybe_resolve(self.config.timing_sink)
+            else:
+                self.config.timing_sink = stats
+
+        for delegate in api.delegates.values():
+            if not issubclass(delegate, AsyncRestDelegate):
+                raise ValueError('RestASGIApp: %r is not an AsyncRestDelegate' % delegate)
+            if delegate.etags or delegate.cache_responses or delegate.stream or delegate.allow_bulk \
+                    or delegate.allow_delete_by_filter:
+                raise ValueError('RestASGIApp: %r: etags, cache_responses, stream, allow_bulk and '
+                    'allow_delete_by_filter are not supported' % delegate)
+
+        self.api = api
+        self.url_prefix = url_prefix.rstrip('/')
+        self.renderer = get_json_renderer(None, self.config.json_backend)
+
+        api.build_entity_metas()
+        api.build_dispatch_table()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+
+        if scope['type'] != 'http':
+            raise ValueError('RestASGIApp: unsupported scope type %r' % scope['type'])
+
+        body = await self._read_body(receive)
+        request = self.make_request(scope, body)
+
+        try:
+            response = await self.handle(request)
+        except HTTPException as e:
+            e.prepare(request.environ)
+            response = e
+
+        await self._send_response(send, response)
+
+    def make_request(self, scope, body):
+        """
+        :return: pyramid Request with a WSGI environ built from the ASGI scope
+        """
+        server = scope.get('server') or ('localhost', 80)
+
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', ''),
+            'PATH_INFO': scope['path'],
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': 'HTTP/%s' % scope.get('http_version', '1.1'),
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+        }
+
+        for name, value in scope.get('headers', ()):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name == 'CONTENT_LENGTH':
+                continue
+            if name != 'CONTENT_TYPE':
+                name = 'HTTP_' + name
+            environ[name] = environ[name] + ',' + value if name in environ else value
+
+        request = Request(environ)
+        request.matchdict = {}
+        return request
+
+    async def has_permission(self, request, permission):
+        """
+        :return: True if the request may use a route with this permission, see RestDelegate.permission
+        """
+        return False
+
+    async def handle(self, request):
+        """
+        :return: pyramid Response
+        """
+        path = request.path_info
+        if not path.startswith(self.url_prefix + '/'):
+            raise HTTPNotFound()
+
+        segments = [el for el in path[len(self.url_prefix) + 1:].split('/') if el]
+        if not segments:
+            raise HTTPNotFound()
+
+        delegate, route_name, attr, permission, id = self.api.lookup(segments[0], segments[1:], request.method)
+
+        if id is not None:
+            request.matchdict['id'] = id
+
+        if permission is not None and not await self.has_permission(request, permission):
+            raise HTTPForbidden()
+
+        timings = null_timings
+        if self.config.timing:
+            timings = RequestTimings()
+            timings.endpoint = route_name
+
+        result = await self._call_view(request, delegate, route_name, attr, timings)
+
+        if not isinstance(result, Response):
+            with timings.phase('render'):
+                body = self.renderer.dumps(result, request)
+            result = Response(body=body, content_type='application/json', charset='utf-8')
+
+        if timings.enabled:
+            timings.finish()
+            if self.config.timing_server_header:
+                result.headers['Server-Timing'] = timings.server_timing()
+            try:
+                self.config.timing_sink(request, timings)
+            except Exception:
+                log.exception('RestASGIApp: timing sink failed')
+
+        return result
+
+    async def _call_view(self, request, delegate, route_name, attr, timings):
+        """
+        Run the view in its own AsyncSession and end the transaction
+
+        :return: view result or error response dict
+        """
+        session = self.config.sqlalchemy_async_session()
+        token = current_session.set(session)
+        session_token = request_session.set(SyncSession(session))
+
+        try:
+            views = AsyncRestViews(request, delegate, route_name, timings)
+
+            try:
+                result = await getattr(views, attr)()
+            except RESTException as e:
+                await session.rollback()
+                return e.response()
+            except:
+                await session.rollback()
+                raise
+
+            try:
+                await session.commit()
+            except SQLAlchemyError as e:
+                await session.rollback()
+                return RESTException(code='database-error', exc=e).response()
+
+            return result
+        finally:
+            request_session.reset(session_token)
+            current_session.reset(token)
+            await session.close()
+
+    async def _read_body(self, receive):
+        chunks = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body', False):
+                break
+
+        return b''.join(chunks)
+
+    async def _send_response(self, send, response):
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_int,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                for name, value in response.headerlist],
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': response.body,
+        })
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
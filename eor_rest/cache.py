@@ -0,0 +1,184 @@
+# coding: utf-8
+
+import time
+import uuid
+import threading
+from collections import OrderedDict
+
+import sqlalchemy
+from sqlalchemy.orm import Session
+
+from .txqueue import TransactionQueue
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class TTLCache(object):
+    """
+    In-process cache of values that expire ttl seconds after being set
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = {}  # key -> (expires, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        try:
+            expires, value = self._entries[key]
+        except KeyError:
+            return default
+
+        if expires < time.monotonic():
+            self._entries.pop(key, None)
+            return default
+
+        return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._evict()
+            self._entries[key] = (time.monotonic() + ttl, value)
+
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _evict(self):
+        now = time.monotonic()
+        expired = [key for key, (expires, value) in self._entries.items() if expires < now]
+
+        for key in expired:
+            del self._entries[key]
+
+        if len(self._entries) >= self.max_entries:
+            # drop the oldest half
+            by_age = sorted(self._entries, key=lambda key: self._entries[key][0])
+            for key in by_age[:len(by_age) // 2]:
+                del self._entries[key]
+
+
+class LRUCache(object):
+    """
+    In-process least recently used cache of bytes values, capped at max_bytes total.
+    Response cache storage backends implement get(key) and set(key, value).
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._entries.move_to_end(key)
+            except KeyError:
+                return default
+            return self._entries[key]
+
+    def set(self, key, value):
+        size = len(value)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+
+            self._entries[key] = value
+            self.size += size
+
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+def entity_key(entity):
+    return '%s.%s' % (entity.__module__, entity.__name__)
+
+
+class ResponseCache(object):
+    """
+    Rendered GET response bodies. Keys include a generation token per entity the response
+    was built from; changing an entity replaces its token, so stale entries are never hit
+    again and age out of the backend.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend if backend is not None else LRUCache()
+
+    def _generation(self, entity):
+        generation_key = ('eor-rest-generation', entity)
+        generation = self.backend.get(generation_key)
+
+        if generation is None:
+            # new entity or token evicted: a fresh token, never a reused one
+            generation = uuid.uuid4().hex.encode('ascii')
+            self.backend.set(generation_key, generation)
+
+        return generation
+
+    def make_key(self, parts, entities):
+        """
+        :param parts: hashable identifying the request
+        :param entities: iterable of entity classes the response depends on
+        """
+        return (parts, tuple(self._generation(entity_key(e)) for e in sorted(entities, key=entity_key)))
+
+    def get(self, key):
+        return self.backend.get(key)
+
+    def set(self, key, body):
+        self.backend.set(key, body)
+
+    def invalidate(self, entity_keys):
+        for key in entity_keys:
+            self.backend.set(('eor-rest-generation', key), uuid.uuid4().hex.encode('ascii'))
+
+
+response_cache = ResponseCache()
+
+
+def mark_changed(session, entity):
+    """
+    Record that rows of entity were changed in session, for statements that bypass
+    the unit of work (Query.update(), Query.delete(), Core statements).
+    Cached responses depending on entity are invalidated when the session commits.
+    """
+    changed.add(session, entity_key(entity))
+
+
+def _before_flush(session, flush_context, instances):
+    for key in {entity_key(obj.__class__) for obj in session.new | session.dirty | session.deleted}:
+        changed.add(session, key)
+
+
+def _after_commit(session, entity_keys):
+    entity_keys = set(entity_keys)
+    log.debug('response cache: invalidating %r', entity_keys)
+    response_cache.invalidate(entity_keys)
+
+
+# entity keys changed in the transaction of a session
+changed = TransactionQueue('eor_rest_changed', _after_commit)
+
+
+def install_invalidation():
+    """
+    Listen to all sessions: entities flushed in a transaction invalidate cached responses once it commits
+    """
+    if not sqlalchemy.event.contains(Session, 'before_flush', _before_flush):
+        sqlalchemy.event.listen(Session, 'before_flush', _before_flush)
+    changed.install()
@@ -1,5 +1,7 @@
 # coding: utf-8
 
+import contextvars
+
 
 def _as_bool(val):
     if type(val) == type(True):
@@ -8,16 +10,66 @@ def _as_bool(val):
     return val.lower() in ('true', '1', 'yes')
 
 
+# session of the current request of asgi.RestASGIApp, see Config.sqlalchemy_session
+request_session = contextvars.ContextVar('eor_rest_request_session', default=None)
+
+
 class Config(object):
 
     def __init__(self):
         self.sqlalchemy_session = None
+        self.sqlalchemy_read_session = None  # scoped_session for get_list / get_by_id, e.g. bound to a replica
+        self.sqlalchemy_async_session = None  # AsyncSession factory for asgi.RestASGIApp
         self.do_csrf_checks = True
+        self.json_backend = 'stdlib'
+        self.response_cache = False
+        self.response_cache_max_bytes = 64 * 1024 * 1024
+        self.response_cache_backend = None
+        self.timing = False
+        self.timing_server_header = False
+        self.timing_sink = None  # dotted name of callable(request, timings); default: timing.stats
+        self.file_store = 'eor_filestore'  # dotted name of an object with delete_by_id(id) [and delete_by_ids(ids)]
+        self.file_delete_threads = 0  # delete files after commit on a thread pool of this size; 0: in the committing thread
+
+    @property
+    def sqlalchemy_session(self):
+        """
+        The configured scoped_session (a sessions.SessionRouter once a read session is set);
+        inside a request of asgi.RestASGIApp, the aio.SyncSession of the request
+        """
+        session = request_session.get()
+        return self._sqlalchemy_session if session is None else session
+
+    @sqlalchemy_session.setter
+    def sqlalchemy_session(self, session):
+        self._sqlalchemy_session = session
 
     def _from_settings(self, settings):
         self.sqlalchemy_session = settings['eor_rest.sqlalchemy_session']
+        if 'eor_rest.sqlalchemy_read_session' in settings:
+            self.sqlalchemy_read_session = settings['eor_rest.sqlalchemy_read_session']
+        if 'eor_rest.sqlalchemy_async_session' in settings:
+            self.sqlalchemy_async_session = settings['eor_rest.sqlalchemy_async_session']
         if 'eor_rest.do_csrf_checks' in settings:
             self.do_csrf_checks = _as_bool(settings['eor_rest.do_csrf_checks'])
+        if 'eor_rest.json_backend' in settings:
+            self.json_backend = settings['eor_rest.json_backend']
+        if 'eor_rest.response_cache' in settings:
+            self.response_cache = _as_bool(settings['eor_rest.response_cache'])
+        if 'eor_rest.response_cache_max_bytes' in settings:
+            self.response_cache_max_bytes = int(settings['eor_rest.response_cache_max_bytes'])
+        if 'eor_rest.response_cache_backend' in settings:
+            self.response_cache_backend = settings['eor_rest.response_cache_backend']
+        if 'eor_rest.timing' in settings:
+            self.timing = _as_bool(settings['eor_rest.timing'])
+        if 'eor_rest.timing_server_header' in settings:
+            self.timing_server_header = _as_bool(settings['eor_rest.timing_server_header'])
+        if 'eor_rest.timing_sink' in settings:
+            self.timing_sink = settings['eor_rest.timing_sink']
+        if 'eor_rest.file_store' in settings:
+            self.file_store = settings['eor_rest.file_store']
+        if 'eor_rest.file_delete_threads' in settings:
+            self.file_delete_threads = int(settings['eor_rest.file_delete_threads'])
 
 
 config = Config()
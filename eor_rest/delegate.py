@@ -3,11 +3,42 @@
 import logging
 log = logging.getLogger(__name__)
 
-from voluptuous import Schema, Required, All, MultipleInvalid, Invalid
+from itertools import islice
+
+from pyramid.response import Response
+from voluptuous import Schema, Required, Optional, Remove, Marker, All, MultipleInvalid, Invalid
 
 from .exceptions import *
-from .serialize import serialize_sqlalchemy_obj, serialize_sqlalchemy_list
+from .serialize import (serialize_sqlalchemy_obj, serialize_sqlalchemy_list, get_projection_keys, serialize_rows,
+    get_field_spec_entities, narrow_field_spec)
 from .deserialize import update_entity_from_appstruct, run_hooks_on_delete
+from .json import get_json_encoder
+from .cache import response_cache
+from .config import config, _as_bool
+from .model import RestMixin
+
+
+# compiled schemas: (delegate class, mode) -> voluptuous Schema
+_schemas = {}
+
+# overriding any of these makes PATCH load the object, see RestDelegate.can_patch_without_load()
+_patch_hooks = ('get_obj_by_id', 'get_obj_by_id_or_create', 'is_access_allowed_for_obj', 'update_obj',
+    'before_update', 'after_populated', 'after_update', 'update_response')
+
+# overriding any of these may scope or hide objects, see RestDelegate.uses_default_getter()
+_getter_hooks = ('get_entity', 'get_obj_by_id')
+_list_getter_hooks = ('get_entity', 'get_obj_list', 'get_list_query_params')
+
+# overriding any of these makes delete-by-filter load and delete objects one by one, see RestDelegate.can_delete_by_query()
+_delete_hooks = ('is_access_allowed_for_obj', 'before_delete', 'run_delete_hooks', 'delete_obj', 'after_delete')
+
+
+def _overrides(cls, base, names):
+    """
+    :return: True if cls overrides any of the methods (or classmethods) names of base
+    """
+    return any(getattr(getattr(cls, name), '__func__', getattr(cls, name))
+        is not getattr(getattr(base, name), '__func__', getattr(base, name)) for name in names)
 
 
 class RestDelegate(object):  #, metaclass=RestDelegateMeta):
@@ -22,11 +53,37 @@ class RestDelegate(object):  #, metaclass=RestDelegateMeta):
     entity_list_getter = 'rest_get_list'
     permission = None
     allow_create_on_update = False
+    cache_schema = False  # build get_schema() once per mode and reuse it; only if it does not read self.obj, self.request etc.
+    patch_without_load = True  # PATCH of plain columns is a single UPDATE unless hooks need the object
+    allow_bulk = False  # register POST/PUT/DELETE {prefix}/{entity}/_bulk
+    bulk_flush_size = None  # flush bulk writes every n objects; None: once
+    allow_delete_by_filter = False  # register DELETE {prefix}/{entity}?fe_foo=1, see delete_by_filter_handler()
+    delete_by_filter_max_rows = 1000  # most rows one delete-by-filter request may delete
+    eager_load = True  # eager load relationships used by get_fields_for_coll() / get_fields_for_obj()
+    loader_strategies = None  # {'author': 'joined', 'books.tags': 'lazy'}, see RestMixin.rest_get_loader_options()
+    projection = False  # select only the columns in get_fields_for_coll() when it has nothing but plain columns
+    max_ids = 1000  # most ids a get_list request may ask for with ids=1,2,3
+    sparse_fields = True  # clients may narrow get_fields_for_coll() / get_fields_for_obj() with fields=id,name,author.name
+    count_strategy = 'exact'  # 'exact', 'none', 'cached' or 'estimated', see RestMixin.rest_get_list()
+    count_cache_ttl = 60  # seconds, for count_strategy 'cached'
+    keyset_pagination = False  # page by opaque cursor (c=) instead of offset (s=), see RestMixin.rest_get_keyset_keys()
+    use_read_session = True  # get_list / get_by_id / read_only custom methods on eor_rest.sqlalchemy_read_session; False: read your writes; off with cache_responses
+    etags = True  # ETag / Last-Modified headers and 304 Not Modified for get_list / get_by_id
+    cache_responses = False  # cache get_list / get_by_id bodies if eor_rest.response_cache is enabled
+    cache_depends_on = ()  # entities read by er_ser_fn callables etc. that get_fields_for_*() do not reveal
+    stream = False  # send get_list responses as a chunked app_iter; the page is still serialized in the view, see stream_list_response()
+    stream_chunk_size = 100  # objects serialized and encoded per chunk
+    stream_yield_per = None  # fetch rows in batches while streaming, so only the encoded page is held
 
     def __init__(self, views):
         self.views = views
         self.request = views.request
         self.method = views.request.method
+        self.timings = views.timings
+        self.mode = None  # 'CREATE' or 'UPDATE', set by the write handlers
+        self.partial = False  # True for PATCH: the request validates against get_partial_schema()
+        self.projection_keys = None  # set by get_obj_list() when a column projection is used
+        self.query_params = None  # set by get_obj_list()
 
     def parse_request_body(self):
         if self.views.request.content_type != 'application/json':
@@ -37,6 +94,92 @@ class RestDelegate(object):  #, metaclass=RestDelegateMeta):
         except ValueError as e:
             raise RequestParseException(e)
 
+    def get_item_version(self):
+        """
+        :return: version of the requested object if the entity declares an er_version column,
+            None to validate by hashing the response body instead
+        """
+        # the version is read without the object: getters that scope or hide objects
+        # and access checks on the object would not run
+        if not self.uses_default_getter() or _overrides(self.__class__, RestDelegate, ['is_access_allowed_for_obj']):
+            return None
+
+        if not self._can_use_version(self.get_selected_fields_for_obj()):
+            return None
+
+        return self.get_entity().rest_get_version(self.get_id_from_request())
+
+    def get_list_version(self):
+        """
+        :return: see RestMixin.rest_get_list_version(), if the entity declares an er_version column,
+            None to validate by hashing the response body instead
+        """
+        # the version covers the rows of rest_get_filtered_query(), not those of custom list getters
+        if not self.uses_default_list_getter() or _overrides(self.__class__, RestDelegate, ['is_access_allowed_for_obj']):
+            return None
+
+        if not self._can_use_version(self.get_selected_fields_for_coll()):
+            return None
+
+        return self.get_entity().rest_get_list_version(self.get_query_params_for_coll())
+
+    @classmethod
+    def uses_default_getter(cls):
+        """
+        :return: True if objects are got by RestMixin.rest_get_by_id(): there is no custom entity_getter
+            and neither the delegate (see _getter_hooks) nor the entity overrides a getter, any of which
+            may scope or hide objects. Reads that bypass the getter (ids=, bulk updates and deletes,
+            version ETags, single UPDATE PATCH) are only allowed then.
+        """
+        return (cls.entity_getter == 'rest_get_by_id'
+            and not _overrides(cls, RestDelegate, _getter_hooks)
+            and not _overrides(cls.entity, RestMixin, ['rest_get_by_id']))
+
+    @classmethod
+    def uses_default_list_getter(cls):
+        """
+        :return: True if lists are got by RestMixin.rest_get_list(), see uses_default_getter(); reads that
+            bypass it (ids=, delete-by-filter, version ETags) are only allowed then
+        """
+        return (cls.entity_list_getter == 'rest_get_list'
+            and not _overrides(cls, RestDelegate, _list_getter_hooks)
+            and not _overrides(cls.entity, RestMixin, ['rest_get_list']))
+
+    def _can_use_version(self, field_spec):
+        """
+        :return: True if the version column covers the response: the entity has one and
+            field_spec serializes no related entities, whose changes would not bump it
+        """
+        entity = self.get_entity()
+        if entity.rest_get_version_key() is None or self.cache_depends_on:
+            return False
+
+        return get_field_spec_entities(entity, field_spec) == {entity}
+
+    def get_cache_scope(self):
+        """
+        Part of the response cache key that separates what different users may see
+        """
+        return self.request.authenticated_userid
+
+    def get_cache_key(self):
+        """
+        :return: response cache key for the current GET request, see cache.ResponseCache
+        """
+        entity = self.get_entity()
+        entities = (get_field_spec_entities(entity, self.get_fields_for_coll())
+            | get_field_spec_entities(entity, self.get_fields_for_obj())
+            | set(self.cache_depends_on))
+
+        parts = (
+            self.views.route_name,
+            self.request.matchdict.get('id'),
+            tuple(sorted(self.request.params.items())),
+            self.get_cache_scope()
+        )
+
+        return response_cache.make_key(parts, entities)
+
     def get_entity(self):
         return self.entity
 
@@ -46,10 +189,19 @@ class RestDelegate(object):  #, metaclass=RestDelegateMeta):
     def get_id_from_obj(self, obj):
         return obj.id
 
-    def get_obj_by_id(self):
+    def get_obj_by_id(self, field_spec=None):
+        """
+        :param field_spec: if given and eager_load is set, relationships used by field_spec are eager loaded;
+            only by RestMixin.rest_get_by_id(), custom getters and overrides are called with the id alone
+        """
         obj_id = self.get_id_from_request()
 
-        obj = getattr(self.get_entity(), self.entity_getter)(obj_id)
+        if (field_spec is not None and self.eager_load and self.entity_getter == 'rest_get_by_id'
+                and not _overrides(self.get_entity(), RestMixin, ['rest_get_by_id'])):
+            obj = getattr(self.get_entity(), self.entity_getter)(
+                obj_id, field_spec=field_spec, loader_strategies=self.loader_strategies)
+        else:
+            obj = getattr(self.get_entity(), self.entity_getter)(obj_id)
 
         # security check
         if not self.is_access_allowed_for_obj(obj, self.request.method):
@@ -65,13 +217,48 @@ class RestDelegate(object):  #, metaclass=RestDelegateMeta):
     def get_schema(self):
         return Schema({}, required=True)
 
+    def get_partial_schema(self):
+        """
+        Schema for PATCH: get_schema() with all top level keys optional and without defaults;
+        get_schema() sees mode 'UPDATE', as for PUT
+        """
+        schema = self.get_schema()
+        if not isinstance(schema.schema, dict):
+            return schema
+
+        partial = {}
+        for key, value in schema.schema.items():
+            if isinstance(key, Remove):
+                partial[key] = value
+            else:
+                partial[Optional(key.schema if isinstance(key, Marker) else key)] = value
+
+        return Schema(partial, required=False, extra=schema.extra)
+
+    def get_cached_schema(self):
+        """
+        :return: get_schema() (get_partial_schema() for PATCH); if cache_schema is set, built once
+            per delegate class and mode
+        """
+        if not self.cache_schema:
+            return self._build_schema()
+
+        key = (self.__class__, self.mode, self.partial)
+        schema = _schemas.get(key)
+        if schema is None:
+            schema = _schemas[key] = self._build_schema()
+
+        return schema
+
+    def _build_schema(self):
+        return self.get_partial_schema() if self.partial else self.get_schema()
+
     def deserialize(self, serialized):
         try:
-            return self.get_schema()(serialized)
+            with self.timings.phase('validate'):
+                return self.get_cached_schema()(serialized)
         except MultipleInvalid as e:
-            print('\n', str(e), '\n', e.errors, '\n', e.errors[0].path, '\n', e.errors[0].error_message, '\n')
-            from pprint import pprint
-            print('pprint:', pprint(e), '\n')
+            log.debug('%s: validation failed: %s', self.__class__.__name__, e)
             raise ValidationException(e)
 
     def update_obj(self, obj, deserialized):
@@ -83,17 +270,199 @@ class RestDelegate(object):  #, metaclass=RestDelegateMeta):
     # get list
 
     def get_list_handler(self):
+        ids = self.get_requested_ids()
+        if ids is not None:
+            return self.get_by_ids_handler(ids)
+
         count, lst = self.get_obj_list()
 
-        return {
+        if self.stream:
+            return self.stream_list_response(count, lst)
+
+        has_more = None
+        if self.count_strategy == 'none' and 'limit' in self.query_params:
+            # count strategy 'none' fetches limit + 1 objects
+            has_more = len(lst) > self.query_params['limit']
+            lst = lst[:self.query_params['limit']]
+
+        with self.timings.phase('serialize'):
+            data = self.serialize_coll(lst)
+
+        resp = {
             'status': 'ok',
             'count': count,
-            'data': self.serialize_coll(lst)
+            'data': data
+        }
+
+        resp.update(self.get_list_extras(len(lst), lst[-1] if lst else None, has_more))
+
+        return resp
+
+    def get_requested_ids(self):
+        """
+        :return: list of distinct ids from the ids=1,2,3 request parameter in request order, None if absent
+        """
+        param = self.request.params.get('ids')
+        if param is None:
+            return None
+
+        ids = list(dict.fromkeys(id.strip() for id in param.split(',') if id.strip()))
+        if len(ids) > self.max_ids:
+            raise RESTException(code='too-many-ids', msg='at most %d ids' % self.max_ids)
+
+        return ids
+
+    def get_by_ids_handler(self, ids):
+        """
+        GET /prefix/{entity}?ids=1,2,3: the objects in the order of ids, fetched by one query and
+        serialized like a list; ids not found or not accessible are returned in 'missing'.
+        Other list parameters (filters, order, paging) are ignored. Not available with custom
+        getters, which the ids query would bypass, see uses_default_getter().
+        """
+        if not (self.uses_default_getter() and self.uses_default_list_getter()):
+            raise RESTException(code='ids-not-supported', msg='ids= needs the default entity getters')
+
+        appstruct = [{'id': id} for id in ids]
+
+        with self.timings.phase('query'):
+            if self.eager_load and not _overrides(self.get_entity(), RestMixin, ['rest_get_by_ids']):
+                objs = self.get_entity().rest_get_by_ids(appstruct,
+                    field_spec=self.get_selected_fields_for_coll(), loader_strategies=self.loader_strategies)
+            else:
+                objs = self.get_entity().rest_get_by_ids(appstruct)
+
+        objs_by_id = {str(self.get_id_from_obj(obj)): obj for obj in objs}
+
+        found = []
+        missing = []
+        for id in ids:
+            obj = objs_by_id.get(id)
+            if obj is None or not self.is_access_allowed_for_obj(obj, self.request.method):
+                missing.append(id)
+            else:
+                found.append(obj)
+
+        self.timings.rows += len(found)
+
+        with self.timings.phase('serialize'):
+            data = self.serialize_coll(found)
+
+        return {
+            'status': 'ok',
+            'count': len(found),
+            'data': data,
+            'missing': missing
         }
 
+    def get_list_extras(self, page_len, last_obj, has_more):
+        """
+        :return: dict of fields following 'data' in get_list responses
+        """
+        extras = {}
+
+        if self.count_strategy == 'none':
+            extras['has_more'] = bool(has_more)
+
+        if self.keyset_pagination:
+            extras['cursor'] = self.get_next_cursor(page_len, last_obj, has_more)
+
+        return extras
+
+    def get_next_cursor(self, page_len, last_obj, has_more=None):
+        """
+        :return: cursor for the page following the one ending with last_obj, None if there is none
+        """
+        if has_more is None:
+            has_more = page_len >= self.query_params.get('limit', page_len + 1)
+
+        if last_obj is None or not has_more:
+            return None
+
+        return self.get_entity().rest_get_cursor(last_obj, self.query_params)
+
+    def stream_list_response(self, count, lst):
+        """
+        Same body as get_list_handler() renders, but sent stream_chunk_size objects at a time.
+        Objects are serialized before the view returns, as the transaction may end (and expire them)
+        before the app_iter runs; each chunk is encoded to bytes as soon as it is serialized, so that
+        its dicts can be dropped.
+
+        Memory use is not flat: the encoded chunks of the whole page are held until the response is
+        sent. What streaming saves is the serialized dicts of the page, the response body is never
+        joined in full, and with stream_yield_per the ORM objects, which are serialized as they are
+        fetched.
+        """
+        encode = get_json_encoder(self.request)
+        separator = encode([0, 0])[2:-2]  # b', ' or b',' depending on the encoder backend
+
+        limit = None
+        if self.count_strategy == 'none' and 'limit' in self.query_params:
+            # count strategy 'none' fetches limit + 1 objects
+            limit = self.query_params['limit']
+
+        chunks = []
+        page_len = 0
+        last_obj = None
+        it = iter(lst)
+        while True:
+            chunk_size = self.stream_chunk_size if limit is None else min(self.stream_chunk_size, limit - page_len)
+            chunk = list(islice(it, chunk_size))
+            if not chunk:
+                break
+
+            chunks.append(separator.join(encode(el) for el in self.serialize_coll(chunk)))
+            page_len += len(chunk)
+            last_obj = chunk[-1]
+
+        has_more = None
+        if limit is not None:
+            has_more = next(it, None) is not None
+
+        extras = self.get_list_extras(page_len, last_obj, has_more)
+
+        def app_iter():
+            # '{"status": "ok", "count": N, "data": ['
+            head = encode({'status': 'ok', 'count': count, 'data': []})
+            yield head[:head.rindex(b'[') + 1]
+
+            for n, encoded in enumerate(chunks):
+                yield encoded if not n else separator + encoded
+
+            if extras:
+                yield b']' + separator + encode(extras)[1:]
+            else:
+                yield b']}'
+
+        return Response(content_type='application/json', charset='utf-8', app_iter=app_iter())
+
     def get_fields_for_coll(self):
         return {'*': True}
 
+    def get_requested_fields(self):
+        """
+        :return: the fields= request parameter, None if absent or sparse_fields is off
+        """
+        if not self.sparse_fields:
+            return None
+
+        return self.request.params.get('fields', '').strip() or None
+
+    def _select_fields(self, field_spec):
+        fields = self.get_requested_fields()
+        if fields is None:
+            return field_spec
+
+        try:
+            return narrow_field_spec(self.get_entity(), field_spec, fields)
+        except ValueError as e:
+            raise RESTException(code='bad-fields', msg=str(e))
+
+    def get_selected_fields_for_coll(self):
+        """
+        :return: get_fields_for_coll() narrowed to the fields the client selected
+        """
+        return self._select_fields(self.get_fields_for_coll())
+
     def get_query_params_for_coll(self):
         request_params = self.views.request.params
         query_params = {}
@@ -121,6 +490,14 @@ class RestDelegate(object):  #, metaclass=RestDelegateMeta):
                 'dir': 'desc' if order.startswith('-') else 'asc'
             }
 
+        # cursor
+
+        cursor = request_params.get('c', '').strip()
+        if self.keyset_pagination:
+            query_params['keyset'] = True
+            if cursor:
+                query_params['cursor'] = cursor
+
         # search
 
         search = request_params.get('q', '').strip()
@@ -131,7 +508,7 @@ class RestDelegate(object):  #, metaclass=RestDelegateMeta):
 
         filters = dict()
         for param, val in request_params.items():
-            if param.startswith('f'):
+            if param.startswith('f') and param != 'fields':
                 filters[param[1:]] = val
 
         if filters:
@@ -145,29 +522,104 @@ class RestDelegate(object):  #, metaclass=RestDelegateMeta):
         """
         :return: (total_count, list_of_objects)
         """
-        query_params = self.get_query_params_for_coll()
+        query_params = self.get_list_query_params()
 
         # returns (count, objs)
-        return getattr(self.get_entity(), self.entity_list_getter)(query_params)
+        count, lst = getattr(self.get_entity(), self.entity_list_getter)(query_params)
+
+        if isinstance(lst, list):
+            self.timings.rows += len(lst)
+
+        return count, lst
+
+    def get_list_query_params(self):
+        """
+        :return: query_params for entity_list_getter: get_query_params_for_coll() with the field spec,
+            projection and count options of this delegate; also sets self.query_params
+        """
+        query_params = self.get_query_params_for_coll()
+
+        field_spec = self.get_selected_fields_for_coll()
+
+        if self.projection:
+            self.projection_keys = get_projection_keys(self.get_entity(), field_spec)
+
+        if self.stream and self.stream_yield_per:
+            # eager loading of collections does not combine with yield_per
+            query_params['yield_per'] = self.stream_yield_per
+
+        if self.projection_keys is not None:
+            projection = self.projection_keys
+            if self.keyset_pagination:
+                # the cursor is read from projected rows; extra trailing columns are not serialized
+                projection = projection + [key for key in self.get_entity().rest_get_keyset_keys(query_params)
+                    if key not in projection]
+            query_params['projection'] = projection
+        elif self.eager_load and 'yield_per' not in query_params:
+            query_params['field_spec'] = field_spec
+            if self.get_requested_fields() is not None:
+                query_params['load_only'] = True
+            if self.loader_strategies:
+                query_params['loader_strategies'] = self.loader_strategies
+
+        if self.count_strategy != 'exact':
+            query_params['count'] = self.count_strategy
+            if self.count_strategy == 'cached':
+                query_params['count_cache_key'] = self.get_count_cache_key(query_params)
+                query_params['count_ttl'] = self.count_cache_ttl
+
+        if self.timings.enabled:
+            query_params['timings'] = self.timings
+
+        self.query_params = query_params
+
+        return query_params
+
+    def get_count_cache_key(self, query_params):
+        """
+        Key for cached counts: everything the count query depends on. The route name
+        includes the API name: delegates of the same name in two APIs do not share counts.
+        Override if get_entity() / _rest_get_inner_query() depend on more than
+        filters and search, e.g. on the current user.
+        """
+        return (
+            self.views.route_name,
+            self.get_entity(),
+            query_params.get('search'),
+            tuple(sorted(query_params.get('filters', {}).items()))
+        )
 
     def serialize_coll(self, lst):
-        return serialize_sqlalchemy_list(lst, field_spec=self.get_fields_for_coll())
+        if self.projection_keys is not None:
+            return serialize_rows(lst, self.projection_keys)
+
+        return serialize_sqlalchemy_list(lst, field_spec=self.get_selected_fields_for_coll())
 
     # get item
 
     def get_item_handler(self):
-        obj = self.get_obj_by_id()
+        with self.timings.phase('query'):
+            obj = self.get_obj_by_id(field_spec=self.get_selected_fields_for_obj())
+
+        with self.timings.phase('serialize'):
+            data = self.serialize_obj(obj)
 
         return {
             'status': 'ok',
-            'data': self.serialize_obj(obj)
+            'data': data
         }
 
     def get_fields_for_obj(self):
         return {'*': True}
 
+    def get_selected_fields_for_obj(self):
+        """
+        :return: get_fields_for_obj() narrowed to the fields the client selected
+        """
+        return self._select_fields(self.get_fields_for_obj())
+
     def serialize_obj(self, obj):
-        return serialize_sqlalchemy_obj(obj, field_spec=self.get_fields_for_obj())
+        return serialize_sqlalchemy_obj(obj, field_spec=self.get_selected_fields_for_obj())
 
     # create
 
@@ -175,7 +627,8 @@ class RestDelegate(object):  #, metaclass=RestDelegateMeta):
         self.mode = 'CREATE'
 
         # parse request body
-        json = self.parse_request_body()
+        with self.timings.phase('parse'):
+            json = self.parse_request_body()
 
         # check existing
         # TODO no ID in request; some objects may have ID in request data, need get_id_from_deserialized()
@@ -234,7 +687,8 @@ class RestDelegate(object):  #, metaclass=RestDelegateMeta):
         self.mode = 'UPDATE'
 
         # parse request body
-        self.request_json = self.parse_request_body()
+        with self.timings.phase('parse'):
+            self.request_json = self.parse_request_body()
 
         # get object by id
         self.obj = self.get_obj_by_id_or_create()
@@ -253,6 +707,55 @@ class RestDelegate(object):  #, metaclass=RestDelegateMeta):
 
         return self.update_response(self.obj)
 
+    # patch
+
+    def patch_handler(self):
+        self.mode = 'UPDATE'
+        self.partial = True
+
+        # parse request body
+        with self.timings.phase('parse'):
+            self.request_json = self.parse_request_body()
+
+        # deserialize
+        self.request_deserialized = self.deserialize(self.request_json)
+
+        if self.can_patch_without_load(self.request_deserialized):
+            with self.timings.phase('query'):
+                self.get_entity().rest_update_columns(self.get_id_from_request(), self.request_deserialized)
+            return self.update_response(None)
+
+        # get object by id
+        self.obj = self.get_obj_by_id_or_create()
+
+        # update object
+        self.before_update(self.obj, self.request_deserialized)
+        self.update_obj(self.obj, self.request_deserialized)
+        self.after_populated(self.obj, self.request_deserialized)
+
+        # save to database
+        self.obj.rest_add(flush=True)
+        self.after_update(self.obj, self.request_deserialized)
+
+        return self.update_response(self.obj)
+
+    def can_patch_without_load(self, deserialized):
+        """
+        :return: True if deserialized can be written with a single UPDATE: only plain columns change
+            and no hook (see _patch_hooks) needs the object
+        """
+        if not (self.patch_without_load and deserialized) or self.allow_create_on_update:
+            return False
+
+        if not self.uses_default_getter():
+            return False
+
+        cls = self.__class__
+        if any(getattr(cls, name) is not getattr(RestDelegate, name) for name in _patch_hooks):
+            return False
+
+        return self.get_entity().rest_can_update_columns(deserialized)
+
     def get_obj_by_id_or_create(self):
         if not self.allow_create_on_update:
             return self.get_obj_by_id()
@@ -288,8 +791,255 @@ class RestDelegate(object):  #, metaclass=RestDelegateMeta):
     def delete_obj(self, obj):
         obj.rest_delete(flush=True)
 
+    def delete_obj_unflushed(self, obj):
+        """
+        delete_obj() for deletes of many objects that flush once, see flush_bulk();
+        calls delete_obj() if a subclass overrides it
+        """
+        if self.__class__.delete_obj is not RestDelegate.delete_obj:
+            self.delete_obj(obj)
+        else:
+            obj.rest_delete()
+
     def after_delete(self):
         pass
 
     def delete_response(self, obj):
-        return {'status': 'ok'}
\ No newline at end of file
+        return {'status': 'ok'}
+
+    # delete by filter
+
+    def delete_by_filter_handler(self):
+        """
+        DELETE /prefix/{entity}?fe_foo=1&q=bar: delete the objects selected by the filters and search
+        of get_query_params_for_coll(), at least one is required; other list parameters are ignored.
+        dry_run=1 only counts them. More than delete_by_filter_max_rows objects is an error.
+        Objects are deleted by a single statement if can_delete_by_query(), otherwise loaded and
+        deleted one by one with the per-object hooks. Only for delegates with the default list
+        getters (uses_default_list_getter()): the filtered query does not apply custom scoping.
+        """
+        query_params = {key: val for key, val in self.get_query_params_for_coll().items()
+            if key in ('filters', 'search')}
+
+        if not query_params:
+            raise RESTException(code='no-filter', msg='delete by filter needs filters or q')
+
+        if self.timings.enabled:
+            query_params['timings'] = self.timings
+
+        dry_run = _as_bool(self.request.params.get('dry_run', False))
+        max_rows = self.delete_by_filter_max_rows
+
+        if self.can_delete_by_query():
+            count = self.get_entity().rest_delete_by_query(query_params, max_rows=max_rows, dry_run=dry_run)
+        else:
+            query = self.get_entity().rest_get_filtered_query(config.sqlalchemy_session, query_params)
+
+            if dry_run:
+                with self.timings.phase('count'):
+                    count = query.count()
+            else:
+                count = self.delete_objs(query, max_rows)
+
+        return {
+            'status': 'ok',
+            'count': count,
+            'dry_run': dry_run
+        }
+
+    def can_delete_by_query(self):
+        """
+        :return: True if delete_by_filter_handler() can delete with a single statement:
+            no hook (see _delete_hooks) needs the objects
+        """
+        cls = self.__class__
+        if any(getattr(cls, name) is not getattr(RestDelegate, name) for name in _delete_hooks):
+            return False
+
+        return self.get_entity().rest_can_delete_by_query()
+
+    def delete_objs(self, query, max_rows):
+        """
+        Delete the objects of query one by one, as bulk delete does
+
+        :return: number of deleted objects
+        """
+        with self.timings.phase('query'):
+            objs = query.limit(max_rows + 1).all() if max_rows is not None else query.all()
+
+        if max_rows is not None and len(objs) > max_rows:
+            raise RESTException(code='too-many-rows', msg='at most %d rows' % max_rows)
+
+        for obj in objs:
+            if not self.is_access_allowed_for_obj(obj, self.request.method):
+                raise RESTException(code='forbidden')
+
+        for obj in objs:
+            self.before_delete(obj)
+
+        for obj in objs:
+            self.run_delete_hooks(obj)
+
+        self.flush_bulk(objs, self.delete_obj_unflushed)
+
+        for obj in objs:
+            self.after_delete()
+
+        return len(objs)
+
+    # bulk
+
+    def parse_bulk_request_body(self):
+        with self.timings.phase('parse'):
+            json = self.parse_request_body()
+
+        if not isinstance(json, list):
+            raise RequestParseException()
+
+        return json
+
+    def deserialize_bulk(self, items, objs=None):
+        """
+        Validate all items before anything is written
+
+        :param objs: for updates, the object of each item: self.obj while the item is validated
+        :return: list of deserialized items
+        """
+        deserialized = []
+        errors = {}
+
+        for index, item in enumerate(items):
+            if objs is not None:
+                self.obj = objs[index]
+            try:
+                deserialized.append(self.deserialize(item))
+            except ValidationException as e:
+                errors[index] = e.exc
+
+        if errors:
+            raise BulkValidationException(errors)
+
+        return deserialized
+
+    def get_objs_by_ids(self, ids):
+        """
+        Fetch with RestMixin.rest_get_by_ids(), allow_bulk needs the default entity getters
+        (see RestAPI.endpoint())
+
+        :return: list of objects in the order of ids; raises BulkValidationException
+            for missing objects or objects is_access_allowed_for_obj() rejects
+        """
+        objs = self.get_entity().rest_get_by_ids([{'id': id} for id in ids])
+        objs_by_id = {str(self.get_id_from_obj(obj)): obj for obj in objs}
+
+        errors = {}
+        result = []
+        for index, id in enumerate(ids):
+            obj = objs_by_id.get(str(id))
+            if obj is None:
+                errors[index] = 'object-not-found'
+            elif not self.is_access_allowed_for_obj(obj, self.request.method):
+                errors[index] = 'forbidden'
+            result.append(obj)
+
+        if errors:
+            raise BulkValidationException(errors)
+
+        return result
+
+    def flush_bulk(self, objs, write):
+        """
+        :param write: function obj -> None, e.g. adds obj to the session
+        """
+        for index, obj in enumerate(objs, 1):
+            write(obj)
+            if self.bulk_flush_size and index % self.bulk_flush_size == 0:
+                config.sqlalchemy_session().flush()
+
+        config.sqlalchemy_session().flush()
+
+    def bulk_create_handler(self):
+        """
+        request: list of objects as for create
+        """
+        self.mode = 'CREATE'
+
+        deserialized = self.deserialize_bulk(self.parse_bulk_request_body())
+
+        objs = []
+        with config.sqlalchemy_session().no_autoflush:
+            for item in deserialized:
+                obj = self.create_instance()
+                self.before_create(obj, item)
+                self.update_obj(obj, item)
+                self.after_populated(obj, item)
+                objs.append(obj)
+
+        self.flush_bulk(objs, lambda obj: obj.rest_add())
+
+        for obj, item in zip(objs, deserialized):
+            self.after_create(obj, item)
+
+        return {
+            'status': 'ok',
+            'results': [self.create_response(obj) for obj in objs]
+        }
+
+    def bulk_update_handler(self):
+        """
+        request: list of objects as for update, each with 'id'
+        """
+        self.mode = 'UPDATE'
+
+        items = self.parse_bulk_request_body()
+
+        try:
+            ids = [item.pop('id') for item in items]
+        except (KeyError, TypeError, AttributeError) as e:
+            raise RequestParseException(e)
+
+        objs = self.get_objs_by_ids(ids)
+        deserialized = self.deserialize_bulk(items, objs)
+
+        # self.obj is the object at hand, as in update_handler()
+        with config.sqlalchemy_session().no_autoflush:
+            for obj, item in zip(objs, deserialized):
+                self.obj = obj
+                self.before_update(obj, item)
+                self.update_obj(obj, item)
+                self.after_populated(obj, item)
+
+        self.flush_bulk(objs, lambda obj: obj.rest_add())
+
+        results = []
+        for obj, item in zip(objs, deserialized):
+            self.obj = obj
+            self.after_update(obj, item)
+            results.append(self.update_response(obj))
+
+        return {
+            'status': 'ok',
+            'results': results
+        }
+
+    def bulk_delete_handler(self):
+        """
+        request: list of ids
+        """
+        objs = self.get_objs_by_ids(self.parse_bulk_request_body())
+
+        for obj in objs:
+            self.before_delete(obj)
+
+        for obj in objs:
+            self.run_delete_hooks(obj)
+
+        self.flush_bulk(objs, self.delete_obj_unflushed)
+
+        for obj in objs:
+            self.after_delete()
+
+        return {
+            'status': 'ok',
+            'results': [self.delete_response(obj) for obj in objs]
+        }
@@ -4,16 +4,23 @@ import logging
 log = logging.getLogger(__name__)
 
 import sqlalchemy
-from sqlalchemy.orm.properties import ColumnProperty, RelationshipProperty
 from sqlalchemy.ext.associationproxy import _AssociationCollection
 from sqlalchemy.orm.interfaces import ONETOMANY, MANYTOONE, MANYTOMANY
 
 from .config import config
+from .cache import mark_changed
+from .files import delete_file_on_commit
+from .meta import get_entity_meta
 
 
 def update_one_to_many(containing_obj, key, appstruct):
     """
-    Update a collection attribute.
+    Update a collection attribute: children returned by target_entity.rest_get_related() for the IDs
+    in appstruct are updated, others are created, children missing from appstruct are removed.
+    Unchanged values are not assigned, so the flush only writes the children that changed.
+    Unless the collection is already loaded, it is not loaded: new children get the foreign key
+    of containing_obj and the removed ones are deleted (delete-orphan cascade) or unlinked
+    with one statement, see _remove_children().
 
     :param containing_obj: sqlalchemy entity object
     :param key: string, such that getattr(containing_obj, key) returns the collection attribute
@@ -21,44 +28,114 @@ def update_one_to_many(containing_obj, key, appstruct):
     :return: nothing
     """
 
-    mapper = sqlalchemy.inspect(containing_obj.__class__)
-    prop = getattr(mapper.attrs, key)
+    prop = get_entity_meta(containing_obj.__class__).relationships[key]
     target_entity = prop.mapper.class_
 
     target_id_attr = 'id'
 
     appstructs_by_id = {el[target_id_attr]: el for el in appstruct if target_id_attr in el}
 
-    objs_to_keep = target_entity.rest_get_related(appstructs_by_id.keys(), containing_obj, key)
+    objs_to_keep = target_entity.rest_get_related(list(appstructs_by_id), containing_obj, key) \
+        if appstructs_by_id else []
     objs_to_keep_by_id = {getattr(obj, target_id_attr): obj for obj in objs_to_keep}
 
     # update existing objects
-    for obj in objs_to_keep:
-        update_entity(obj, appstructs_by_id[getattr(obj, target_id_attr)])
+    for id, obj in objs_to_keep_by_id.items():
+        if id in appstructs_by_id:
+            update_entity(obj, appstructs_by_id[id])
 
     # create new objects
+    new_objs = []
     for el in appstruct:
         if target_id_attr in el and el[target_id_attr] in objs_to_keep_by_id:
             continue
 
-        new_obj = target_entity()
-        update_entity(new_obj, el)
-        objs_to_keep.append(new_obj)
+        obj = target_entity()
+        update_entity(obj, el)
+        new_objs.append(obj)
 
-    setattr(containing_obj, key, objs_to_keep)
+    fk_keys = _get_fk_keys(prop)
+    state = sqlalchemy.inspect(containing_obj)
+
+    if key in state.dict or not state.persistent or fk_keys is None:
+        # in memory: collection loaded, containing_obj not in the database yet, or no simple foreign key
+        setattr(containing_obj, key, objs_to_keep + new_objs)
+        return
+
+    _remove_children(containing_obj, prop, [getattr(obj, target_id_attr) for obj in objs_to_keep], fk_keys)
+
+    session = state.session
+    for obj in objs_to_keep + new_objs:
+        for parent_key, child_key in fk_keys:
+            if getattr(obj, child_key) != getattr(containing_obj, parent_key):
+                setattr(obj, child_key, getattr(containing_obj, parent_key))
+        session.add(obj)
+
+
+def _get_fk_keys(prop):
+    """
+    :return: [(containing_obj attribute key, child attribute key)] for the foreign key of a one-to-many
+        relationship, None if a column is not mapped
+    """
+    keys = []
+    for parent_col, child_col in prop.local_remote_pairs:
+        try:
+            keys.append((prop.parent.get_property_by_column(parent_col).key,
+                prop.mapper.get_property_by_column(child_col).key))
+        except sqlalchemy.orm.exc.UnmappedColumnError:
+            return None
+
+    return keys
+
+
+def _remove_children(containing_obj, prop, kept_ids, fk_keys):
+    """
+    Remove the children of containing_obj (not loaded) other than kept_ids as the collection
+    would on flush: delete them if the relationship cascades delete-orphan, otherwise set their
+    foreign key to NULL. One DELETE or UPDATE; the removed children are only loaded if deleting
+    them needs the unit of work (cascades, relationships other than many to one without
+    passive_deletes, delete listeners, inheritance, version counters), so that the ORM deletes them
+    """
+    target_entity = prop.mapper.class_
+    session = sqlalchemy.inspect(containing_obj).session
+
+    query = session.query(target_entity).with_parent(containing_obj, prop.key)
+    if kept_ids:
+        query = query.filter(~target_entity.id.in_(kept_ids))
+
+    if not prop.cascade.delete_orphan:
+        query.update({child_key: None for parent_key, child_key in fk_keys}, synchronize_session=False)
+        mark_changed(session, target_entity)
+        return
+
+    mapper = prop.mapper
+    if any(r.cascade.delete or (r.direction is not MANYTOONE and not r.passive_deletes) for r in mapper.relationships) \
+            or mapper.dispatch.before_delete or mapper.dispatch.after_delete \
+            or mapper.inherits is not None or mapper.version_id_col is not None:
+        for obj in query:
+            run_hooks_on_delete(obj)
+            session.delete(obj)
+        return
+
+    file_keys = get_entity_meta(target_entity).file_keys
+    if file_keys:
+        for row in query.with_entities(*[getattr(target_entity, k) for k in file_keys]):
+            for file_id in row:
+                if file_id:
+                    delete_file_on_commit(file_id, session)
+
+    query.delete(synchronize_session=False)
+    mark_changed(session, target_entity)
 
 
 def update_many_to_many(containing_obj, key, appstruct):
     """
     :param containing_obj:
     :param key:
-    :param appstruct: list of IDs, like [1, 2, 3]
+    :param appstruct: list of dicts with IDs, like [{'id': 1}, {'id': 2}], or list of IDs, like [1, 2, 3]
     :return:
     """
-    entity = containing_obj.__class__
-    mapper = sqlalchemy.inspect(entity)
-    prop = getattr(mapper.attrs, key)  # RelationshipProperty
-    target_entity = prop.mapper.class_
+    target_entity = get_entity_meta(containing_obj.__class__).relationships[key].mapper.class_
 
     objs_to_keep = target_entity.rest_get_by_ids(appstruct)
     setattr(containing_obj, key, objs_to_keep)
@@ -66,51 +143,24 @@ def update_many_to_many(containing_obj, key, appstruct):
 
 def update_entity(obj, appstruct):
     obj_name = obj.__class__.__name__
-    mapper = sqlalchemy.inspect(obj.__class__)
+    meta = get_entity_meta(obj.__class__)
 
     for key, val in appstruct.items():
-        try:
+        if key in meta.column_key_set:
             obj_attr = getattr(obj, key)
-        except AttributeError:
-            log.warn('attribute not present in object, skipped: %s.%s', obj_name, key)
-            continue
 
-        prop = mapper.attrs.get(key)  # does not exist for association proxies
+            if obj_attr == val:
+                continue  # unchanged, keep the object clean
 
-        if isinstance(prop, ColumnProperty):
-            info = mapper.all_orm_descriptors[key].info
-
-            # print(
-            #     key,
-            #     'PROP:', prop, type(prop),
-            #     'ATTR:', obj_attr, type(obj_attr),
-            #     'CLASS ATTR:',  getattr(obj.__class__, key), type(getattr(obj.__class__, key)),
-            #     'DESCRIPTOR:', mapper.all_orm_descriptors[key],
-            #     'INFO:', info
-            # )
-
-            if 'efs_category' in info and obj_attr and obj_attr != val:
-                log.debug('deleting file id %s', obj_attr)
-                from eor_filestore import delete_by_id
-                delete_by_id(obj_attr)
+            if key in meta.file_key_set and obj_attr:
+                delete_file_on_commit(obj_attr)
 
             setattr(obj, key, val)
-        elif isinstance(obj_attr, _AssociationCollection):
-            # gdt AssociationProxy: getattr(obj.__class__, key)
-            log.debug('updating association proxy: %s.%s', obj_name, key)
-
-            if 'efs_category' in info:
-                from eor_filestore import delete_by_id
-
-                new_files = frozenset(val)
+            continue
 
-                for old_file in obj_attr:
-                    if old_file and old_file not in new_files:
-                        log.debug('deleting file id %s', old_file)
-                        delete_by_id(old_file)
+        prop = meta.relationships.get(key)
 
-            setattr(obj, key, val)
-        elif isinstance(prop, RelationshipProperty):
+        if prop is not None:
             if not prop.uselist:
                 log.warn('relationship property %s.%s: uselist==False not yet supported', obj_name, key, prop.direction)
                 continue
@@ -122,8 +172,28 @@ def update_entity(obj, appstruct):
                 update_many_to_many(obj, key, val)
             else:
                 log.warn('updating relationship property %s.%s: direction %r not yet supported', obj_name, key, prop.direction)
+            continue
+
+        try:
+            obj_attr = getattr(obj, key)
+        except AttributeError:
+            log.warn('attribute not present in object, skipped: %s.%s', obj_name, key)
+            continue
+
+        if isinstance(obj_attr, _AssociationCollection):
+            # gdt AssociationProxy: getattr(obj.__class__, key)
+            log.debug('updating association proxy: %s.%s', obj_name, key)
+
+            if key in meta.file_proxies:
+                new_files = frozenset(val)
+
+                for old_file in obj_attr:
+                    if old_file and old_file not in new_files:
+                        delete_file_on_commit(old_file)
+
+            setattr(obj, key, val)
         else:
-            log.warn('unknown property type, skipped: %s.%s [%s]', obj_name, key, prop)
+            log.warn('unknown property type, skipped: %s.%s', obj_name, key)
 
 
 def update_entity_from_appstruct(obj, appstruct):
@@ -132,14 +202,9 @@ def update_entity_from_appstruct(obj, appstruct):
 
 
 def run_hooks_on_delete(obj):
-    from eor_filestore import delete_by_id
-
-    mapper = sqlalchemy.inspect(obj.__class__)
-
-    for k in mapper.attrs.keys():
+    # only the file attributes are read, other attributes and relationships stay unloaded
+    for k in get_entity_meta(obj.__class__).file_keys:
         obj_attr = getattr(obj, k)
-        info = mapper.all_orm_descriptors[k].info
 
-        if 'efs_category' in info and obj_attr:
-            log.debug('deleting file id %s', obj_attr)
-            delete_by_id(obj_attr)
+        if obj_attr:
+            delete_file_on_commit(obj_attr)
@@ -67,17 +67,45 @@ class ValidationException(RESTException):
 
     def response(self):
         resp = super().response()
+        resp['errors'] = self.errors_dict(self.exc)
+        return resp
 
+    @staticmethod
+    def errors_dict(invalid):
         errors = {}
-        for exc in self.exc.errors:
+        for exc in invalid.errors:
+            # markers like Required('name') for missing keys -> 'name'
+            path = [el if isinstance(el, (str, int)) else str(el) for el in exc.path]
+
             d = errors
-            for el in exc.path[:-1]:
+            for el in path[:-1]:
                 if not el in d:
                     d[el] = {}
                 d = d[el]
 
-            d[exc.path[-1]] = exc.error_message
+            d[path[-1]] = exc.error_message
+
+        return errors
+
+
+class BulkValidationException(RESTException):
+    """
+    Validation errors of bulk requests, by item index
+    """
+
+    def __init__(self, excs):
+        """
+        :param excs: dict index -> MultipleInvalid or error code string
+        """
+        super().__init__(code='invalid')
+        self.excs = excs
+
+    def response(self):
+        resp = super().response()
 
-        resp['errors'] = errors
+        resp['errors'] = {
+            index: exc if isinstance(exc, str) else ValidationException.errors_dict(exc)
+            for index, exc in self.excs.items()
+        }
 
         return resp
@@ -0,0 +1,104 @@
+# coding: utf-8
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from pyramid.path import DottedNameResolver
+
+from .config import config
+from .txqueue import TransactionQueue
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class LocalFileStore(object):
+    """
+    In-process stand-in for eor_filestore, for tests:
+    eor_rest.file_store = eor_rest.files.local_file_store
+    """
+
+    def __init__(self):
+        self.files = {}  # id -> data
+        self.deleted = []
+        self._lock = threading.Lock()
+
+    def add(self, id, data=b''):
+        with self._lock:
+            self.files[id] = data
+
+    def delete_by_ids(self, ids):
+        with self._lock:
+            for id in ids:
+                self.files.pop(id, None)
+                self.deleted.append(id)
+
+    def delete_by_id(self, id):
+        self.delete_by_ids([id])
+
+
+local_file_store = LocalFileStore()
+
+
+_store = None
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_file_store():
+    """
+    :return: object with delete_by_id(id) and optionally delete_by_ids(ids), see eor_rest.file_store
+    """
+    global _store
+    if _store is None:
+        store = config.file_store
+        _store = DottedNameResolver().maybe_resolve(store) if isinstance(store, str) else store
+
+    return _store
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(config.file_delete_threads, thread_name_prefix='eor-rest-files')
+
+    return _executor
+
+
+def delete_files(file_ids):
+    """
+    delete files from the file store now, in one batch if it supports delete_by_ids()
+    """
+    store = get_file_store()
+
+    try:
+        if hasattr(store, 'delete_by_ids'):
+            store.delete_by_ids(file_ids)
+        else:
+            for file_id in file_ids:
+                store.delete_by_id(file_id)
+    except Exception:
+        log.exception('deleting files %r failed', file_ids)
+
+
+def delete_file_on_commit(file_id, session=None):
+    """
+    Queue a file for deletion once the current transaction of session commits;
+    a rollback discards the queue, a rolled back savepoint the files queued inside it.
+    """
+    if session is None:
+        session = config.sqlalchemy_session()
+
+    log.debug('deleting file id %s after commit', file_id)
+    _pending.add(session, file_id)
+
+
+def _after_commit(session, file_ids):
+    if config.file_delete_threads:
+        _get_executor().submit(delete_files, file_ids)
+    else:
+        delete_files(file_ids)
+
+
+_pending = TransactionQueue('eor_rest_files', _after_commit)
@@ -7,9 +7,18 @@ import uuid
 import tzlocal
 
 from pyramid.renderers import JSON
+from pyramid.interfaces import IRendererFactory
 
+from . import config as config_module
 
-def configure_renderer(json):
+import logging
+log = logging.getLogger(__name__)
+
+
+def _get_adapters():
+    """
+    :return: list of (type, adapter(obj, request)) shared by all backends
+    """
     utc = datetime.timezone.utc
     local = tzlocal.get_localzone()
 
@@ -23,16 +32,125 @@ def configure_renderer(json):
             .isoformat()
             .replace('+00:00', 'Z'))
 
-    json.add_adapter(datetime.date, datetime_adapter)
-    json.add_adapter(datetime.datetime, datetime_adapter)
-    json.add_adapter(decimal.Decimal, lambda val, request: float(val))
-    json.add_adapter(uuid.UUID, lambda val, request: str(val))
+    return [
+        (datetime.date, datetime_adapter),
+        (datetime.datetime, datetime_adapter),
+        (decimal.Decimal, lambda val, request: float(val)),
+        (uuid.UUID, lambda val, request: str(val)),
+    ]
+
+
+def configure_renderer(json):
+    for type_, adapter in _get_adapters():
+        json.add_adapter(type_, adapter)
 
 
-def get_json_renderer(config):
+class StdlibJSON(JSON):
     """
-    http://docs.pylonsproject.org/projects/pyramid/en/latest/narr/renderers.html#json-renderer
+    pyramid JSON renderer (json.dumps)
     """
-    json = JSON(ensure_ascii=False)
+
+    def dumps(self, value, request):
+        """
+        :return: value encoded exactly like the rendered response body, as bytes
+        """
+        return self.serializer(value, default=self._make_default(request), **self.kw).encode('utf-8')
+
+
+class OrjsonJSON(object):
+    """
+    JSON renderer using orjson. Dates and datetimes are passed through to the same
+    adapters as with the stdlib backend, so values are encoded identically.
+    """
+
+    def __init__(self):
+        import orjson
+        self.orjson = orjson
+        self.option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        self.adapters = dict(_get_adapters())
+
+    def __call__(self, info):
+        def _render(value, system):
+            request = system.get('request')
+            if request is not None:
+                response = request.response
+                if response.content_type == response.default_content_type:
+                    response.content_type = 'application/json'
+
+            return self.dumps(value, request)
+
+        return _render
+
+    def _make_default(self, request):
+        adapters = self.adapters
+
+        def default(obj):
+            if hasattr(obj, '__json__'):
+                return obj.__json__(request)
+
+            for cls in obj.__class__.__mro__:
+                adapter = adapters.get(cls)
+                if adapter is not None:
+                    return adapter(obj, request)
+
+            raise TypeError('%r is not JSON serializable' % (obj,))
+
+        return default
+
+    def dumps(self, value, request):
+        return self.orjson.dumps(value, default=self._make_default(request), option=self.option)
+
+
+def _get_orjson_renderer():
+    return OrjsonJSON()
+
+
+def _get_stdlib_renderer():
+    json = StdlibJSON(ensure_ascii=False)
     configure_renderer(json)
     return json
+
+
+# eor_rest.json_backend setting -> renderer factory
+backends = {
+    'stdlib': _get_stdlib_renderer,
+    'orjson': _get_orjson_renderer,
+}
+
+
+def get_json_renderer(config, backend=None):
+    """
+    http://docs.pylonsproject.org/projects/pyramid/en/latest/narr/renderers.html#json-renderer
+
+    Backend is selected by the eor_rest.json_backend setting; falls back to stdlib
+    if the selected encoder is not installed.
+
+    :param backend: backend name instead of the eor_rest.json_backend setting
+    """
+    if backend is None:
+        backend = config_module.config.json_backend
+
+    try:
+        factory = backends[backend]
+    except KeyError:
+        raise ValueError('eor_rest.json_backend: unknown backend %r, expected one of %r' % (
+            backend, sorted(backends)))
+
+    try:
+        return factory()
+    except ImportError as e:
+        log.warning('eor_rest.json_backend %r not available (%s), using stdlib', backend, e)
+        return _get_stdlib_renderer()
+
+
+def get_json_encoder(request):
+    """
+    :return: function value -> bytes encoding like the eor-rest-json renderer,
+        for use outside of the renderer, e.g. in streamed responses
+    """
+    renderer = request.registry.getUtility(IRendererFactory, name='eor-rest-json')
+
+    def encode(value):
+        return renderer.dumps(value, request)
+
+    return encode
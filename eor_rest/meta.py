@@ -0,0 +1,58 @@
+# coding: utf-8
+
+import sqlalchemy
+from sqlalchemy.ext.associationproxy import ASSOCIATION_PROXY
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class EntityMeta(object):
+    """
+    What serialize, deserialize and the delete hooks need to know about an entity,
+    read from its mapper once
+    """
+
+    def __init__(self, entity):
+        mapper = sqlalchemy.inspect(entity)
+
+        self.entity = entity
+        self.column_keys = [p.key for p in mapper.column_attrs]  # mapper order, for '*'
+        self.column_key_set = frozenset(self.column_keys)
+        self.relationships = {p.key: p for p in mapper.relationships}  # key -> RelationshipProperty
+
+        self.serialize_defaults = {}  # key -> er_serialize
+        self.ser_fns = {}  # key -> er_ser_fn
+        self.file_keys = []  # mapped attributes with efs_category
+
+        for key in mapper.attrs.keys():
+            info = mapper.all_orm_descriptors[key].info
+            if 'er_serialize' in info:
+                self.serialize_defaults[key] = info['er_serialize']
+            if 'er_ser_fn' in info:
+                self.ser_fns[key] = info['er_ser_fn']
+            if 'efs_category' in info:
+                self.file_keys.append(key)
+
+        self.file_key_set = frozenset(self.file_keys)
+
+        self.association_proxies = {}  # key -> key of the target collection relationship
+        self.file_proxies = set()  # association proxies with efs_category
+
+        for key, descriptor in mapper.all_orm_descriptors.items():
+            if descriptor.extension_type is ASSOCIATION_PROXY:
+                self.association_proxies[key] = descriptor.target_collection
+                if 'efs_category' in descriptor.info:
+                    self.file_proxies.add(key)
+
+
+# entity -> EntityMeta
+_metas = {}
+
+
+def get_entity_meta(entity):
+    try:
+        return _metas[entity]
+    except KeyError:
+        meta = _metas[entity] = EntityMeta(entity)
+        return meta
@@ -3,21 +3,311 @@
 import logging
 log = logging.getLogger(__name__)
 
+import base64
+import datetime
+import decimal
+import difflib
+import json
+import uuid
+
 import sqlalchemy
-from sqlalchemy.sql import and_, or_, desc
-from sqlalchemy.sql.expression import func
+from sqlalchemy.sql import and_, or_, desc, tuple_
+from sqlalchemy.sql.expression import func, Executable, ClauseElement
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm.exc import NoResultFound
+from sqlalchemy.orm.interfaces import MANYTOONE
 from sqlalchemy.orm.relationships import RelationshipProperty
 from sqlalchemy.orm.properties import  ColumnProperty
 
-from .config import config
+from .config import config, _as_bool
+from .cache import TTLCache, mark_changed
+from .exceptions import RESTException
+from .serialize import resolve_field_spec, freeze_field_spec
+from .search import LikeSearch, like_search
+from .timing import null_timings
+from .meta import get_entity_meta
+from .files import delete_file_on_commit
+
+
+# loader strategy name -> sqlalchemy.orm loader option
+_loader_strategies = {
+    'lazy': 'defaultload',
+    'joined': 'joinedload',
+    'selectin': 'selectinload',
+    'subquery': 'subqueryload',
+}
+
+# (entity, frozen field_spec, frozen loader_strategies, load_only) -> list of loader options
+_loader_options = {}
+_max_loader_options = 4096
+
+# dialects whose DELETE supports RETURNING in this sqlalchemy version
+_returning_dialects = frozenset(['postgresql', 'mssql'])
+
+
+def _column_keys(entity, field_spec):
+    """
+    :return: keys of the columns serializing entity with field_spec reads,
+        None if it may read any attribute (callables, association proxies)
+    """
+    mapper = sqlalchemy.inspect(entity)
+    keys = []
+
+    for key, control in resolve_field_spec(entity, field_spec).items():
+        if key == '*' or control is False or isinstance(control, dict):
+            continue
+        if key not in mapper.column_attrs:
+            return None
+        keys.append(key)
+
+    return keys
+
+
+def _relationship_options(entity, field_spec, strategies, load_only=False, parent=None, path=''):
+    """
+    :param load_only: also defer the columns of related entities that field_spec does not read
+    :param parent: loader option for the relationship containing entity, or None
+    :param path: dotted path of entity relative to the queried entity, '' for the queried entity
+    :return: list of loader options for relationships touched by the field_spec
+    """
+    mapper = sqlalchemy.inspect(entity)
+    options = []
+
+    for key, control in resolve_field_spec(entity, field_spec).items():
+        narrow = load_only
+        if control is True:
+            # association proxies are serialized by reading their target collection
+            descriptor = mapper.all_orm_descriptors.get(key)
+            target_collection = getattr(descriptor, 'target_collection', None)
+            if target_collection is None:
+                continue
+            key, control, narrow = target_collection, {}, False
+        elif not isinstance(control, dict):
+            continue
+
+        prop = mapper.attrs.get(key)
+        if not isinstance(prop, RelationshipProperty):
+            continue
+
+        rel_path = path + '.' + key if path else key
+        default = 'selectin' if prop.uselist else 'joined'
+        loader = _loader_strategies[strategies.get(rel_path, default)]
+
+        attr = getattr(entity, key)
+        option = getattr(sqlalchemy.orm if parent is None else parent, loader)(attr)
+
+        column_keys = _column_keys(prop.mapper.class_, control) if narrow else None
+        options.append(option if column_keys is None else option.load_only(*column_keys))
+        options.extend(_relationship_options(prop.mapper.class_, control, strategies, load_only, option, rel_path))
+
+    return options
+
+
+# cached counts for query_params['count'] == 'cached'
+count_cache = TTLCache()
+
+
+class _Explain(Executable, ClauseElement):
+    """
+    EXPLAIN (FORMAT JSON) statement; the statement and its bind parameters are compiled as usual
+    """
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(_Explain, 'postgresql')
+def _compile_explain(element, compiler, **kw):
+    return 'EXPLAIN (FORMAT JSON) ' + compiler.process(element.statement, **kw)
+
+
+def _postgresql_estimate_count(connection, query):
+    plan = connection.execute(_Explain(query.statement)).scalar()
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+# dialect name -> function(connection, query) returning the planner's row estimate for query;
+# dialects not listed here fall back to an exact count
+count_estimators = {
+    'postgresql': _postgresql_estimate_count,
+}
+
+
+# entity -> key of the er_version column or None
+_version_keys = {}
+
+
+def _parse_datetime(val):
+    # fromisoformat() accepts the UTC suffix Z only since python 3.11
+    if val[-1:] in ('Z', 'z'):
+        val = val[:-1] + '+00:00'
+    return datetime.datetime.fromisoformat(val)
+
+
+# python type of a column -> parser of its str() representation, for keyset cursors and filters
+_value_parsers = {
+    int: int,
+    float: float,
+    bool: _as_bool,
+    datetime.datetime: _parse_datetime,
+    datetime.date: datetime.date.fromisoformat,
+    datetime.time: datetime.time.fromisoformat,
+    decimal.Decimal: decimal.Decimal,
+    uuid.UUID: uuid.UUID,
+}
+
+
+def _get_value_parser(column_attr):
+    """
+    :return: function str -> value of the column type, None if values need no conversion
+    """
+    try:
+        return _value_parsers.get(column_attr.type.python_type)
+    except NotImplementedError:
+        return None
+
+
+def _parse_key_value(column_attr, val):
+    if val is None:
+        return None
+
+    parser = _get_value_parser(column_attr)
+    return parser(val) if parser and isinstance(val, str) else val
+
+
+# filter op -> (function(field, value) -> clause, how the request value is converted:
+#   'value': to the column type, 'list': comma separated list of the column type, 'bool', 'raw': not at all)
+_filter_ops = {
+    'e':    (lambda field, val: field == val, 'value'),
+    'ne':   (lambda field, val: field != val, 'value'),
+    'n':    (lambda field, val: or_(field == val, field == None), 'value'),
+    'gt':   (lambda field, val: field > val, 'value'),
+    'gte':  (lambda field, val: field >= val, 'value'),
+    'lt':   (lambda field, val: field < val, 'value'),
+    'lte':  (lambda field, val: field <= val, 'value'),
+    'in':   (lambda field, val: field.in_(val), 'list'),
+    'null': (lambda field, val: field == None if val else field != None, 'bool'),
+    'l':    (lambda field, val: func.lower(field).like('%' + val.lower() + '%'), 'raw'),
+    's':    (lambda field, val: func.lower(field).like(val.lower() + '%'), 'raw'),
+}
+
+
+class _FilterField(object):
+    """
+    Entry of a filter index: a filterable column, possibly of a related entity
+    """
+
+    def __init__(self, column_attr, relationships):
+        """
+        :param relationships: list of relationship attributes leading from the filtered entity to column_attr
+        """
+        self.column_attr = column_attr
+        self.parse = _get_value_parser(column_attr) or (lambda val: val)
+        self.relationships = relationships
+
+    def convert(self, val, conversion):
+        if conversion == 'raw':
+            return val
+        elif conversion == 'bool':
+            return _as_bool(val)
+        elif conversion == 'list':
+            return [self.parse(el) for el in val.split(',')]
+        else:
+            return self.parse(val)
+
+    def clause(self, op, val):
+        clause = op(self.column_attr, val)
+
+        # filter on related columns: EXISTS subqueries, the filtered query is not joined
+        for rel in reversed(self.relationships):
+            clause = rel.any(clause) if rel.property.uselist else rel.has(clause)
+
+        return clause
+
+
+def _build_filter_index(entity):
+    mapper = sqlalchemy.inspect(entity)
+    index = {}
+
+    for prop in mapper.column_attrs:
+        index[prop.key] = _FilterField(getattr(entity, prop.key), [])
+
+    for name in getattr(entity, '_rest_filter_related', ()):
+        # 'author.name'
+        path = name.split('.')
+        relationships = []
+        target = entity
+
+        for el in path[:-1]:
+            rel = getattr(target, el)
+            if not isinstance(rel.property, RelationshipProperty):
+                raise ValueError('%s._rest_filter_related: %r: %s is not a relationship' % (entity.__name__, name, el))
+            relationships.append(rel)
+            target = rel.property.mapper.class_
+
+        column_attr = getattr(target, path[-1])
+        if not isinstance(column_attr.property, ColumnProperty):
+            raise ValueError('%s._rest_filter_related: %r: %s is not a column' % (entity.__name__, name, path[-1]))
+
+        index[name] = _FilterField(column_attr, relationships)
+
+    filterable = getattr(entity, '_rest_filter_columns', None)
+    if filterable is not None:
+        filterable = set(filterable) | set(getattr(entity, '_rest_filter_related', ()))
+        index = {name: field for name, field in index.items() if name in filterable}
+
+    return index
+
+
+# entity -> {field name: _FilterField}
+_filter_indexes = {}
 
 
 class RestMixin(object):
 
     @classmethod
-    def rest_get_by_id(cls, id):
-        obj = config.sqlalchemy_session().query(cls).get(id)
+    def rest_get_loader_options(cls, field_spec, loader_strategies=None, load_only=False):
+        """
+        Eager loading options for the relationships that serializing with field_spec touches,
+        so that nested field_specs do not issue one SELECT per object per relationship.
+
+        :param field_spec: field_spec as passed to serialize_sqlalchemy_obj()
+        :param loader_strategies: dict: dotted relationship path -> 'selectin' | 'joined' | 'subquery' | 'lazy',
+            example: {'books': 'joined', 'books.tags': 'lazy'}; default is 'selectin' for collections
+            and 'joined' for scalar relationships
+        :param load_only: defer the columns field_spec does not read, for narrow (client selected) field_specs
+        :return: list of loader options
+        """
+        strategies = loader_strategies or {}
+        key = (cls, freeze_field_spec(field_spec), tuple(sorted(strategies.items())), load_only)
+
+        try:
+            return _loader_options[key]
+        except KeyError:
+            pass
+
+        options = _relationship_options(cls, field_spec, strategies, load_only)
+
+        if load_only:
+            column_keys = _column_keys(cls, field_spec)
+            if column_keys is not None:
+                options.append(sqlalchemy.orm.load_only(*column_keys))
+
+        if len(_loader_options) >= _max_loader_options:
+            _loader_options.clear()
+        _loader_options[key] = options
+
+        return options
+
+    @classmethod
+    def rest_get_by_id(cls, id, field_spec=None, loader_strategies=None):
+        query = config.sqlalchemy_session().query(cls)
+
+        if field_spec is not None:
+            query = query.options(*cls.rest_get_loader_options(field_spec, loader_strategies))
+
+        obj = query.get(id)
 
         if obj is None:
             raise NoResultFound
@@ -25,10 +315,101 @@ class RestMixin(object):
         return obj
 
     @classmethod
-    def rest_get_by_ids(cls, appstruct):
-        ids = [el['id'] for el in appstruct]
+    def rest_get_version_key(cls):
+        """
+        :return: key of the column declared with info={'er_version': True} (a version counter
+            or an updated_at timestamp changed on every update), None if there is none
+        """
+        try:
+            return _version_keys[cls]
+        except KeyError:
+            pass
+
+        mapper = sqlalchemy.inspect(cls)
+
+        key = None
+        for prop in mapper.column_attrs:
+            if mapper.all_orm_descriptors[prop.key].info.get('er_version'):
+                key = prop.key
+                break
 
+        _version_keys[cls] = key
+        return key
+
+    @classmethod
+    def rest_get_version(cls, id):
+        """
+        :return: value of the version column of object id, without loading the object
+        """
+        version_attr = getattr(cls, cls.rest_get_version_key())
+        pk = sqlalchemy.inspect(cls).primary_key[0]
+
+        return (config.sqlalchemy_session().query(version_attr)
+            .filter(pk == id)
+            .one())[0]
+
+    @classmethod
+    def rest_get_list_version(cls, query_params):
+        """
+        :return: (count, max version) of the objects selected by query_params search and filters;
+            for a version counter also the sum of versions: bumping any row changes the sum, the max
+            only changes for the row that already had it; for a numeric primary key also the sum of
+            ids: deleting a row and inserting another with the same version changes it
+        """
+        version_attr = getattr(cls, cls.rest_get_version_key())
+        query = cls.rest_get_filtered_query(config.sqlalchemy_session, query_params)
+
+        numeric = (sqlalchemy.Integer, sqlalchemy.Numeric)
+
+        aggregates = [func.count(), func.max(version_attr)]
+        if isinstance(version_attr.property.columns[0].type, numeric):
+            aggregates.append(func.sum(version_attr))
+
+        primary_key = sqlalchemy.inspect(cls).primary_key
+        if len(primary_key) == 1 and isinstance(primary_key[0].type, numeric):
+            aggregates.append(func.sum(primary_key[0]))
+
+        return tuple(query
+            .with_entities(*aggregates)
+            .order_by(None)
+            .one())
+
+    @classmethod
+    def rest_get_by_ids(cls, appstruct, field_spec=None, loader_strategies=None):
+        """
+        One IN query for all ids; objects come in no particular order, missing ids are left out.
+
+        :param appstruct: list of dicts with an 'id' key or list of ids; str ids are converted to
+            the column type, ids that do not convert match nothing
+        :param field_spec: if given, relationships used by field_spec are eager loaded
+        """
+        ids = []
+        for el in appstruct:
+            try:
+                ids.append(_parse_key_value(cls.id, el['id'] if isinstance(el, dict) else el))
+            except (ValueError, TypeError, ArithmeticError):
+                pass
+
+        query = config.sqlalchemy_session().query(cls)
+
+        if field_spec is not None:
+            query = query.options(*cls.rest_get_loader_options(field_spec, loader_strategies))
+
+        return (query
+            .filter(cls.id.in_(ids))
+            .all())
+
+    @classmethod
+    def rest_get_related(cls, ids, containing_obj, key):
+        """
+        Children of containing_obj to keep when its one-to-many collection key is updated, see
+        deserialize.update_one_to_many(); override to scope or filter them
+
+        :param ids: ids of the children in the request
+        :return: list of objects
+        """
         return (config.sqlalchemy_session().query(cls)
+            .with_parent(containing_obj, key)
             .filter(cls.id.in_(ids))
             .all())
 
@@ -41,65 +422,186 @@ class RestMixin(object):
         return query
 
     @classmethod
-    def rest_get_list(cls, query_params):
+    def rest_get_keyset_keys(cls, query_params):
         """
-        cls._rest_search_columns = [cls.name, cls.description] - list of columns for search filtering
-        :param start: number (default 0)
-        :param limit: number or None
-        :param order: {col: '', dir: 'asc|desc'} or None
-        :param search:
-        :param filters:
-        :param query: sqlalchemy query
-        :return: result of an executed query
+        Attribute keys that keyset pagination orders and seeks by: the order column
+        (own columns only), followed by the primary key as a tiebreaker.
+        Rows with NULL in the order column cannot be paged through by cursor.
         """
+        mapper = sqlalchemy.inspect(cls)
+        keys = [mapper.get_property_by_column(col).key for col in mapper.primary_key]
 
-        def apply_search(query):
-            search_columns = getattr(cls, '_rest_search_columns', None)
-            if not search_columns or not 'search' in query_params:
-                return query
+        order = query_params.get('order')
+        if order and order['col'] not in keys:
+            if isinstance(mapper.attrs.get(order['col']), ColumnProperty):
+                keys.insert(0, order['col'])
+            else:
+                log.error('rest_get_list(): keyset order key %s: not a column of %s, ordering by primary key',
+                    order['col'], cls.__name__)
+
+        return keys
+
+    @classmethod
+    def rest_get_cursor(cls, obj, query_params):
+        """
+        :param obj: last object (or projection row) of a page
+        :return: opaque cursor to pass as query_params['cursor'] for the next page
+        """
+        order = query_params.get('order') or {'col': '', 'dir': 'asc'}
+        values = [getattr(obj, key) for key in cls.rest_get_keyset_keys(query_params)]
 
-            search = query_params['search'].lower()
+        data = json.dumps([order['col'], order['dir'], values], default=str, separators=(',', ':'))
+        return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
 
-            if len(search_columns) == 1:
-                col = search_columns[0]
-                search_filter = func.lower(col).like('%' + search + '%')
-            else:  # > 1
-                clauses = [func.lower(col).like('%' + search + '%') for col in search_columns]
-                search_filter = or_(*clauses)
+    @classmethod
+    def _rest_parse_cursor(cls, cursor, query_params, keys):
+        order = query_params.get('order') or {'col': '', 'dir': 'asc'}
+
+        try:
+            data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            order_col, order_dir, values = json.loads(data.decode('utf-8'))
+            if [order_col, order_dir] != [order['col'], order['dir']] or len(values) != len(keys):
+                raise ValueError('cursor does not match ordering')
+            return [_parse_key_value(getattr(cls, key), val) for key, val in zip(keys, values)]
+        except (ValueError, TypeError) as e:
+            raise RESTException(code='bad-cursor', exc=e)
 
-            return query.filter(search_filter)
+    @classmethod
+    def _rest_estimate_count(cls, session, query, query_params):
+        """
+        :return: estimated number of rows returned by query, or None if no estimate is available
+        """
+        connection = session().connection()
+        estimator = count_estimators.get(connection.dialect.name)
+        if estimator is None:
+            return None
+
+        # a failed statement aborts the transaction on postgresql: keep it usable for the exact count
+        try:
+            with session().begin_nested():
+                return estimator(session().connection(), query)
+        except sqlalchemy.exc.SQLAlchemyError:
+            log.exception('_rest_estimate_count(): %s: estimate failed, counting', cls.__name__)
+            return None
 
-        def apply_filters(query):
-            if 'filters' not in query_params:
-                return query
+    @classmethod
+    def rest_get_search_backend(cls):
+        """
+        cls._rest_search_backend = search.SQLiteFTS5Search() etc., default: search.LikeSearch
+        """
+        return getattr(cls, '_rest_search_backend', None) or like_search
 
-            filters = query_params['filters']
+    @classmethod
+    def _rest_apply_search(cls, query, query_params):
+        search_columns = getattr(cls, '_rest_search_columns', None)
+        if not search_columns or not 'search' in query_params:
+            return query
 
-            for key, val in filters.items():
-                op, field_name = key.split('_', 1)
+        search_filter = cls.rest_get_search_backend().filter(cls, search_columns, query_params['search'])
+        return query.filter(search_filter)
 
-                try:
-                    field = getattr(cls, field_name)
-                except AttributeError:
-                    log.warn('RestMixin.rest_get_list(): filter "%s=%s": unknown attribute %s',
-                             key, val, field_name)
-                    continue
-
-                if op == 'e':
-                    query = query.filter(field == val)
-                elif op == 'n':
-                    query = query.filter(or_(field == val, field == None))
-                elif op == 'l':
-                    query = query.filter(func.lower(field).like('%' + val.lower() + '%'))
-                elif op == 's':
-                    query = query.filter(func.lower(field).like(val.lower() + '%'))
-                else:
-                    log.error('get_for_rest_grid: filter "%s=%s": unknown op: %s' % (key, val, op))
+    @classmethod
+    def rest_get_filter_index(cls):
+        """
+        Filterable fields, built once per entity: own columns, restricted to
+        cls._rest_filter_columns = ['name', ...] if present, and related columns
+        listed in cls._rest_filter_related = ['author.name', ...]
 
+        :return: dict field name -> _FilterField
+        """
+        try:
+            return _filter_indexes[cls]
+        except KeyError:
+            index = _filter_indexes[cls] = _build_filter_index(cls)
+            return index
+
+    @classmethod
+    def _rest_apply_filters(cls, query, query_params):
+        """
+        filters: {'<op>_<field>': value}, op is one of e, ne, n, gt, gte, lt, lte, in, null, l, s;
+        keys of another shape (other request params starting with f) are ignored, unknown fields
+        and ops close to a known op on known fields rejected
+        """
+        if 'filters' not in query_params:
             return query
 
+        index = cls.rest_get_filter_index()
+
+        for key, val in query_params['filters'].items():
+            op_name, sep, field_name = key.partition('_')
+
+            if not sep or op_name not in _filter_ops:
+                # a mistyped op (fge_rating), not a request param that merely ends in a field name (first_name)
+                if sep and field_name in index and difflib.get_close_matches(op_name, _filter_ops, cutoff=0.6):
+                    raise RESTException(code='bad-filter', msg='unknown filter operator %s' % key)
+                log.debug('rest_get_list(): %s: not a filter, ignored', key)
+                continue
+
+            op, conversion = _filter_ops[op_name]
+
+            try:
+                field = index[field_name]
+            except KeyError:
+                raise RESTException(code='bad-filter', msg='unknown filter %s' % key)
+
+            try:
+                val = field.convert(val, conversion)
+            except (ValueError, TypeError, ArithmeticError):
+                raise RESTException(code='bad-filter', msg='bad value for filter %s' % key)
+
+            query = query.filter(field.clause(op, val))
+
+        return query
+
+    @classmethod
+    def rest_get_filtered_query(cls, session, query_params):
+        """
+        :return: query for the objects selected by query_params search and filters, without order and limit
+        """
+        query = session().query(cls)
+        query = cls._rest_get_inner_query(session, query, query_params)
+        query = cls._rest_apply_search(query, query_params)
+        query = cls._rest_apply_filters(query, query_params)
+        return query
+
+    @classmethod
+    def rest_get_list(cls, query_params):
+        """
+        cls._rest_search_columns = [cls.name, cls.description] - list of columns for search filtering
+        :param start: number (default 0)
+        :param limit: number or None
+        :param order: {col: '', dir: 'asc|desc'} or None
+        :param search:
+        :param filters:
+        :param field_spec: if present, relationships used by the field_spec are eager loaded
+        :param loader_strategies: see rest_get_loader_options()
+        :param load_only: bool, see rest_get_loader_options()
+        :param projection: list of column keys; if present, result rows of these columns are returned
+            instead of entity objects
+        :param keyset: if True, order by rest_get_keyset_keys() and page by cursor instead of start
+        :param cursor: cursor from rest_get_cursor() for the last object of the previous page
+        :param count: 'exact' (default), 'none': count is None and limit + 1 objects are returned
+            so that the caller can tell whether there are more, 'cached': exact count cached
+            for count_ttl seconds under count_cache_key, 'estimated': planner estimate if
+            _rest_estimate_count() provides one, otherwise exact
+        :param count_cache_key: hashable, must cover everything the count depends on
+        :param count_ttl: seconds
+        :param timings: timing.RequestTimings, records the count and query phases
+        :param yield_per: number; if present, an unexecuted query fetching rows in batches of this size
+            is returned instead of a list
+        :param query: sqlalchemy query
+        :return: result of an executed query
+        """
+
         def apply_order(query):
+            if keyset_keys:
+                direction = desc if query_params.get('order', {}).get('dir') == 'desc' else (lambda col: col)
+                return query.order_by(*[direction(getattr(cls, key)) for key in keyset_keys])
+
             if 'order' not in query_params:
+                if 'search' in query_params and getattr(cls, '_rest_search_columns', None):
+                    return cls.rest_get_search_backend().order_by_relevance(
+                        query, cls, cls._rest_search_columns, query_params['search'])
                 return query
 
             order = query_params['order']
@@ -131,39 +633,230 @@ class RestMixin(object):
             return query.order_by(desc(order_attr) if order['dir'] == 'desc' else order_attr)
 
         def apply_limit(query):
-            if 'limit' in query_params:
-                query = query.limit(query_params['limit'])
-
-            if 'start' in query_params:
+            if keyset_keys and 'cursor' in query_params:
+                # seek: WHERE (col, id) > (:col, :id)
+                values = cls._rest_parse_cursor(query_params['cursor'], query_params, keyset_keys)
+                columns = tuple_(*[getattr(cls, key) for key in keyset_keys])
+                if query_params.get('order', {}).get('dir') == 'desc':
+                    query = query.filter(columns < tuple_(*values))
+                else:
+                    query = query.filter(columns > tuple_(*values))
+            elif 'start' in query_params:
                 query = query.offset(query_params['start'])
 
+            if 'limit' in query_params:
+                limit = query_params['limit']
+                query = query.limit(limit + 1 if count_strategy == 'none' else limit)
+
             return query
 
+        def get_count(query):
+            if count_strategy == 'none':
+                return None
+
+            if count_strategy == 'estimated':
+                estimate = cls._rest_estimate_count(session, query, query_params)
+                if estimate is not None:
+                    return estimate
+            elif count_strategy == 'cached':
+                key = query_params['count_cache_key']
+                count = count_cache.get(key)
+                if count is None:
+                    count = count_cache.set(key, query.count(), query_params.get('count_ttl', 60))
+                return count
+
+            return query.count()
+
+        count_strategy = query_params.get('count', 'exact')
+
+        keyset_keys = cls.rest_get_keyset_keys(query_params) if query_params.get('keyset') else None
+
         # select * from (select * from users limit 10 offset 10) as u left join files f on u.id = f.user_id
         # http://docs.sqlalchemy.org/en/rel_1_0/orm/tutorial.html#using-subqueries
 
         session = config.sqlalchemy_session
 
-        q_inner = session().query(cls)
-        q_inner = cls._rest_get_inner_query(session, q_inner, query_params)
-        q_inner = apply_search(q_inner)
-        q_inner = apply_filters(q_inner)
+        q_inner = cls.rest_get_filtered_query(session, query_params)
         q_count = q_inner  # count() query should not have ORDER BY
         q_inner = apply_order(q_inner)
         q_inner = apply_limit(q_inner)
 
-        q_joined = q_inner.from_self()
+        if 'projection' in query_params:
+            # rows of the projected columns instead of entity objects
+            q_joined = q_inner.from_self(*[getattr(cls, key) for key in query_params['projection']])
+        else:
+            q_joined = q_inner.from_self()
         q_joined = cls._rest_get_joined_query(session, q_joined, query_params)
         q_joined = apply_order(q_joined)
 
-        return q_count.count(), q_joined.all()
+        if 'field_spec' in query_params and 'projection' not in query_params:
+            q_joined = q_joined.options(*cls.rest_get_loader_options(
+                query_params['field_spec'], query_params.get('loader_strategies'), query_params.get('load_only', False)))
+
+        timings = query_params.get('timings', null_timings)
+
+        with timings.phase('count'):
+            count = get_count(q_count)
+
+        if 'yield_per' in query_params:
+            return count, q_joined.yield_per(query_params['yield_per'])
+
+        with timings.phase('query'):
+            return count, q_joined.all()
+
+    @classmethod
+    def rest_can_update_columns(cls, keys):
+        """
+        :return: True if rest_update_columns() can set keys without skipping hooks: keys are plain,
+            non primary key columns without file (efs_category) hooks, no ORM update listeners
+            are registered, no version_id_col (the ORM checks and bumps it) and rest_add() /
+            the search backend need no object
+        """
+        mapper = sqlalchemy.inspect(cls)
+
+        if mapper.dispatch.before_update or mapper.dispatch.after_update:
+            return False
+
+        if mapper.version_id_col is not None:
+            return False
+
+        if cls.rest_add is not RestMixin.rest_add or type(cls.rest_get_search_backend()).added is not LikeSearch.added:
+            return False
+
+        primary_keys = frozenset(p.key for p in map(mapper.get_property_by_column, mapper.primary_key))
+
+        for key in keys:
+            if not isinstance(mapper.attrs.get(key), ColumnProperty) or key in primary_keys:
+                return False
+            if 'efs_category' in mapper.all_orm_descriptors[key].info:
+                return False
+
+        return True
+
+    @classmethod
+    def rest_update_columns(cls, id, values):
+        """
+        Single UPDATE ... WHERE id = :id, without loading the object; an instance
+        already in the session gets the new values too.
+
+        :param values: dict column key -> value, see rest_can_update_columns()
+        :raises NoResultFound: if there is no object with this id or id does not convert to the key type
+        """
+        session = config.sqlalchemy_session()
+        mapper = sqlalchemy.inspect(cls)
+        pk = getattr(cls, mapper.get_property_by_column(mapper.primary_key[0]).key)
+
+        try:
+            id = _parse_key_value(pk, id)
+        except (ValueError, TypeError, ArithmeticError):
+            raise NoResultFound
+
+        count = (session.query(cls)
+            .filter(pk == id)
+            .update(values, synchronize_session='evaluate'))
+
+        if not count:
+            raise NoResultFound
+
+        mark_changed(session, cls)
+
+    @classmethod
+    def rest_can_delete_by_query(cls):
+        """
+        :return: True if rest_delete_by_query() can delete rows without skipping hooks: the entity maps
+            a single table with a single column primary key, no ORM delete listeners are registered,
+            deleting a row needs no cascades by the unit of work (relationships other than many to one
+            must have passive_deletes), no association proxy has file hooks and rest_delete() / the
+            search backend need no object
+        """
+        mapper = sqlalchemy.inspect(cls)
+
+        if len(mapper.tables) != 1 or len(mapper.primary_key) != 1:
+            return False
+
+        if mapper.dispatch.before_delete or mapper.dispatch.after_delete:
+            return False
+
+        if cls.rest_delete is not RestMixin.rest_delete or type(cls.rest_get_search_backend()).deleted is not LikeSearch.deleted:
+            return False
+
+        for rel in mapper.relationships:
+            if rel.cascade.delete and rel.direction is MANYTOONE:
+                return False
+            if rel.direction is not MANYTOONE and not rel.passive_deletes:
+                return False
+
+        return not get_entity_meta(cls).file_proxies
+
+    @classmethod
+    def rest_delete_by_query(cls, query_params, max_rows=None, dry_run=False):
+        """
+        Single DELETE ... WHERE id IN (<filtered query>) of the objects selected by query_params
+        search and filters, without loading them, see rest_can_delete_by_query(). Files of
+        efs_category columns are deleted after commit; their ids are collected with RETURNING
+        where the dialect supports it, otherwise by a SELECT before the DELETE. Objects already
+        in the session are not expunged.
+
+        :param max_rows: raise RESTException too-many-rows instead of deleting more rows; if rows
+            matching the filters are added concurrently, it is raised after the DELETE and the
+            transaction must be rolled back
+        :param dry_run: only count the rows that would be deleted, max_rows is not checked
+        :return: number of rows deleted, or matched if dry_run
+        """
+        session = config.sqlalchemy_session
+        mapper = sqlalchemy.inspect(cls)
+        pk = mapper.primary_key[0]
+        file_columns = [mapper.attrs[key].columns[0] for key in get_entity_meta(cls).file_keys]
+        timings = query_params.get('timings', null_timings)
+
+        query = cls.rest_get_filtered_query(session, query_params)
+
+        if max_rows is not None or dry_run:
+            with timings.phase('count'):
+                count = query.count()
+            if dry_run:
+                return count
+            if count > max_rows:
+                raise RESTException(code='too-many-rows', msg='%d rows, at most %d' % (count, max_rows))
+
+        # a derived table, some databases do not allow the deleted table in the subquery itself
+        ids = query.with_entities(pk.label('id')).subquery()
+        where = pk.in_(sqlalchemy.select([ids.c.id]))
+        stmt = mapper.local_table.delete().where(where)
+
+        connection = session().connection(mapper=mapper)
+
+        with timings.phase('query'):
+            if file_columns and connection.dialect.name in _returning_dialects:
+                rows = connection.execute(stmt.returning(*file_columns)).fetchall()
+                count = len(rows)
+            else:
+                if file_columns:
+                    rows = connection.execute(sqlalchemy.select(file_columns).where(where)).fetchall()
+                else:
+                    rows = []
+                count = connection.execute(stmt).rowcount
+
+        if max_rows is not None and count > max_rows:
+            raise RESTException(code='too-many-rows', msg='%d rows, at most %d' % (count, max_rows))
+
+        for row in rows:
+            for file_id in row:
+                if file_id:
+                    delete_file_on_commit(file_id, session())
+
+        mark_changed(session(), cls)
+
+        return count
 
     def rest_add(self, flush=False):
         config.sqlalchemy_session().add(self)
+        self.rest_get_search_backend().added(config.sqlalchemy_session(), self)
         if flush:
             config.sqlalchemy_session().flush()
 
     def rest_delete(self, flush=False):
         config.sqlalchemy_session().delete(self)
+        self.rest_get_search_backend().deleted(config.sqlalchemy_session(), self)
         if flush:
             config.sqlalchemy_session().flush()
@@ -1,4 +1,8 @@
+import sqlalchemy
+from pyramid.httpexceptions import HTTPNotFound, HTTPMethodNotAllowed, HTTPForbidden
+
 from .views import RestViews
+from .meta import get_entity_meta
 
 import logging
 log = logging.getLogger(__name__)
@@ -30,6 +34,14 @@ class RestAPI(object):
             if delegate.name is None:
                 delegate.name = delegate.entity.__name__.lower()
 
+            if delegate.allow_delete_by_filter and not delegate.uses_default_list_getter():
+                raise ValueError('RestAPI.endpoint(): %r: allow_delete_by_filter needs the default entity list getters, '
+                    'delete by filter does not apply their scoping' % delegate)
+
+            if delegate.allow_bulk and not delegate.uses_default_getter():
+                raise ValueError('RestAPI.endpoint(): %r: allow_bulk needs the default entity getters, '
+                    'bulk updates and deletes do not apply their scoping' % delegate)
+
             if delegate.name in self.delegates:
                 raise ValueError('RestAPI.endpoint(): %r: name %r already registered for class %r' % (
                     delegate, delegate.name, cls.delegates[delegate.name]))
@@ -48,45 +60,65 @@ class RestAPI(object):
 
         return decorate
 
-    def custom_coll(self, http_method, suffix=None):  # decorator for a custom view
+    def custom_coll(self, http_method, suffix=None, read_only=False):  # decorator for a custom view
+        """
+        :param read_only: the method only reads and may use eor_rest.sqlalchemy_read_session
+        """
         def decorate(method):
             method._eor_custom = {
                 'item': False,
                 'url_suffix': suffix or method.__name__,
-                'http_method': http_method
+                'http_method': http_method,
+                'read_only': read_only
             }
             return method
 
         return decorate
 
-    def custom_item(self, http_method, suffix=None):
+    def custom_item(self, http_method, suffix=None, read_only=False):
         def decorate(method):
             method._eor_custom = {
                 'item': True,
                 'url_suffix': suffix or method.__name__,
-                'http_method': http_method
+                'http_method': http_method,
+                'read_only': read_only
             }
             return method
 
         return decorate
 
-    def add_routes(self, config, url_prefix='/rest', **kwargs):
+    def add_routes(self, config, url_prefix='/rest', compact=False, **kwargs):
+        """
+        :param compact: register one catch-all route for the whole API instead of routes per endpoint;
+            requests are dispatched through a table built here. Route names seen by delegates and
+            the response cache are the same in both modes.
+        :param kwargs: passed to config.add_route()
+        """
+        self.build_entity_metas()
+
+        if compact:
+            self._add_compact_routes(config, url_prefix, **kwargs)
+            return
+
         for delegate in self.delegates.values():
             self._add_routes_for_endpoint(delegate, config, url_prefix, **kwargs)
 
-    def _add_routes_for_endpoint(self, delegate, config, url_prefix, **kwargs):
+    def build_entity_metas(self):
+        # entity metadata for serialize / deserialize; built here rather than in endpoint(),
+        # where the mappers of related entities may not be configurable yet
+        for delegate in self.delegates.values():
+            if sqlalchemy.inspect(delegate.entity, raiseerr=False) is not None:
+                get_entity_meta(delegate.entity)
 
-        def url_pattern(is_item):
-            if is_item:
-                # example: /rest/user
-                return R'%s/%s/{id}' % (url_prefix, delegate.name)
-            else:
-                # example: /rest/user/{id}
-                return R'%s/%s' % (url_prefix, delegate.name)
+    def route_name(self, delegate, route_part):
+        # example: eor-rest.default.user.get-list
+        return 'eor-rest.%s.%s.%s' % (self.name, delegate.name, route_part)
 
-        def route_name(suffix):
-            # example: eor.rest.default.user.get
-            return 'eor-rest.%s.%s.%s' % (self.name, delegate.name, suffix)
+    def _endpoint_routes(self, delegate):
+        """
+        :return: list of (is_item, url suffix or None, route part, http method or None, view attr, permission)
+            in matching order
+        """
 
         def permission(method):
             if isinstance(delegate.permission, dict):
@@ -97,48 +129,143 @@ class RestAPI(object):
             else:
                 return delegate.permission
 
-        def register(is_item, route_part, method, attr):
+        routes = []
+
+        def add(is_item, route_part, method, attr, suffix=None, permission_method=None):
+            routes.append((is_item, suffix, route_part, method, attr, permission(permission_method or method)))
+
+        # collection resource
+
+        add(False, 'get-list', 'GET',  'get_list')
+        add(False, 'create',   'POST', 'create')
+        if delegate.allow_delete_by_filter:
+            add(False, 'delete-by-filter', 'DELETE', 'delete_by_filter')
+        add(False, 'bad-method-collection', None, 'bad_method')
+
+        # bulk resource, before item resource: {id} would match _bulk
+
+        if delegate.allow_bulk:
+            add(False, 'bulk-create', 'POST',   'bulk_create', '_bulk')
+            add(False, 'bulk-update', 'PUT',    'bulk_update', '_bulk')
+            add(False, 'bulk-delete', 'DELETE', 'bulk_delete', '_bulk')
+            add(False, 'bad-method-bulk', None, 'bad_method',  '_bulk')
+
+        # item resource
+
+        add(True, 'get-by-id', 'GET',    'get_by_id')
+        add(True, 'update',    'PUT',    'update')
+        add(True, 'patch',     'PATCH',  'patch', permission_method='PUT')
+        add(True, 'delete',    'DELETE', 'delete')
+        add(True, 'bad-method-item', None, 'bad_method')
+
+        # custom methods
+
+        for attr, d in delegate.custom_methods.items():
+            routes.append((d['item'], d['url_suffix'], 'custom-' + attr, d['http_method'], 'custom_method',
+                None))  # TODO permission(method)
+
+        return routes
+
+    def _add_routes_for_endpoint(self, delegate, config, url_prefix, **kwargs):
+
+        def url_pattern(is_item, suffix):
+            if is_item:
+                # example: /rest/user/{id}
+                pattern = R'%s/%s/{id}' % (url_prefix, delegate.name)
+            else:
+                # example: /rest/user
+                pattern = R'%s/%s' % (url_prefix, delegate.name)
+
+            # example: /rest/user/_bulk
+            return pattern + '/' + suffix if suffix else pattern
+
+        for is_item, suffix, route_part, method, attr, permission in self._endpoint_routes(delegate):
+            route_name = self.route_name(delegate, route_part)
             config.add_route(
-                route_name(route_part),
-                url_pattern(is_item),
+                route_name,
+                url_pattern(is_item, suffix),
                 request_method=method,
                 **kwargs
             )
             config.add_view(
                 RestViews, attr=attr,
-                route_name=route_name(route_part),
+                route_name=route_name,
                 renderer='eor-rest-json',
-                permission=permission(method)
+                permission=permission
             )
+            RestViews.routes[route_name] = (delegate, route_name)
 
-        def register_custom_method(attr, http_method, url_suffix, is_item):
-            config.add_route(
-                route_name('custom-' + attr),
-                url_pattern(is_item) + '/' + url_suffix,
-                request_method=http_method,
-                **kwargs
-            )
-            config.add_view(
-                RestViews, attr='custom_method',
-                route_name=route_name('custom-' + attr),
-                renderer='eor-rest-json',
-                permission=None # TODO permission(method)
-            )
+    def _add_compact_routes(self, config, url_prefix, **kwargs):
+        self.build_dispatch_table()
 
-        # collection resource
+        # example: /rest/user, /rest/user/_bulk, /rest/user/{id}, /rest/user/{id}/suffix
+        route_name = 'eor-rest.%s' % self.name
+        config.add_route(route_name, R'%s/{entity}*subpath' % url_prefix, **kwargs)
+        config.add_view(RestViews, attr='dispatch', route_name=route_name, renderer='eor-rest-json')
+        RestViews.routes[route_name] = (self, None)
+
+    def build_dispatch_table(self):
+        """
+        Table of all endpoints for lookup(), used by compact routes and by asgi.RestASGIApp
+        """
+        # (entity name, is_item, url suffix) -> {http method or None: (delegate, route name, view attr, permission)}
+        self.dispatch_table = {}
 
-        register(False, 'get-list', 'GET',  'get_list')
-        register(False, 'create',   'POST', 'create')
-        register(False, 'bad-method-collection', None, 'bad_method')
+        for delegate in self.delegates.values():
+            for is_item, suffix, route_part, method, attr, permission in self._endpoint_routes(delegate):
+                methods = self.dispatch_table.setdefault((delegate.name, is_item, suffix), {})
+                methods.setdefault(method, (delegate, self.route_name(delegate, route_part), attr, permission))
 
-        # item resource
+    def lookup(self, entity, subpath, method):
+        """
+        :param subpath: sequence of the path segments following the entity name
+        :return: (delegate class, route name, view attr, permission, id or None)
+        :raises HTTPNotFound, HTTPMethodNotAllowed:
+        """
+        table = self.dispatch_table
+        id = None
 
-        register(True, 'get-by-id', 'GET',    'get_by_id')
-        register(True, 'update',    'PUT',    'update')
-        register(True, 'delete',    'DELETE', 'delete')
-        register(True, 'bad-method-item', None, 'bad_method')
+        if not subpath:
+            methods = table.get((entity, False, None))
+        elif len(subpath) == 1:
+            # collection suffix (_bulk, custom collection methods) before {id}
+            methods = table.get((entity, False, subpath[0]))
+            if methods is None or not (method in methods or None in methods):
+                methods = table.get((entity, True, None))
+                id = subpath[0]
+        elif len(subpath) == 2:
+            methods = table.get((entity, True, subpath[1]))
+            id = subpath[0]
+        else:
+            methods = None
 
-        # custom methods
+        if methods is None:
+            raise HTTPNotFound()
 
-        for attr, d in delegate.custom_methods.items():
-            register_custom_method(attr, d['http_method'], d['url_suffix'], d['item'])
+        try:
+            delegate, route_name, attr, permission = methods[method]
+        except KeyError:
+            try:
+                delegate, route_name, attr, permission = methods[None]
+            except KeyError:
+                raise HTTPMethodNotAllowed()
+
+        return delegate, route_name, attr, permission, id
+
+    def dispatch(self, request):
+        """
+        Look up the handler of a request matched by the compact route; sets matchdict['id'] for item requests.
+
+        :return: (delegate class, route name, view attr)
+        """
+        matchdict = request.matchdict
+        delegate, route_name, attr, permission, id = self.lookup(
+            matchdict['entity'], matchdict['subpath'], request.method)
+
+        if id is not None:
+            matchdict['id'] = id
+
+        if permission is not None and not request.has_permission(permission):
+            raise HTTPForbidden()
+
+        return delegate, route_name, attr
@@ -0,0 +1,171 @@
+# coding: utf-8
+
+import sqlalchemy
+from sqlalchemy.sql import or_, desc, select
+from sqlalchemy.sql.expression import func, literal_column
+
+from .txqueue import TransactionQueue
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class LikeSearch(object):
+    """
+    lower(col) LIKE '%search%' OR'ed across the search columns.
+    No index can serve it, every search scans the table.
+    """
+
+    def filter(self, entity, columns, search):
+        search = search.lower()
+
+        if len(columns) == 1:
+            return func.lower(columns[0]).like('%' + search + '%')
+        else:  # > 1
+            return or_(*[func.lower(col).like('%' + search + '%') for col in columns])
+
+    def order_by_relevance(self, query, entity, columns, search):
+        """
+        :return: query ordered best matches first; unchanged if the backend does not rank
+        """
+        return query
+
+    def added(self, session, obj):
+        """
+        called by RestMixin.rest_add()
+        """
+        pass
+
+    def deleted(self, session, obj):
+        """
+        called by RestMixin.rest_delete()
+        """
+        pass
+
+
+class SQLiteFTS5Search(LikeSearch):
+    """
+    SQLite FTS5 shadow table (rowid = primary key, one column per search column),
+    kept in sync by rest_add() / rest_delete(). Every whitespace separated term must
+    match as a prefix; results are ranked by bm25.
+
+    Create the table with create(), fill it from existing rows with rebuild().
+    Rows written without rest_add() / rest_delete() are not indexed.
+    """
+
+    def __init__(self, table_name=None):
+        """
+        :param table_name: default: <entity table>_fts
+        """
+        self.table_name = table_name
+
+    def _table_name(self, entity):
+        return self.table_name or entity.__tablename__ + '_fts'
+
+    def _keys(self, entity):
+        return [col.key for col in entity._rest_search_columns]
+
+    def _pk(self, entity):
+        return sqlalchemy.inspect(entity).primary_key[0]
+
+    def create(self, connection, entity):
+        connection.execute('CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(%s)' % (
+            self._table_name(entity), ', '.join(self._keys(entity))))
+
+    def rebuild(self, connection, entity):
+        table_name = self._table_name(entity)
+        keys = self._keys(entity)
+        mapper = sqlalchemy.inspect(entity)
+
+        connection.execute('DELETE FROM %s' % table_name)
+        connection.execute('INSERT INTO %s (rowid, %s) SELECT %s, %s FROM %s' % (
+            table_name, ', '.join(keys), self._pk(entity).name,
+            ', '.join(mapper.get_property(key).columns[0].name for key in keys),
+            entity.__tablename__))
+
+    def _match(self, entity, search):
+        # "foo"* "bar"*: every term as a prefix, quotes escaped
+        expr = ' '.join('"%s"*' % term.replace('"', '""') for term in search.split())
+        return literal_column(self._table_name(entity)).match(expr)
+
+    def _fts_table(self, entity):
+        return sqlalchemy.table(self._table_name(entity), sqlalchemy.column('rowid'), sqlalchemy.column('rank'))
+
+    def filter(self, entity, columns, search):
+        fts = self._fts_table(entity)
+        return self._pk(entity).in_(select([fts.c.rowid]).where(self._match(entity, search)))
+
+    def order_by_relevance(self, query, entity, columns, search):
+        # join the matches once instead of a correlated MATCH per row
+        fts = self._fts_table(entity)
+        ranked = select([fts.c.rowid, fts.c.rank]).where(self._match(entity, search)).alias()
+        return query.join(ranked, ranked.c.rowid == self._pk(entity)).order_by(ranked.c.rank)
+
+    def added(self, session, obj):
+        _track(session, self, obj, None)
+
+    def deleted(self, session, obj):
+        pk = getattr(obj, sqlalchemy.inspect(obj.__class__).get_property_by_column(self._pk(obj.__class__)).key)
+        _track(session, self, obj, pk)
+
+    def sync(self, connection, obj, deleted_pk):
+        entity = obj.__class__
+        table_name = self._table_name(entity)
+        pk_key = sqlalchemy.inspect(entity).get_property_by_column(self._pk(entity)).key
+
+        if deleted_pk is not None:
+            connection.execute(sqlalchemy.text('DELETE FROM %s WHERE rowid = :pk' % table_name), pk=deleted_pk)
+            return
+
+        keys = self._keys(entity)
+        params = {key: getattr(obj, key) for key in keys}
+        params['_pk'] = getattr(obj, pk_key)
+
+        connection.execute(sqlalchemy.text('INSERT OR REPLACE INTO %s (rowid, %s) VALUES (:_pk, %s)' % (
+            table_name, ', '.join(keys), ', '.join(':' + key for key in keys))), **params)
+
+
+class PostgresFullTextSearch(LikeSearch):
+    """
+    to_tsvector(search columns) @@ plainto_tsquery(search): every term must match,
+    ranked by ts_rank. Served by an expression index, e.g. for two search columns:
+
+      CREATE INDEX ... ON entity USING gin (
+          to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(description, '')))
+    """
+
+    def __init__(self, ts_config='simple'):
+        self.ts_config = ts_config
+
+    def _document(self, columns):
+        document = func.coalesce(columns[0], '')
+        for col in columns[1:]:
+            document = document + ' ' + func.coalesce(col, '')
+
+        return func.to_tsvector(self.ts_config, document)
+
+    def _query(self, search):
+        return func.plainto_tsquery(self.ts_config, search)
+
+    def filter(self, entity, columns, search):
+        return self._document(columns).op('@@')(self._query(search))
+
+    def order_by_relevance(self, query, entity, columns, search):
+        return query.order_by(desc(func.ts_rank(self._document(columns), self._query(search))))
+
+
+like_search = LikeSearch()
+
+
+def _track(session, backend, obj, deleted_pk):
+    _pending.add(session, (backend, obj, deleted_pk))
+
+
+def _after_flush(session, pending):
+    # primary keys of new objects are known after the flush
+    connection = session.connection()
+    for backend, obj, deleted_pk in pending:
+        backend.sync(connection, obj, deleted_pk)
+
+
+_pending = TransactionQueue('eor_rest_search', _after_flush, event='after_flush')
@@ -1,6 +1,6 @@
 # coding: utf-8
 
-import sqlalchemy
+from .meta import get_entity_meta
 
 import logging
 log = logging.getLogger(__name__)
@@ -23,18 +23,30 @@ def _serialize_value(val):
     return val
 
 
-def serialize_sqlalchemy_obj(obj, field_spec):
-    """
-    serialize sqlalchemy object
+# serializer plans: (entity class, frozen field_spec) -> list of steps
+_plans = {}
+_max_plans = 4096
 
-    :param obj: sqlalchemy object
-    :param field_spec: dictionary
-       example: {'*', True, 'a': False, 'b': False, 'c': {...}}
-    :return: serialized structure
+# step kinds
+_SKIP, _ATTR, _CALL, _OBJ, _LIST = range(5)
+
+
+def freeze_field_spec(field_spec):
     """
-    if obj is None:
-        return None
+    return a hashable representation of a field_spec, usable as a cache key
+    """
+    try:
+        items = field_spec.items()
+    except AttributeError:
+        log.error('serialize_sqlalchemy_obj(): bad field_spec: %r', field_spec)
+        raise
+
+    return tuple(
+        (key, freeze_field_spec(control) if isinstance(control, dict) else control)
+        for key, control in items)
+
 
+def _unwrap(obj):
     # in case of Session().query(entity, extra columns)
     extras = None
     try:
@@ -43,63 +55,289 @@ def serialize_sqlalchemy_obj(obj, field_spec):
     except:
         pass
 
-    obj_name = obj.__class__.__name__
-    mapper = sqlalchemy.inspect(obj.__class__)
+    return obj, extras
 
-    try:
-        include_all_own = field_spec.get('*', False)
-    except AttributeError as e:
-        log.error('serialize_sqlalchemy_obj(): bad field_spec: %r', field_spec)
-        raise
+
+def resolve_field_spec(entity, field_spec):
+    """
+    merge field_spec with entity defaults: '*', er_serialize and er_ser_fn column info
+
+    :return: dict key -> control (True, False, dict or callable)
+    """
+    meta = get_entity_meta(entity)
+
+    include_all_own = field_spec.get('*', False)
 
     fields = {}
 
     if include_all_own:
-        for p in mapper.column_attrs:
-            fields[p.key] = True
+        for k in meta.column_keys:
+            fields[k] = True
 
-    for k in mapper.attrs.keys():
-        info = mapper.all_orm_descriptors[k].info
-        if 'er_serialize' in info:
-            fields[k] = info['er_serialize']
+    fields.update(meta.serialize_defaults)
 
     fields.update(field_spec)
 
-    for k in mapper.attrs.keys():
-        info = mapper.all_orm_descriptors[k].info
-        if 'er_ser_fn' in info and fields.get(k) == True:
-            fields[k] = info['er_ser_fn']
+    for k, fn in meta.ser_fns.items():
+        if fields.get(k) == True:
+            fields[k] = fn
 
-    res = dict()
+    return fields
+
+
+def _compile_plan(entity, field_spec):
+    """
+    Resolve field_spec against the entity mapper once.
+
+    :return: list of (key, kind, arg) steps
+    """
+    relationships = get_entity_meta(entity).relationships
+    obj_name = entity.__name__
+    fields = resolve_field_spec(entity, field_spec)
+
+    plan = []
 
     for key, control in fields.items():
         if key == '*' or control == False:
             continue
 
         if callable(control):
-            res[key] = _serialize_value(control(obj, *(extras or [])))
+            plan.append((key, _CALL, control))
+            continue
+
+        if isinstance(control, dict):
+            sub_spec = (control, freeze_field_spec(control))
+            plan.append((key, _LIST if relationships[key].uselist else _OBJ, sub_spec))
+        elif control == True:
+            plan.append((key, _ATTR, None))
+        else:
+            log.error('bad control value %r, skipped: %s.%s', control, obj_name, key)
+
+    return plan
+
+
+def _get_plan(entity, field_spec, frozen_spec):
+    try:
+        return _plans[entity, frozen_spec]
+    except KeyError:
+        if len(_plans) >= _max_plans:
+            _plans.clear()  # client selected fields can produce any number of specs
+        plan = _plans[entity, frozen_spec] = _compile_plan(entity, field_spec)
+        return plan
+
+
+def _run_plan(plan, obj, extras):
+    res = dict()
+
+    for key, kind, arg in plan:
+        if kind is _CALL:
+            res[key] = _serialize_value(arg(obj, *(extras or [])))
             continue
 
         try:
             obj_attr = getattr(obj, key)
         except AttributeError:
-            log.warn('attribute not present in object, skipped: %s.%s', obj_name, key)
+            log.warn('attribute not present in object, skipped: %s.%s', obj.__class__.__name__, key)
             continue
 
-        prop = mapper.attrs.get(key)  # does not exist for association proxies
-
-        if isinstance(control, dict):
-            if prop.uselist:
-                res[key] = serialize_sqlalchemy_list(obj_attr, control)
-            else:
-                res[key] = serialize_sqlalchemy_obj(obj_attr, control)
-        elif control == True:
+        if kind is _ATTR:
             res[key] = _serialize_value(obj_attr)
+        elif kind is _LIST:
+            res[key] = _serialize_list(obj_attr, *arg)
         else:
-            log.error('bad control value %r, skipped: %s.%s', control, obj_name, key)
+            res[key] = _serialize_obj(obj_attr, *arg)
+
+    return res
+
+
+def _serialize_obj(obj, field_spec, frozen_spec):
+    if obj is None:
+        return None
+
+    obj, extras = _unwrap(obj)
+
+    return _run_plan(_get_plan(obj.__class__, field_spec, frozen_spec), obj, extras)
+
+
+def _serialize_list(lst, field_spec, frozen_spec):
+    res = []
+    plan = None
+    plan_entity = None
+
+    for obj in lst:
+        if obj is None:
+            res.append(None)
+            continue
+
+        obj, extras = _unwrap(obj)
+
+        if obj.__class__ is not plan_entity:
+            plan_entity = obj.__class__
+            plan = _get_plan(plan_entity, field_spec, frozen_spec)
+
+        res.append(_run_plan(plan, obj, extras))
 
     return res
 
 
+# (entity, frozen field_spec) -> frozenset of entities
+_field_spec_entities = {}
+_max_field_spec_entities = 4096
+
+
+def get_field_spec_entities(entity, field_spec):
+    """
+    :return: frozenset of entity classes whose rows are read when serializing entity with field_spec:
+        entity itself and targets of nested field_specs and association proxies
+    """
+    key = (entity, freeze_field_spec(field_spec))
+
+    try:
+        return _field_spec_entities[key]
+    except KeyError:
+        pass
+
+    meta = get_entity_meta(entity)
+    entities = {entity}
+
+    for k, control in resolve_field_spec(entity, field_spec).items():
+        if control is True:
+            target_collection = meta.association_proxies.get(k)
+            if target_collection is None:
+                continue
+            k, control = target_collection, {}
+        elif not isinstance(control, dict):
+            continue
+
+        prop = meta.relationships.get(k)
+        if prop is not None:
+            entities |= get_field_spec_entities(prop.mapper.class_, control)
+
+    entities = frozenset(entities)
+
+    if len(_field_spec_entities) >= _max_field_spec_entities:
+        _field_spec_entities.clear()  # keyed by client selected fields too, see narrow_field_spec()
+    _field_spec_entities[key] = entities
+
+    return entities
+
+
+def get_projection_keys(entity, field_spec):
+    """
+    :return: list of column attribute keys if serializing entity with field_spec reads
+        nothing but plain columns (no callables, nested specs or association proxies), else None
+    """
+    column_keys = get_entity_meta(entity).column_key_set
+    plan = _get_plan(entity, field_spec, freeze_field_spec(field_spec))
+
+    if all(kind is _ATTR and key in column_keys for key, kind, arg in plan):
+        return [key for key, kind, arg in plan]
+
+    return None
+
+
+# (entity, frozen field_spec, fields) -> narrowed field_spec
+_narrowed_specs = {}
+_max_narrowed_specs = 1024
+
+
+def _parse_fields(fields):
+    """
+    'id,name,author.name' -> {'id': None, 'name': None, 'author': {'name': None}}; None: the whole field
+    """
+    tree = {}
+
+    for path in fields.split(','):
+        path = path.strip()
+        if not path:
+            continue
+
+        node = tree
+        parts = path.split('.')
+        for el in parts[:-1]:
+            if el in node and node[el] is None:
+                break  # the whole field was requested already
+            node = node.setdefault(el, {})
+        else:
+            node[parts[-1]] = None
+
+    return tree
+
+
+def _narrow_field_spec(entity, field_spec, tree, prefix):
+    relationships = get_entity_meta(entity).relationships
+    allowed = resolve_field_spec(entity, field_spec)
+
+    # explicit False so that '*' and er_serialize defaults do not add fields back
+    narrowed = {key: False for key in allowed if key != '*'}
+
+    for key, subtree in tree.items():
+        control = allowed.get(key, False)
+        if control is False or key == '*':
+            raise ValueError('unknown field %s%s' % (prefix, key))
+
+        if subtree is None:
+            narrowed[key] = control
+        elif isinstance(control, dict) and key in relationships:
+            narrowed[key] = _narrow_field_spec(
+                relationships[key].mapper.class_, control, subtree, prefix + key + '.')
+        else:
+            raise ValueError('field %s%s has no subfields' % (prefix, key))
+
+    return narrowed
+
+
+def narrow_field_spec(entity, field_spec, fields):
+    """
+    Limit field_spec to the fields a client asked for.
+
+    :param field_spec: the allowed fields, an upper bound
+    :param fields: comma separated dotted paths, like 'id,name,author.name'; a relationship
+        without subfields selects everything field_spec allows for it
+    :return: field_spec
+    :raises ValueError: if fields names a field not in field_spec
+    """
+    key = (entity, freeze_field_spec(field_spec), fields)
+
+    try:
+        return _narrowed_specs[key]
+    except KeyError:
+        pass
+
+    narrowed = _narrow_field_spec(entity, field_spec, _parse_fields(fields), '')
+
+    if len(_narrowed_specs) >= _max_narrowed_specs:
+        _narrowed_specs.clear()
+    _narrowed_specs[key] = narrowed
+
+    return narrowed
+
+
+def serialize_rows(rows, keys):
+    """
+    serialize result rows of a column projection, see get_projection_keys()
+    """
+    return [dict(zip(keys, map(_serialize_value, row))) for row in rows]
+
+
+def serialize_sqlalchemy_obj(obj, field_spec):
+    """
+    serialize sqlalchemy object
+
+    :param obj: sqlalchemy object
+    :param field_spec: dictionary
+       example: {'*', True, 'a': False, 'b': False, 'c': {...}}
+    :return: serialized structure
+    """
+    if obj is None:
+        return None
+
+    return _serialize_obj(obj, field_spec, freeze_field_spec(field_spec))
+
+
 def serialize_sqlalchemy_list(lst, field_spec):
-    return [serialize_sqlalchemy_obj(e, field_spec) for e in lst]
+    """
+    serialize a list of sqlalchemy objects; the field_spec is resolved
+    against the entity mapper once and reused for every element
+    """
+    return _serialize_list(lst, field_spec, freeze_field_spec(field_spec))
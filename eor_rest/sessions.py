@@ -0,0 +1,114 @@
+# coding: utf-8
+
+import contextvars
+from contextlib import contextmanager
+
+import sqlalchemy
+from sqlalchemy.orm import Session
+
+from .config import config
+from .txqueue import TransactionQueue
+from . import cache
+
+import logging
+log = logging.getLogger(__name__)
+
+
+# True while a view reads from eor_rest.sqlalchemy_read_session, see SessionRouter.reading()
+_reading = contextvars.ContextVar('eor_rest_reading', default=False)
+
+
+class SessionRouter(object):
+    """
+    eor_rest.sqlalchemy_session once eor_rest.sqlalchemy_read_session is set: callable and
+    attribute access like a scoped_session. Inside reading() it is the read session (e.g. bound
+    to a replica), otherwise the write session. Both should be ended by the transaction
+    manager of the request.
+    """
+
+    def __init__(self, write, read):
+        """
+        :param write: scoped_session of the primary
+        :param read: scoped_session of a replica
+        """
+        self.write = write
+        self.read = read
+
+    def __call__(self):
+        if _reading.get():
+            session = self.read()
+            session.info['eor_rest_read'] = True
+            return session
+
+        return self.write()
+
+    def __getattr__(self, name):
+        return getattr(self(), name)
+
+    def has_written(self):
+        """
+        :return: True if the current transaction of the write session has changes, flushed or not
+        """
+        session = self.write()
+        return bool(session.new or session.dirty or session.deleted
+            or _written.get(session) or cache.changed.get(session))
+
+    @contextmanager
+    def reading(self):
+        """
+        Use the read session in this block, unless the write session has changes:
+        reads following a write stay on the primary
+        """
+        if self.has_written():
+            log.debug('reading from the write session after a write')
+            yield
+            return
+
+        token = _reading.set(True)
+        try:
+            yield
+        finally:
+            _reading.reset(token)
+
+
+@contextmanager
+def reading(enabled=True):
+    """
+    Use eor_rest.sqlalchemy_read_session in this block if configured and enabled, see SessionRouter.reading()
+    """
+    if not enabled or not isinstance(config.sqlalchemy_session, SessionRouter):
+        yield
+        return
+
+    with config.sqlalchemy_session.reading():
+        yield
+
+
+# flushes in the transaction of a session
+_written = TransactionQueue('eor_rest_written')
+
+
+def _after_flush(session, flush_context):
+    _written.add(session, True)
+
+
+def _before_flush(session, flush_context, instances):
+    if session.info.get('eor_rest_read') and (session.new or session.dirty or session.deleted):
+        raise RuntimeError('eor_rest: write to eor_rest.sqlalchemy_read_session; set use_read_session = False '
+            'on the delegate or do not declare the custom method read_only')
+
+
+def install_router():
+    """
+    Route eor_rest.sqlalchemy_session between the write session and eor_rest.sqlalchemy_read_session
+    """
+    if config.sqlalchemy_read_session is config.sqlalchemy_session:
+        return
+
+    if not isinstance(config.sqlalchemy_session, SessionRouter):
+        config.sqlalchemy_session = SessionRouter(config.sqlalchemy_session, config.sqlalchemy_read_session)
+
+    if not sqlalchemy.event.contains(Session, 'after_flush', _after_flush):
+        sqlalchemy.event.listen(Session, 'before_flush', _before_flush)
+        sqlalchemy.event.listen(Session, 'after_flush', _after_flush)
+    _written.install()
@@ -0,0 +1,266 @@
+# coding: utf-8
+
+import json
+import os
+import tempfile
+import unittest
+
+import sqlalchemy as sa
+from sqlalchemy.orm import relationship, sessionmaker
+from sqlalchemy.ext.declarative import declarative_base
+from voluptuous import Schema, Required, Optional
+
+try:
+    from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+    import aiosqlite
+except ImportError:
+    create_async_engine = None
+
+from eor_rest import RestAPI, RESTException, AsyncRestDelegate, AsyncRestMixin
+from eor_rest.aio import run_sync, get_async_session
+from eor_rest.config import config
+from eor_rest.asgi import RestASGIApp
+
+
+Base = declarative_base()
+
+
+class Author(AsyncRestMixin, Base):
+    __tablename__ = 'author'
+
+    id = sa.Column(sa.Integer, primary_key=True)
+    name = sa.Column(sa.Unicode, nullable=False)
+    books = relationship('Book', back_populates='author', cascade='all, delete-orphan', order_by='Book.id')
+
+
+class Book(AsyncRestMixin, Base):
+    __tablename__ = 'book'
+
+    id = sa.Column(sa.Integer, primary_key=True)
+    title = sa.Column(sa.Unicode, nullable=False)
+    author_id = sa.Column(sa.Integer, sa.ForeignKey('author.id'))
+    author = relationship('Author', back_populates='books')
+
+    @classmethod
+    async def get_by_id_only(cls, id):
+        return await cls.rest_get_by_id_async(id)
+
+
+class Publisher(AsyncRestMixin, Base):
+    __tablename__ = 'publisher'
+
+    id = sa.Column(sa.Integer, primary_key=True)
+    name = sa.Column(sa.Unicode, nullable=False)
+
+    @classmethod
+    def rest_get_by_id(cls, id):
+        # without the eager loading parameters
+        return super(Publisher, cls).rest_get_by_id(id)
+
+
+api = RestAPI('test-asgi')
+
+
+@api.endpoint()
+class AuthorEndpoint(AsyncRestDelegate):
+    entity = Author
+    permission = {'DELETE': 'admin'}
+
+    def get_fields_for_coll(self):
+        return {'*': True}
+
+    def get_fields_for_obj(self):
+        return {'*': True, 'books': {'*': True}}
+
+    def get_schema(self):
+        return Schema({
+            Required('name'): str,
+            Optional('books'): [{Optional('id'): int, Required('title'): str}]
+        })
+
+    async def before_create(self, obj, deserialized):
+        if deserialized['name'] == 'bad':
+            raise RESTException(code='bad-name')
+
+    @api.custom_item('GET')
+    async def nbooks(self, obj):
+        return {'status': 'ok', 'n': await run_sync(lambda: len(obj.books))}
+
+    @api.custom_coll('GET')
+    async def session(self):
+        return {'status': 'ok', 'is_request_session': config.sqlalchemy_session() is get_async_session().sync_session}
+
+
+@api.endpoint()
+class BookEndpoint(AsyncRestDelegate):
+    entity = Book
+    entity_getter = 'get_by_id_only'
+
+    def get_fields_for_obj(self):
+        return {'*': True, 'author': {'name': True}}
+
+    def get_schema(self):
+        return Schema({Required('title'): str, Optional('author_id'): int})
+
+
+@api.endpoint()
+class PublisherEndpoint(AsyncRestDelegate):
+    entity = Publisher
+
+    def get_schema(self):
+        return Schema({Required('name'): str})
+
+
+class App(RestASGIApp):
+    async def has_permission(self, request, permission):
+        return request.headers.get('X-Role') == permission
+
+
+@unittest.skipIf(create_async_engine is None, 'requires SQLAlchemy >= 1.4 and aiosqlite')
+class RestASGIAppTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+
+        self.engine = create_async_engine('sqlite+aiosqlite:///' + self.db_path)
+        async with self.engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+
+        self.saved_session = config.sqlalchemy_session
+        config.sqlalchemy_session = self.global_session = object()
+
+        self.app = App(api, {
+            'eor_rest.sqlalchemy_async_session': sessionmaker(self.engine, class_=AsyncSession,
+                expire_on_commit=False),
+            'eor_rest.do_csrf_checks': 'false',
+        })
+
+        for i in range(2):
+            await self.call('POST', '/rest/author', {
+                'name': 'A%d' % i,
+                'books': [{'title': 'B%d.%d' % (i, j)} for j in range(2)]
+            })
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+        os.remove(self.db_path)
+        config.sqlalchemy_session = self.saved_session
+
+    async def call(self, method, path, body=None, headers=()):
+        """
+        :return: (status, parsed json body)
+        """
+        path, _, query_string = path.partition('?')
+        request_headers = [(b'content-type', b'application/json')] if body is not None else []
+        request_headers += [(name.encode(), value.encode()) for name, value in headers]
+        messages = [{'type': 'http.request', 'body': json.dumps(body).encode() if body is not None else b''}]
+
+        async def receive():
+            return messages.pop(0)
+
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        await self.app({
+            'type': 'http',
+            'method': method,
+            'path': path,
+            'query_string': query_string.encode(),
+            'headers': request_headers,
+            'http_version': '1.1',
+        }, receive, send)
+
+        body = sent[1]['body']
+        return sent[0]['status'], json.loads(body) if body.startswith(b'{') else None
+
+    async def test_get_list(self):
+        status, resp = await self.call('GET', '/rest/author?o=-name')
+        self.assertEqual(status, 200)
+        self.assertEqual(resp['count'], 2)
+        self.assertEqual([el['name'] for el in resp['data']], ['A1', 'A0'])
+
+    async def test_get_by_ids(self):
+        status, resp = await self.call('GET', '/rest/author?ids=2,1,77')
+        self.assertEqual([el['id'] for el in resp['data']], [2, 1])
+        self.assertEqual(resp['missing'], ['77'])
+
+    async def test_get_by_id(self):
+        status, resp = await self.call('GET', '/rest/author/1')
+        self.assertEqual(status, 200)
+        self.assertEqual([el['title'] for el in resp['data']['books']], ['B0.0', 'B0.1'])
+
+        status, resp = await self.call('GET', '/rest/author/99')
+        self.assertEqual(resp['code'], 'object-not-found')
+
+    async def test_custom_entity_getter(self):
+        status, resp = await self.call('GET', '/rest/book/3')
+        self.assertEqual(status, 200)
+        self.assertEqual(resp['data']['author']['name'], 'A1')
+
+    async def test_entity_getter_override(self):
+        await self.call('POST', '/rest/publisher', {'name': 'P'})
+
+        status, resp = await self.call('GET', '/rest/publisher/1')
+        self.assertEqual(resp['data']['name'], 'P')
+
+        await self.call('PATCH', '/rest/publisher/1', {'name': 'Q'})
+        status, resp = await self.call('GET', '/rest/publisher/1')
+        self.assertEqual(resp['data']['name'], 'Q')
+
+    async def test_create_error(self):
+        status, resp = await self.call('POST', '/rest/author', {'name': 'bad'})
+        self.assertEqual(resp['code'], 'bad-name')
+
+        status, resp = await self.call('GET', '/rest/author')
+        self.assertEqual(resp['count'], 2)
+
+    async def test_update(self):
+        status, resp = await self.call('PUT', '/rest/author/2', {'name': 'A2', 'books': [{'id': 3, 'title': 'kept'}]})
+        self.assertEqual(status, 200)
+
+        status, resp = await self.call('GET', '/rest/author/2')
+        self.assertEqual(resp['data']['name'], 'A2')
+        self.assertEqual([el['title'] for el in resp['data']['books']], ['kept'])
+
+    async def test_patch(self):
+        await self.call('PATCH', '/rest/author/1', {'name': 'patched'})
+
+        status, resp = await self.call('GET', '/rest/author/1')
+        self.assertEqual(resp['data']['name'], 'patched')
+
+    async def test_filter(self):
+        status, resp = await self.call('GET', '/rest/book?fe_author_id=1')
+        self.assertEqual([el['title'] for el in resp['data']], ['B0.0', 'B0.1'])
+
+    async def test_custom_method(self):
+        status, resp = await self.call('GET', '/rest/author/2/nbooks')
+        self.assertEqual(resp['n'], 2)
+
+    async def test_delete_permission(self):
+        status, resp = await self.call('DELETE', '/rest/author/2')
+        self.assertEqual(status, 403)
+
+        status, resp = await self.call('DELETE', '/rest/author/2', headers=[('X-Role', 'admin')])
+        self.assertEqual(status, 200)
+
+        status, resp = await self.call('GET', '/rest/book')
+        self.assertEqual(resp['count'], 2)
+
+    async def test_sqlalchemy_session(self):
+        status, resp = await self.call('GET', '/rest/author/session')
+        self.assertTrue(resp['is_request_session'])
+
+        # unchanged outside requests, e.g. for a WSGI app in the same process
+        self.assertIs(config.sqlalchemy_session, self.global_session)
+
+    async def test_settings_kept_on_app(self):
+        self.assertFalse(self.app.config.do_csrf_checks)
+        self.assertTrue(config.do_csrf_checks)
+        self.assertIsNone(config.sqlalchemy_async_session)
+
+    async def test_not_found(self):
+        status, resp = await self.call('GET', '/rest/nothing')
+        self.assertEqual(status, 404)
@@ -0,0 +1,187 @@
+# coding: utf-8
+
+import unittest
+
+import sqlalchemy as sa
+from sqlalchemy.orm import relationship, sessionmaker, scoped_session
+from sqlalchemy.ext.declarative import declarative_base
+
+from eor_rest.config import config
+from eor_rest.deserialize import update_entity_from_appstruct
+from eor_rest.model import RestMixin
+
+
+Base = declarative_base()
+
+article_tag = sa.Table('article_tag', Base.metadata,
+    sa.Column('article_id', sa.Integer, sa.ForeignKey('article.id'), primary_key=True),
+    sa.Column('tag_id', sa.Integer, sa.ForeignKey('tag.id'), primary_key=True))
+
+section_tag = sa.Table('section_tag', Base.metadata,
+    sa.Column('section_id', sa.Integer, sa.ForeignKey('section.id'), primary_key=True),
+    sa.Column('tag_id', sa.Integer, sa.ForeignKey('tag.id'), primary_key=True))
+
+
+class Article(RestMixin, Base):
+    __tablename__ = 'article'
+
+    id = sa.Column(sa.Integer, primary_key=True)
+    title = sa.Column(sa.Unicode)
+    tags = relationship('Tag', secondary=article_tag, order_by='Tag.id')
+    comments = relationship('Comment', cascade='all, delete-orphan', order_by='Comment.id')
+    notes = relationship('Note', order_by='Note.id')
+    sections = relationship('Section', cascade='all, delete-orphan', order_by='Section.id')
+
+
+class Tag(RestMixin, Base):
+    __tablename__ = 'tag'
+
+    id = sa.Column(sa.Integer, primary_key=True)
+    name = sa.Column(sa.Unicode)
+
+
+class Comment(RestMixin, Base):
+    __tablename__ = 'comment'
+
+    id = sa.Column(sa.Integer, primary_key=True)
+    text = sa.Column(sa.Unicode)
+    hidden = sa.Column(sa.Boolean, default=False)
+    article_id = sa.Column(sa.Integer, sa.ForeignKey('article.id'))
+
+    related_calls = []
+
+    @classmethod
+    def rest_get_related(cls, ids, containing_obj, key):
+        cls.related_calls.append(sorted(ids))
+        # hidden comments are not editable
+        return [obj for obj in super(Comment, cls).rest_get_related(ids, containing_obj, key) if not obj.hidden]
+
+
+class Note(RestMixin, Base):
+    __tablename__ = 'note'
+
+    id = sa.Column(sa.Integer, primary_key=True)
+    text = sa.Column(sa.Unicode)
+    article_id = sa.Column(sa.Integer, sa.ForeignKey('article.id'))
+
+
+class Section(RestMixin, Base):
+    __tablename__ = 'section'
+
+    id = sa.Column(sa.Integer, primary_key=True)
+    text = sa.Column(sa.Unicode)
+    article_id = sa.Column(sa.Integer, sa.ForeignKey('article.id'))
+    tags = relationship('Tag', secondary=section_tag)
+
+
+class SessionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        engine = sa.create_engine('sqlite://')
+        sa.event.listen(engine, 'connect', lambda connection, record: connection.execute('PRAGMA foreign_keys=ON'))
+        Base.metadata.create_all(engine)
+
+        self.statements = []
+        sa.event.listen(engine, 'before_cursor_execute',
+            lambda conn, cursor, statement, *args: self.statements.append(statement))
+
+        self.saved_session = config.sqlalchemy_session
+        config.sqlalchemy_session = self.session = scoped_session(sessionmaker(bind=engine))
+
+        self.session.add_all([Tag(id=i, name='t%d' % i) for i in range(1, 4)])
+        self.article = Article(id=1, title='a')
+        self.session.add(self.article)
+        self.session.flush()
+
+    def tearDown(self):
+        self.session.remove()
+        config.sqlalchemy_session = self.saved_session
+
+
+class UpdateManyToManyTest(SessionTestCase):
+
+    def test_dicts(self):
+        update_entity_from_appstruct(self.article, {'tags': [{'id': 3}, {'id': 1}]})
+        self.assertEqual(sorted(tag.id for tag in self.article.tags), [1, 3])
+
+    def test_ids(self):
+        update_entity_from_appstruct(self.article, {'tags': [2, '3']})
+        self.assertEqual(sorted(tag.id for tag in self.article.tags), [2, 3])
+
+
+class UpdateOneToManyTest(SessionTestCase):
+
+    def setUp(self):
+        super(UpdateOneToManyTest, self).setUp()
+
+        self.session.add_all([
+            Comment(id=1, text='c1', article_id=1),
+            Comment(id=2, text='c2', article_id=1),
+            Comment(id=3, text='c3', article_id=1, hidden=True),
+            Note(id=1, text='n1', article_id=1),
+            Note(id=2, text='n2', article_id=1),
+        ])
+        self.session.commit()
+        self.article = self.session.query(Article).get(1)
+        del Comment.related_calls[:]
+        del self.statements[:]
+
+    def comments(self):
+        return [(c.id, c.text, c.article_id) for c in self.session.query(Comment).order_by(Comment.id)]
+
+    def test_update_without_loading_collection(self):
+        update_entity_from_appstruct(self.article, {'comments': [{'id': 1, 'text': 'changed'}, {'text': 'new'}]})
+        self.session.flush()
+
+        self.assertEqual(Comment.related_calls, [[1]])
+        self.assertFalse([st for st in self.statements if st.startswith('SELECT') and 'comment.id IN' not in st])
+        self.assertEqual([c[1:] for c in self.comments()], [('changed', 1), ('new', 1)])
+
+    def test_related_hook_scopes_children(self):
+        update_entity_from_appstruct(self.article, {'comments': [{'id': 2}, {'id': 3, 'text': 'hidden'}]})
+        self.session.flush()
+
+        # comment 3 is not returned by the hook: replaced by a new comment with its id
+        self.assertEqual(Comment.related_calls, [[2, 3]])
+        self.assertEqual(self.comments(), [(2, 'c2', 1), (3, 'hidden', 1)])
+        self.assertFalse(self.session.query(Comment).get(3).hidden)
+
+    def test_remove_without_delete_orphan(self):
+        update_entity_from_appstruct(self.article, {'notes': [{'id': 2}]})
+        self.session.flush()
+
+        self.assertEqual([(n.id, n.article_id) for n in self.session.query(Note).order_by(Note.id)],
+            [(1, None), (2, 1)])
+
+    def test_loaded_collection(self):
+        self.assertEqual(len(self.article.comments), 3)
+
+        update_entity_from_appstruct(self.article, {'comments': [{'id': 2, 'text': 'changed'}]})
+        self.session.flush()
+
+        self.assertEqual([c.id for c in self.article.comments], [2])
+        self.assertEqual(self.comments(), [(2, 'changed', 1)])
+
+    def test_new_containing_obj(self):
+        article = Article(id=2, title='b')
+        self.session.add(article)
+        update_entity_from_appstruct(article, {'comments': [{'text': 'first'}]})
+        self.session.flush()
+
+        self.assertEqual([c.text for c in article.comments], ['first'])
+        self.assertEqual(Comment.related_calls, [])
+
+    def test_remove_children_with_secondary_rows(self):
+        self.session.add_all([
+            Section(id=1, text='s1', article_id=1, tags=[self.session.query(Tag).get(1)]),
+            Section(id=2, text='s2', article_id=1, tags=[self.session.query(Tag).get(2)]),
+        ])
+        self.session.commit()
+        self.article = self.session.query(Article).get(1)
+
+        # the association rows of the removed section are deleted by the ORM before the section
+        update_entity_from_appstruct(self.article, {'sections': [{'id': 2}]})
+        self.session.flush()
+
+        self.assertEqual([s.id for s in self.session.query(Section)], [2])
+        self.assertEqual(list(self.session.execute(section_tag.select())), [(2, 2)])
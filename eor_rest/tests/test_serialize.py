@@ -0,0 +1,188 @@
+# coding: utf-8
+
+import json
+import unittest
+
+import sqlalchemy as sa
+from sqlalchemy.orm import relationship, sessionmaker
+from sqlalchemy.ext.associationproxy import association_proxy
+from sqlalchemy.ext.declarative import declarative_base
+
+from eor_rest import serialize
+from eor_rest.serialize import serialize_sqlalchemy_obj, serialize_sqlalchemy_list
+
+
+def reference_serialize_obj(obj, field_spec):
+    """
+    The serializer before compiled plans, resolving field_spec against the mapper on every call
+    """
+    if obj is None:
+        return None
+
+    extras = None
+    try:
+        obj = obj[0]
+        extras = obj[1:]
+    except:
+        pass
+
+    mapper = sa.inspect(obj.__class__)
+
+    fields = {}
+
+    if field_spec.get('*', False):
+        for p in mapper.column_attrs:
+            fields[p.key] = True
+
+    for k in mapper.attrs.keys():
+        info = mapper.all_orm_descriptors[k].info
+        if 'er_serialize' in info:
+            fields[k] = info['er_serialize']
+
+    fields.update(field_spec)
+
+    for k in mapper.attrs.keys():
+        info = mapper.all_orm_descriptors[k].info
+        if 'er_ser_fn' in info and fields.get(k) == True:
+            fields[k] = info['er_ser_fn']
+
+    res = dict()
+
+    for key, control in fields.items():
+        if key == '*' or control == False:
+            continue
+
+        if callable(control):
+            res[key] = serialize._serialize_value(control(obj, *(extras or [])))
+            continue
+
+        try:
+            obj_attr = getattr(obj, key)
+        except AttributeError:
+            continue
+
+        prop = mapper.attrs.get(key)
+
+        if isinstance(control, dict):
+            if prop.uselist:
+                res[key] = [reference_serialize_obj(e, control) for e in obj_attr]
+            else:
+                res[key] = reference_serialize_obj(obj_attr, control)
+        elif control == True:
+            res[key] = serialize._serialize_value(obj_attr)
+
+    return res
+
+
+Base = declarative_base()
+
+book_tag = sa.Table('book_tag', Base.metadata,
+    sa.Column('book_id', sa.Integer, sa.ForeignKey('book.id'), primary_key=True),
+    sa.Column('tag_id', sa.Integer, sa.ForeignKey('tag.id'), primary_key=True))
+
+
+class Writer(Base):
+    __tablename__ = 'writer'
+
+    id = sa.Column(sa.Integer, primary_key=True)
+    name = sa.Column(sa.Unicode)
+    email = sa.Column(sa.Unicode, info={'er_ser_fn': lambda obj, *extras: obj.email.lower()})
+    password_hash = sa.Column(sa.Unicode, info={'er_serialize': False})
+
+
+class Book(Base):
+    __tablename__ = 'book'
+
+    id = sa.Column(sa.Integer, primary_key=True)
+    title = sa.Column(sa.Unicode)
+    summary = sa.Column(sa.Unicode, info={'er_serialize': True})
+    writer_id = sa.Column(sa.Integer, sa.ForeignKey('writer.id'))
+    writer = relationship('Writer')
+    chapters = relationship('Chapter', order_by='Chapter.id')
+    tags = relationship('Tag', secondary=book_tag, order_by='Tag.id')
+    tag_names = association_proxy('tags', 'name')
+
+
+class Chapter(Base):
+    __tablename__ = 'chapter'
+
+    id = sa.Column(sa.Integer, primary_key=True)
+    title = sa.Column(sa.Unicode)
+    book_id = sa.Column(sa.Integer, sa.ForeignKey('book.id'))
+
+
+class Tag(Base):
+    __tablename__ = 'tag'
+
+    id = sa.Column(sa.Integer, primary_key=True)
+    name = sa.Column(sa.Unicode)
+
+
+field_specs = [
+    {'*': True},
+    {'title': True},
+    {'title': True, 'summary': False},
+    {'*': True, 'writer': {'*': True}},
+    {'*': True, 'writer': {'name': True, 'email': True, 'password_hash': True}},
+    {'*': True, 'writer': False, 'writer_id': False},
+    {'*': True, 'chapters': {'*': True}, 'tag_names': True},
+    {'id': True, 'tags': {'name': True}, 'chapters': {'title': True}},
+    {'*': True, 'title': lambda obj, *extras: obj.title.upper(), 'n_chapters': lambda obj, *extras: len(obj.chapters)},
+    {'*': True, 'nothing': True},
+]
+
+
+class EquivalenceTest(unittest.TestCase):
+    """
+    Compiled plans produce the output of the serializer they replaced, key order included
+    """
+
+    def setUp(self):
+        engine = sa.create_engine('sqlite://')
+        Base.metadata.create_all(engine)
+        self.session = sessionmaker(bind=engine)()
+
+        writer = Writer(id=1, name='W', email='W@Example.com', password_hash='x')
+        tags = [Tag(id=1, name='t1'), Tag(id=2, name='t2')]
+        self.session.add_all([
+            Book(id=1, title='b1', summary='s1', writer=writer, tags=tags,
+                chapters=[Chapter(id=1, title='c1'), Chapter(id=2, title='c2')]),
+            Book(id=2, title='b2'),
+        ])
+        self.session.commit()
+
+        serialize._plans.clear()
+
+    def tearDown(self):
+        self.session.close()
+
+    def books(self):
+        return self.session.query(Book).order_by(Book.id).all()
+
+    def assertSameOutput(self, new, old, field_spec):
+        self.assertEqual(json.dumps(new), json.dumps(old), field_spec)
+
+    def test_objects(self):
+        for field_spec in field_specs:
+            for book in self.books():
+                # the second call runs the cached plan
+                for n in range(2):
+                    self.assertSameOutput(serialize_sqlalchemy_obj(book, field_spec),
+                        reference_serialize_obj(book, field_spec), field_spec)
+
+    def test_lists(self):
+        for field_spec in field_specs:
+            books = self.books() + [None]
+            self.assertSameOutput(serialize_sqlalchemy_list(books, field_spec),
+                [reference_serialize_obj(book, field_spec) for book in books], field_spec)
+
+    def test_extras(self):
+        # rows of Session().query(entity, extra columns)
+        rows = (self.session.query(Book, sa.literal_column("'extra'").label('extra'))
+            .order_by(Book.id).all())
+
+        for field_spec in field_specs + [{'*': True, 'extras': lambda obj, *extras: list(extras)}]:
+            self.assertSameOutput(serialize_sqlalchemy_list(rows, field_spec),
+                [reference_serialize_obj(row, field_spec) for row in rows], field_spec)
+            self.assertSameOutput(serialize_sqlalchemy_obj(rows[0], field_spec),
+                reference_serialize_obj(rows[0], field_spec), field_spec)
@@ -0,0 +1,152 @@
+# coding: utf-8
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import sqlalchemy as sa
+from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.ext.declarative import declarative_base
+
+from pyramid.config import Configurator
+from pyramid.request import Request
+
+from eor_rest import RestAPI, RestDelegate, RestMixin
+from eor_rest.config import config
+from eor_rest.sessions import SessionRouter, reading
+
+
+Base = declarative_base()
+
+
+class Item(RestMixin, Base):
+    __tablename__ = 'item'
+
+    id = sa.Column(sa.Integer, primary_key=True)
+    name = sa.Column(sa.Unicode)
+
+
+api = RestAPI('test-sessions')
+
+
+@api.endpoint()
+class ItemEndpoint(RestDelegate):
+    entity = Item
+    etags = False
+
+    @api.custom_coll('GET', read_only=True)
+    def names(self):
+        return {'status': 'ok', 'names': [item.name for item in Item.rest_get_list({})[1]]}
+
+    @api.custom_coll('GET')
+    def fresh_names(self):
+        return {'status': 'ok', 'names': [item.name for item in Item.rest_get_list({})[1]]}
+
+
+@api.endpoint()
+class FreshItemEndpoint(ItemEndpoint):
+    name = 'fresh-item'
+    use_read_session = False
+
+
+class SessionRouterTest(unittest.TestCase):
+    """
+    Primary in one SQLite file, the read session on a stale copy of it
+    """
+
+    def setUp(self):
+        self.saved_config = dict(config.__dict__)
+        self.dir = tempfile.mkdtemp()
+        primary_path = os.path.join(self.dir, 'primary.db')
+        replica_path = os.path.join(self.dir, 'replica.db')
+
+        self.primary = sa.create_engine('sqlite:///' + primary_path)
+        Base.metadata.create_all(self.primary)
+        with self.primary.begin() as connection:
+            connection.execute(Item.__table__.insert(), [{'id': 1, 'name': 'old'}])
+
+        shutil.copy(primary_path, replica_path)
+        self.replica = sa.create_engine('sqlite:///' + replica_path)
+
+        with self.primary.begin() as connection:
+            connection.execute(Item.__table__.insert(), [{'id': 2, 'name': 'new'}])
+
+        self.write = scoped_session(sessionmaker(bind=self.primary))
+        self.read = scoped_session(sessionmaker(bind=self.replica))
+
+        with Configurator(settings={
+                    'eor_rest.sqlalchemy_session': self.write,
+                    'eor_rest.sqlalchemy_read_session': self.read,
+                    'eor_rest.do_csrf_checks': 'false'}) as configurator:
+            configurator.include('eor_rest')
+            configurator.add_request_method(lambda request: None, 'user', reify=True)
+            api.add_routes(configurator, compact=True)
+            self.app = configurator.make_wsgi_app()
+
+        self.router = config.sqlalchemy_session
+
+    def tearDown(self):
+        self.write.remove()
+        self.read.remove()
+        self.primary.dispose()
+        self.replica.dispose()
+        shutil.rmtree(self.dir)
+        config.__dict__.update(self.saved_config)
+
+    def names(self):
+        return sorted(item.name for item in self.router.query(Item))
+
+    def get(self, path):
+        return Request.blank(path).get_response(self.app).json_body
+
+    def test_router_installed(self):
+        self.assertIsInstance(self.router, SessionRouter)
+        self.assertIs(self.router.write, self.write)
+        self.assertIs(self.router.read, self.read)
+
+    def test_reading(self):
+        self.assertEqual(self.names(), ['new', 'old'])
+
+        with self.router.reading():
+            self.assertIs(self.router(), self.read())
+            self.assertEqual(self.names(), ['old'])
+
+        with reading(False):
+            self.assertEqual(self.names(), ['new', 'old'])
+
+        self.assertIs(self.router(), self.write())
+
+    def test_has_written(self):
+        self.write.rollback()
+        self.assertFalse(self.router.has_written())
+
+        self.router.add(Item(id=3, name='pending'))
+        self.assertTrue(self.router.has_written())
+
+        self.write.flush()
+        self.assertTrue(self.router.has_written())
+
+        # reads after a write stay on the primary
+        with self.router.reading():
+            self.assertEqual(self.names(), ['new', 'old', 'pending'])
+
+        self.write.commit()
+        self.assertFalse(self.router.has_written())
+
+        with self.router.reading():
+            self.assertEqual(self.names(), ['old'])
+
+    def test_write_to_read_session(self):
+        with self.router.reading():
+            self.router.add(Item(id=3, name='lost'))
+            self.assertRaises(RuntimeError, self.router.flush)
+
+    def test_views(self):
+        self.assertEqual([el['name'] for el in self.get('/rest/item')['data']], ['old'])
+        self.assertEqual(self.get('/rest/item/names')['names'], ['old'])
+        self.assertEqual(self.get('/rest/item/fresh_names')['names'], ['old', 'new'])
+
+    def test_use_read_session_opt_out(self):
+        self.assertEqual([el['name'] for el in self.get('/rest/fresh-item?o=id')['data']], ['old', 'new'])
+        self.assertEqual(self.get('/rest/fresh-item/2')['data']['name'], 'new')
@@ -0,0 +1,75 @@
+# coding: utf-8
+
+import unittest
+
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
+from eor_rest.txqueue import TransactionQueue
+
+
+committed = []
+
+# listeners stay installed on Session, one queue per key as in the library
+queue = TransactionQueue('eor_rest_test', lambda session, values: committed.append(values))
+
+
+class TransactionQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        del committed[:]
+        self.committed = committed
+        self.queue = queue
+        self.session = Session(sa.create_engine('sqlite://'))
+        self.session.execute(sa.text('SELECT 1'))
+
+    def tearDown(self):
+        self.session.close()
+
+    def test_commit(self):
+        self.queue.add(self.session, 1)
+        self.queue.add(self.session, 2)
+        self.assertEqual(self.queue.get(self.session), [1, 2])
+        self.assertEqual(self.committed, [])
+
+        self.session.commit()
+        self.assertEqual(self.committed, [[1, 2]])
+        self.assertEqual(self.queue.get(self.session), [])
+
+    def test_rollback(self):
+        self.queue.add(self.session, 1)
+        self.session.rollback()
+        self.session.commit()
+        self.assertEqual(self.committed, [])
+
+    def test_savepoint_rollback(self):
+        self.queue.add(self.session, 1)
+
+        savepoint = self.session.begin_nested()
+        self.queue.add(self.session, 2)
+        self.session.begin_nested()
+        self.queue.add(self.session, 3)
+        savepoint.rollback()
+
+        self.queue.add(self.session, 4)
+        self.session.commit()
+        self.assertEqual(self.committed, [[1, 4]])
+
+    def test_savepoint_release(self):
+        savepoint = self.session.begin_nested()
+        self.queue.add(self.session, 1)
+        savepoint.commit()
+        self.assertEqual(self.committed, [])
+
+        self.session.commit()
+        self.assertEqual(self.committed, [[1]])
+
+    def test_released_savepoint_rolled_back_with_outer_savepoint(self):
+        outer = self.session.begin_nested()
+        inner = self.session.begin_nested()
+        self.queue.add(self.session, 1)
+        inner.commit()
+        outer.rollback()
+
+        self.session.commit()
+        self.assertEqual(self.committed, [])
@@ -0,0 +1,1029 @@
+# coding: utf-8
+
+import datetime
+import json
+import unittest
+from unittest import mock
+
+import sqlalchemy as sa
+from sqlalchemy.orm import relationship, sessionmaker, scoped_session
+from sqlalchemy.orm.exc import NoResultFound
+from sqlalchemy.ext.declarative import declarative_base
+from voluptuous import Schema, Required, Optional
+
+from pyramid.config import Configurator
+from pyramid.request import Request
+
+from eor_rest import RestAPI, RestDelegate, RestMixin
+from eor_rest import delegate, files, model, serialize
+from eor_rest.config import config
+
+
+Base = declarative_base()
+
+
+class Author(RestMixin, Base):
+    __tablename__ = 'author'
+
+    id = sa.Column(sa.Integer, primary_key=True)
+    name = sa.Column(sa.Unicode, nullable=False, unique=True)
+    rating = sa.Column(sa.Integer, default=0)
+
+
+class Document(RestMixin, Base):
+    __tablename__ = 'document'
+
+    id = sa.Column(sa.Integer, primary_key=True)
+    title = sa.Column(sa.Unicode, nullable=False)
+    version = sa.Column(sa.Integer, nullable=False)
+
+    __mapper_args__ = {'version_id_col': version}
+
+
+class Post(RestMixin, Base):
+    __tablename__ = 'post'
+
+    id = sa.Column(sa.Integer, primary_key=True)
+    title = sa.Column(sa.Unicode, nullable=False)
+    hidden = sa.Column(sa.Boolean, nullable=False, default=False)
+    version = sa.Column(sa.Integer, nullable=False, default=1, onupdate=sa.literal_column('version') + 1,
+        info={'er_version': True})
+    comments = relationship('PostComment', order_by='PostComment.id')
+
+    @classmethod
+    def get_visible(cls, id):
+        obj = cls.rest_get_by_id(id)
+        if obj.hidden:
+            raise NoResultFound
+        return obj
+
+    @classmethod
+    def get_visible_list(cls, query_params):
+        query_params = dict(query_params, filters=dict(query_params.get('filters', {}), e_hidden='false'))
+        return cls.rest_get_list(query_params)
+
+
+class Page(RestMixin, Base):
+    __tablename__ = 'page'
+
+    id = sa.Column(sa.Integer, primary_key=True)
+    title = sa.Column(sa.Unicode)
+    hidden = sa.Column(sa.Boolean, nullable=False, default=False)
+
+    @classmethod
+    def rest_get_by_id(cls, id):
+        obj = super(Page, cls).rest_get_by_id(id)
+        if obj.hidden:
+            raise NoResultFound
+        return obj
+
+
+class PostComment(RestMixin, Base):
+    __tablename__ = 'post_comment'
+
+    id = sa.Column(sa.Integer, primary_key=True)
+    text = sa.Column(sa.Unicode)
+    post_id = sa.Column(sa.Integer, sa.ForeignKey('post.id'))
+
+
+class Attachment(RestMixin, Base):
+    __tablename__ = 'attachment'
+
+    id = sa.Column(sa.Integer, primary_key=True)
+    folder = sa.Column(sa.Integer)
+    file_id = sa.Column(sa.Unicode, info={'efs_category': 'attachments'})
+
+
+api = RestAPI('test-views')
+invalid_api = RestAPI('test-views-invalid')  # registrations that must fail
+other_api = RestAPI('test-views-other')  # mounted at /other
+
+
+@api.endpoint()
+class AuthorEndpoint(RestDelegate):
+    entity = Author
+
+    def get_schema(self):
+        return Schema({
+            Required('name'): str,
+            Optional('rating'): int
+        })
+
+
+@api.endpoint()
+class HookedAuthorEndpoint(AuthorEndpoint):
+    name = 'hooked-author'
+    updated = []
+
+    def before_update(self, obj, deserialized):
+        self.updated.append(obj.id)
+
+
+@api.endpoint()
+class SchemaAuthorEndpoint(AuthorEndpoint):
+    name = 'schema-author'
+    modes = []
+
+    def get_schema(self):
+        self.modes.append(self.mode)
+        schema = super(SchemaAuthorEndpoint, self).get_schema()
+        if self.mode == 'UPDATE':
+            # PUT and PATCH only
+            schema = schema.extend({Optional('rating'): int})
+        return schema
+
+
+@api.endpoint()
+class CachedSchemaAuthorEndpoint(SchemaAuthorEndpoint):
+    name = 'cached-schema-author'
+    cache_schema = True
+
+
+@api.endpoint()
+class BulkAuthorEndpoint(AuthorEndpoint):
+    name = 'bulk-author'
+    allow_bulk = True
+    permission = {'POST': 'editor', 'PUT': 'editor', 'DELETE': 'editor'}
+
+
+@api.endpoint()
+class CheckedBulkAuthorEndpoint(BulkAuthorEndpoint):
+    name = 'checked-bulk-author'
+    updated = []
+
+    def get_schema(self):
+        # author 1 keeps its name
+        if self.mode == 'UPDATE' and self.obj.id == 1:
+            return Schema({Optional('rating'): int})
+        return super(CheckedBulkAuthorEndpoint, self).get_schema()
+
+    def before_update(self, obj, deserialized):
+        self.updated.append((obj.id, self.obj.id))
+
+
+@api.endpoint()
+class CountedAuthorEndpoint(AuthorEndpoint):
+    name = 'counted'
+    count_strategy = 'cached'
+
+
+@api.endpoint()
+class UncountedAuthorEndpoint(AuthorEndpoint):
+    name = 'uncounted-author'
+    count_strategy = 'none'
+
+
+@api.endpoint()
+class EstimatedAuthorEndpoint(AuthorEndpoint):
+    name = 'estimated-author'
+    count_strategy = 'estimated'
+
+
+@api.endpoint()
+class KeysetAuthorEndpoint(AuthorEndpoint):
+    name = 'keyset-author'
+    keyset_pagination = True
+
+
+@api.endpoint()
+class StreamedAuthorEndpoint(UncountedAuthorEndpoint):
+    name = 'streamed-author'
+    stream = True
+    stream_chunk_size = 2
+
+
+@other_api.endpoint()
+class CountedPostEndpoint(RestDelegate):
+    name = 'counted'
+    entity = Post
+    count_strategy = 'cached'
+
+
+@api.endpoint()
+class DocumentEndpoint(RestDelegate):
+    entity = Document
+
+    def get_schema(self):
+        return Schema({Required('title'): str})
+
+
+@api.endpoint()
+class PostEndpoint(RestDelegate):
+    entity = Post
+
+    def get_schema(self):
+        return Schema({Optional('title'): str})
+
+
+@api.endpoint()
+class VisiblePostEndpoint(PostEndpoint):
+    name = 'visible-post'
+    entity_getter = 'get_visible'
+    entity_list_getter = 'get_visible_list'
+
+
+@api.endpoint()
+class PageEndpoint(RestDelegate):
+    entity = Page
+
+    def get_schema(self):
+        return Schema({Optional('title'): str})
+
+
+@api.endpoint()
+class PostWithCommentsEndpoint(PostEndpoint):
+    name = 'post-with-comments'
+
+    def get_fields_for_coll(self):
+        return {'*': True, 'comments': {'*': True}}
+
+    def get_fields_for_obj(self):
+        return {'*': True, 'comments': {'*': True}}
+
+
+@api.endpoint()
+class ProjectedAuthorEndpoint(AuthorEndpoint):
+    name = 'projected-author'
+    projection = True
+
+
+@api.endpoint()
+class ProjectedPostEndpoint(PostWithCommentsEndpoint):
+    name = 'projected-post'
+    projection = True
+
+
+@api.endpoint()
+class AttachmentEndpoint(RestDelegate):
+    entity = Attachment
+    allow_delete_by_filter = True
+    delete_by_filter_max_rows = 3
+
+
+@api.endpoint()
+class AttachmentResponseEndpoint(AttachmentEndpoint):
+    name = 'attachment-response'
+
+    def delete_response(self, obj):
+        return {'status': 'ok', 'id': obj.id}
+
+
+@api.endpoint()
+class HookedAttachmentEndpoint(AttachmentEndpoint):
+    name = 'hooked-attachment'
+    deleted = []
+
+    def before_delete(self, obj):
+        self.deleted.append(obj.id)
+
+
+class SecurityPolicy(object):
+    """
+    Grants the permission named by the X-Role header
+    """
+
+    def identity(self, request):
+        return None
+
+    def authenticated_userid(self, request):
+        return None
+
+    def permits(self, request, context, permission):
+        return request.headers.get('X-Role') == permission
+
+
+def transaction_tween_factory(handler, registry):
+    """
+    Commit the session after the request unless it raised, as pyramid_tm does
+    """
+    def tween(request):
+        try:
+            response = handler(request)
+            if request.exception is None:
+                config.sqlalchemy_session.commit()
+            else:
+                config.sqlalchemy_session.rollback()
+            return response
+        except:
+            config.sqlalchemy_session.rollback()
+            raise
+        finally:
+            config.sqlalchemy_session.remove()
+
+    return tween
+
+
+class ViewsTestCase(unittest.TestCase):
+
+    settings = {}
+
+    compact = False
+
+    def setUp(self):
+        self.saved_config = dict(config.__dict__)
+
+        self.engine = sa.create_engine('sqlite://')
+        Base.metadata.create_all(self.engine)
+
+        self.statements = []
+        sa.event.listen(self.engine, 'before_cursor_execute',
+            lambda conn, cursor, statement, *args: self.statements.append(statement))
+
+        self.session = scoped_session(sessionmaker(bind=self.engine))
+
+        settings = {
+            'eor_rest.sqlalchemy_session': self.session,
+            'eor_rest.do_csrf_checks': 'false',
+        }
+        settings.update(self.settings)
+
+        with Configurator(settings=settings) as configurator:
+            configurator.include('eor_rest')
+            configurator.set_security_policy(SecurityPolicy())
+            configurator.add_request_method(lambda request: None, 'user', reify=True)
+            configurator.add_tween('eor_rest.tests.test_views.transaction_tween_factory')
+            api.add_routes(configurator, compact=self.compact)
+            other_api.add_routes(configurator, url_prefix='/other')
+            self.app = configurator.make_wsgi_app()
+
+        self.session.add_all([Author(id=i, name='a%d' % i, rating=i) for i in range(1, 4)])
+        self.session.add(Document(id=1, title='d1'))
+        self.session.add_all([Post(id=i, title='p%d' % i) for i in range(1, 3)])
+        self.session.add(PostComment(id=1, text='c1', post_id=1))
+        self.session.add_all([Page(id=1, title='visible'), Page(id=2, title='hidden', hidden=True)])
+        self.session.commit()
+        self.session.remove()
+
+    def tearDown(self):
+        self.session.remove()
+        config.__dict__.update(self.saved_config)
+
+    def call(self, method, path, body=None, headers=None):
+        """
+        :return: webob Response
+        """
+        request = Request.blank(path, method=method, headers=headers or {})
+        if body is not None:
+            request.content_type = 'application/json'
+            request.body = json.dumps(body).encode('utf-8')
+
+        del self.statements[:]
+        return request.get_response(self.app)
+
+    def authors(self):
+        return [(a.id, a.name, a.rating) for a in self.session.query(Author).order_by(Author.id)]
+
+    def execute(self, statement):
+        self.session.execute(sa.text(statement))
+        self.session.commit()
+        self.session.remove()
+
+
+class PatchTest(ViewsTestCase):
+
+    def test_single_update(self):
+        resp = self.call('PATCH', '/rest/author/2', {'rating': 7})
+
+        self.assertEqual(resp.json_body, {'status': 'ok'})
+        self.assertEqual([st.split()[0] for st in self.statements], ['UPDATE'])
+        self.assertEqual(self.authors(), [(1, 'a1', 1), (2, 'a2', 7), (3, 'a3', 3)])
+
+    def test_hook_loads_object(self):
+        del HookedAuthorEndpoint.updated[:]
+
+        resp = self.call('PATCH', '/rest/hooked-author/2', {'rating': 7})
+
+        self.assertEqual(resp.json_body, {'status': 'ok'})
+        self.assertEqual(HookedAuthorEndpoint.updated, [2])
+        self.assertTrue(any(st.startswith('SELECT') for st in self.statements))
+        self.assertEqual(self.authors()[1], (2, 'a2', 7))
+
+    def test_can_update_columns(self):
+        self.assertFalse(Author.rest_can_update_columns(['id']))
+        self.assertTrue(Author.rest_can_update_columns(['name', 'rating']))
+
+    def test_version_id_col(self):
+        self.assertFalse(Document.rest_can_update_columns(['title']))
+
+        resp = self.call('PATCH', '/rest/document/1', {'title': 'changed'})
+
+        self.assertEqual(resp.json_body, {'status': 'ok'})
+        self.assertTrue(any(st.startswith('SELECT') for st in self.statements))
+        document = self.session.query(Document).get(1)
+        self.assertEqual((document.title, document.version), ('changed', 2))
+
+    def test_not_found(self):
+        for path in ('/rest/author/99', '/rest/author/abc', '/rest/document/99', '/rest/document/abc'):
+            resp = self.call('PATCH', path, {'rating': 7} if 'author' in path else {'title': 'x'})
+            self.assertEqual(resp.json_body['code'], 'object-not-found', path)
+
+        self.assertEqual(self.authors(), [(1, 'a1', 1), (2, 'a2', 2), (3, 'a3', 3)])
+
+    def test_invalid(self):
+        resp = self.call('PATCH', '/rest/author/2', {'rating': 'many'})
+        self.assertEqual(resp.json_body['code'], 'invalid')
+
+    def test_schema_mode(self):
+        del SchemaAuthorEndpoint.modes[:]
+
+        self.call('PATCH', '/rest/schema-author/1', {'rating': 7})
+        self.call('PUT', '/rest/schema-author/1', {'name': 'a1', 'rating': 8})
+        self.call('POST', '/rest/schema-author', {'name': 'a4'})
+
+        self.assertEqual(SchemaAuthorEndpoint.modes, ['UPDATE', 'UPDATE', 'CREATE'])
+        self.assertEqual(self.authors()[0], (1, 'a1', 8))
+
+    def test_schema_cache(self):
+        del SchemaAuthorEndpoint.modes[:]
+        delegate._schemas.clear()
+
+        for i in range(2):
+            self.call('PATCH', '/rest/schema-author/1', {'rating': i})
+            self.call('PATCH', '/rest/cached-schema-author/1', {'rating': i})
+            self.call('PUT', '/rest/cached-schema-author/1', {'name': 'a1'})
+
+        # built per request unless cache_schema is set; PATCH and PUT schemas are cached apart
+        self.assertEqual(SchemaAuthorEndpoint.modes, ['UPDATE'] * 4)
+        self.assertEqual(len(delegate._schemas), 2)
+
+
+class ETagTest(ViewsTestCase):
+
+    def revalidate(self, path):
+        """
+        :return: response to a request with the ETag of an unconditional GET of path
+        """
+        etag = self.call('GET', path).etag
+        resp = self.call('GET', path, headers={'If-None-Match': '"%s"' % etag})
+        self.assertEqual(resp.status_int, 304)
+
+        # the 304 carries the version ETag if there is one
+        return resp.etag
+
+    def conditional_get(self, path, etag):
+        return self.call('GET', path, headers={'If-None-Match': '"%s"' % etag})
+
+    def test_item_not_modified(self):
+        etag = self.revalidate('/rest/post/1')
+
+        resp = self.conditional_get('/rest/post/1', etag)
+        self.assertEqual(resp.status_int, 304)
+        # answered from the version alone
+        self.assertEqual(len(self.statements), 1)
+        self.assertIn('post.version', self.statements[0])
+
+    def test_item_changed(self):
+        etag = self.revalidate('/rest/post/1')
+
+        self.call('PATCH', '/rest/post/1', {'title': 'changed'})
+
+        resp = self.conditional_get('/rest/post/1', etag)
+        self.assertEqual(resp.status_int, 200)
+        self.assertEqual(resp.json_body['data']['title'], 'changed')
+
+    def test_list_not_modified(self):
+        etag = self.revalidate('/rest/post')
+
+        resp = self.conditional_get('/rest/post', etag)
+        self.assertEqual(resp.status_int, 304)
+        self.assertEqual(len(self.statements), 1)
+
+    def test_list_changed(self):
+        etag = self.revalidate('/rest/post')
+
+        # post 1 does not hold the max version
+        self.call('PATCH', '/rest/post/2', {'title': 'changed'})
+        self.call('PATCH', '/rest/post/1', {'title': 'changed'})
+
+        resp = self.conditional_get('/rest/post', etag)
+        self.assertEqual(resp.status_int, 200)
+        self.assertEqual([el['title'] for el in resp.json_body['data']], ['changed', 'changed'])
+
+    def test_list_row_replaced(self):
+        etag = self.revalidate('/rest/post')
+
+        # same count, max and sum of versions
+        self.execute('DELETE FROM post_comment')
+        self.execute('DELETE FROM post WHERE id = 2')
+        self.execute("INSERT INTO post (id, title, hidden, version) VALUES (3, 'p3', 0, 1)")
+
+        resp = self.conditional_get('/rest/post', etag)
+        self.assertEqual(resp.status_int, 200)
+        self.assertEqual([el['title'] for el in resp.json_body['data']], ['p1', 'p3'])
+
+    def test_nested_changed(self):
+        for path in ('/rest/post-with-comments/1', '/rest/post-with-comments'):
+            etag = self.revalidate(path)
+
+            self.execute("UPDATE post_comment SET text = 'changed %s'" % path)
+
+            resp = self.conditional_get(path, etag)
+            self.assertEqual(resp.status_int, 200)
+            self.assertIn('changed %s' % path, resp.text)
+
+    def test_custom_getters(self):
+        item_etag = self.revalidate('/rest/visible-post/1')
+        list_etag = self.revalidate('/rest/visible-post')
+
+        # not tracked by the version column
+        self.execute('UPDATE post SET hidden = 1 WHERE id = 1')
+
+        resp = self.conditional_get('/rest/visible-post/1', item_etag)
+        self.assertEqual(resp.json_body['code'], 'object-not-found')
+
+        resp = self.conditional_get('/rest/visible-post', list_etag)
+        self.assertEqual(resp.status_int, 200)
+        self.assertEqual([el['id'] for el in resp.json_body['data']], [2])
+
+
+class DeleteByFilterTest(ViewsTestCase):
+
+    settings = {'eor_rest.file_store': 'eor_rest.files.local_file_store'}
+
+    def setUp(self):
+        super(DeleteByFilterTest, self).setUp()
+
+        files._store = None
+        del files.local_file_store.deleted[:]
+        del HookedAttachmentEndpoint.deleted[:]
+
+        # folder 1: 2 attachments, folder 2: 4
+        self.session.add_all([Attachment(id=i, folder=1 if i < 3 else 2, file_id='f%d' % i if i != 2 else None)
+            for i in range(1, 7)])
+        self.session.commit()
+        self.session.remove()
+
+    def tearDown(self):
+        files._store = None
+        super(DeleteByFilterTest, self).tearDown()
+
+    def attachments(self):
+        return [a.id for a in self.session.query(Attachment).order_by(Attachment.id)]
+
+    def delete_statements(self):
+        return [st for st in self.statements if st.startswith('DELETE')]
+
+    def test_set_based(self):
+        self.assertTrue(AttachmentEndpoint.entity.rest_can_delete_by_query())
+
+        resp = self.call('DELETE', '/rest/attachment?fe_folder=1')
+
+        self.assertEqual(resp.json_body, {'status': 'ok', 'count': 2, 'dry_run': False})
+        self.assertEqual(len(self.delete_statements()), 1)
+        self.assertEqual(self.attachments(), [3, 4, 5, 6])
+
+    def test_files_by_select(self):
+        self.call('DELETE', '/rest/attachment?fe_folder=1')
+
+        self.assertEqual(files.local_file_store.deleted, ['f1'])
+        self.assertTrue(any(st.startswith('SELECT attachment.file_id') for st in self.statements))
+
+    def test_files_by_returning(self):
+        from sqlalchemy.dialects.sqlite.base import SQLiteCompiler
+        from sqlalchemy.dialects.postgresql.base import PGCompiler
+
+        # SQLite >= 3.35 understands RETURNING, the dialect of this sqlalchemy version does not compile it
+        with mock.patch.object(model, '_returning_dialects', frozenset(['sqlite'])), \
+                mock.patch.object(SQLiteCompiler, 'returning_clause', PGCompiler.returning_clause, create=True):
+            resp = self.call('DELETE', '/rest/attachment?fe_folder=1')
+
+        self.assertEqual(resp.json_body['count'], 2)
+        self.assertEqual(files.local_file_store.deleted, ['f1'])
+        self.assertIn('RETURNING', self.delete_statements()[0])
+        self.assertFalse(any(st.startswith('SELECT attachment.file_id') for st in self.statements))
+        self.assertEqual(self.attachments(), [3, 4, 5, 6])
+
+    def test_dry_run(self):
+        resp = self.call('DELETE', '/rest/attachment?fe_folder=2&dry_run=1')
+
+        self.assertEqual(resp.json_body, {'status': 'ok', 'count': 4, 'dry_run': True})
+        self.assertEqual(self.delete_statements(), [])
+        self.assertEqual(self.attachments(), [1, 2, 3, 4, 5, 6])
+
+    def test_row_cap(self):
+        for path in ('/rest/attachment?fe_folder=2', '/rest/hooked-attachment?fe_folder=2'):
+            resp = self.call('DELETE', path)
+            self.assertEqual(resp.json_body['code'], 'too-many-rows', path)
+
+        self.assertEqual(self.attachments(), [1, 2, 3, 4, 5, 6])
+        self.assertEqual(files.local_file_store.deleted, [])
+
+    def test_no_filter(self):
+        resp = self.call('DELETE', '/rest/attachment')
+
+        self.assertEqual(resp.json_body['code'], 'no-filter')
+        self.assertEqual(self.attachments(), [1, 2, 3, 4, 5, 6])
+
+    def test_delete_response_override(self):
+        resp = self.call('DELETE', '/rest/attachment-response?fe_folder=1')
+
+        self.assertEqual(resp.json_body['count'], 2)
+        self.assertEqual(len(self.delete_statements()), 1)
+        self.assertFalse(any(st.startswith('SELECT attachment.id') for st in self.statements))
+
+    def test_hooks_load_objects(self):
+        resp = self.call('DELETE', '/rest/hooked-attachment?fe_folder=1')
+
+        self.assertEqual(resp.json_body['count'], 2)
+        self.assertEqual(HookedAttachmentEndpoint.deleted, [1, 2])
+        self.assertEqual(files.local_file_store.deleted, ['f1'])
+        self.assertEqual(self.attachments(), [3, 4, 5, 6])
+
+    def test_custom_list_getter(self):
+        class ScopedPostEndpoint(RestDelegate):
+            entity = Post
+            entity_list_getter = 'get_visible_list'
+            allow_delete_by_filter = True
+
+        class ScopedListEndpoint(RestDelegate):
+            entity = Post
+            allow_delete_by_filter = True
+
+            def get_obj_list(self, query_params):
+                return Post.get_visible_list(query_params)
+
+        for endpoint in (ScopedPostEndpoint, ScopedListEndpoint):
+            self.assertRaises(ValueError, invalid_api.endpoint(), endpoint)
+
+        self.assertEqual(invalid_api.delegates, {})
+
+
+class BulkTest(ViewsTestCase):
+
+    def bulk(self, method, body):
+        return self.call(method, '/rest/bulk-author/_bulk', body, headers={'X-Role': 'editor'}).json_body
+
+    def test_create(self):
+        resp = self.bulk('POST', [{'name': 'b1'}, {'name': 'b2', 'rating': 5}])
+
+        self.assertEqual(resp, {'status': 'ok', 'results': [{'status': 'ok', 'id': 4}, {'status': 'ok', 'id': 5}]})
+        self.assertEqual(self.authors()[3:], [(4, 'b1', 0), (5, 'b2', 5)])
+
+    def test_update(self):
+        resp = self.bulk('PUT', [{'id': 3, 'name': 'c3'}, {'id': 1, 'name': 'c1', 'rating': 9}])
+
+        self.assertEqual(resp, {'status': 'ok', 'results': [{'status': 'ok'}, {'status': 'ok'}]})
+        self.assertEqual(self.authors(), [(1, 'c1', 9), (2, 'a2', 2), (3, 'c3', 3)])
+
+    def test_delete(self):
+        resp = self.bulk('DELETE', [1, 3])
+
+        self.assertEqual(resp['status'], 'ok')
+        self.assertEqual(self.authors(), [(2, 'a2', 2)])
+
+    def test_invalid_item(self):
+        resp = self.bulk('POST', [{'name': 'b1'}, {'rating': 5}])
+
+        self.assertEqual(resp['code'], 'invalid')
+        self.assertEqual(list(resp['errors']), ['1'])
+        self.assertEqual(len(self.authors()), 3)
+
+    def test_missing_object(self):
+        resp = self.bulk('PUT', [{'id': 1, 'name': 'c1'}, {'id': 99, 'name': 'c99'}])
+        self.assertEqual(resp['errors'], {'1': 'object-not-found'})
+
+        resp = self.bulk('DELETE', [2, 99])
+        self.assertEqual(resp['errors'], {'1': 'object-not-found'})
+
+        self.assertEqual(self.authors(), [(1, 'a1', 1), (2, 'a2', 2), (3, 'a3', 3)])
+
+    def test_database_error_rolls_back(self):
+        # the second name is taken: the flush fails after the first object was written
+        resp = self.bulk('POST', [{'name': 'b1'}, {'name': 'a1'}])
+
+        self.assertEqual(resp['code'], 'database-error')
+        self.assertEqual(len(self.authors()), 3)
+
+        resp = self.bulk('PUT', [{'id': 1, 'name': 'c1'}, {'id': 2, 'name': 'a3'}])
+
+        self.assertEqual(resp['code'], 'database-error')
+        self.assertEqual(self.authors(), [(1, 'a1', 1), (2, 'a2', 2), (3, 'a3', 3)])
+
+    def test_permission(self):
+        for method, body in (('POST', [{'name': 'b1'}]), ('PUT', [{'id': 1, 'name': 'c1'}]), ('DELETE', [1])):
+            resp = self.call(method, '/rest/bulk-author/_bulk', body)
+            self.assertEqual(resp.status_int, 403, method)
+
+            resp = self.call(method, '/rest/bulk-author/_bulk', body, headers={'X-Role': 'reader'})
+            self.assertEqual(resp.status_int, 403, method)
+
+        self.assertEqual(self.authors(), [(1, 'a1', 1), (2, 'a2', 2), (3, 'a3', 3)])
+
+    def test_obj_per_item(self):
+        del CheckedBulkAuthorEndpoint.updated[:]
+        path = '/rest/checked-bulk-author/_bulk'
+
+        resp = self.call('PUT', path, [{'id': 2, 'name': 'c2'}, {'id': 1, 'name': 'c1'}],
+            headers={'X-Role': 'editor'}).json_body
+        self.assertEqual(resp['code'], 'invalid')
+        self.assertEqual(list(resp['errors']), ['1'])
+
+        resp = self.call('PUT', path, [{'id': 2, 'name': 'c2'}, {'id': 1, 'rating': 5}],
+            headers={'X-Role': 'editor'}).json_body
+        self.assertEqual(resp['status'], 'ok')
+        self.assertEqual(CheckedBulkAuthorEndpoint.updated, [(2, 2), (1, 1)])
+        self.assertEqual(self.authors(), [(1, 'a1', 5), (2, 'c2', 2), (3, 'a3', 3)])
+
+    def test_custom_getters(self):
+        class ScopedPostEndpoint(RestDelegate):
+            entity = Post
+            entity_getter = 'get_visible'
+            allow_bulk = True
+
+        class ScopedObjEndpoint(RestDelegate):
+            entity = Post
+            allow_bulk = True
+
+            def get_obj_by_id(self, field_spec=None):
+                return Post.get_visible(self.get_id_from_request())
+
+        for endpoint in (ScopedPostEndpoint, ScopedObjEndpoint):
+            self.assertRaises(ValueError, invalid_api.endpoint(), endpoint)
+
+        self.assertEqual(invalid_api.delegates, {})
+
+
+class CountStrategyTest(ViewsTestCase):
+
+    def setUp(self):
+        super(CountStrategyTest, self).setUp()
+        model.count_cache.clear()
+
+    def tearDown(self):
+        model.count_cache.clear()
+        super(CountStrategyTest, self).tearDown()
+
+    def get(self, path):
+        return self.call('GET', path).json_body
+
+    def count_statements(self):
+        return [st for st in self.statements if 'count(*)' in st]
+
+    def test_none(self):
+        resp = self.get('/rest/uncounted-author?o=id&l=2')
+        self.assertEqual((resp['count'], [el['id'] for el in resp['data']], resp['has_more']), (None, [1, 2], True))
+        self.assertEqual(self.count_statements(), [])
+
+        resp = self.get('/rest/uncounted-author?o=id&s=2&l=2')
+        self.assertEqual(([el['id'] for el in resp['data']], resp['has_more']), ([3], False))
+
+    def test_cached(self):
+        self.assertEqual(self.get('/rest/counted')['count'], 3)
+        self.assertEqual(len(self.count_statements()), 1)
+
+        self.session.add(Author(id=4, name='a4'))
+        self.session.commit()
+
+        resp = self.get('/rest/counted')
+        self.assertEqual((resp['count'], len(resp['data'])), (3, 4))
+        self.assertEqual(self.count_statements(), [])
+
+        self.assertEqual(self.get('/rest/counted?fgte_rating=2')['count'], 2)
+
+    def test_cached_per_api(self):
+        self.assertEqual(self.get('/rest/counted')['count'], 3)
+        self.assertEqual(self.get('/other/counted')['count'], 2)
+
+    def test_estimated(self):
+        # no estimator for sqlite: exact count
+        self.assertEqual(self.get('/rest/estimated-author')['count'], 3)
+
+        with mock.patch.dict(model.count_estimators, {'sqlite': lambda connection, query: 100}):
+            resp = self.get('/rest/estimated-author')
+
+        self.assertEqual((resp['count'], len(resp['data'])), (100, 3))
+        self.assertEqual(self.count_statements(), [])
+
+
+class StreamTest(ViewsTestCase):
+
+    def setUp(self):
+        super(StreamTest, self).setUp()
+        self.session.add_all([Author(id=i, name='a%d' % i, rating=i) for i in range(4, 8)])
+        self.session.commit()
+        self.session.remove()
+
+    def test_chunks(self):
+        # query -> number of chunks of at most 2 objects
+        for query, n in (('o=id&l=5', 3), ('o=id&l=7', 4), ('o=-id&s=4&l=5', 2)):
+            resp = self.call('GET', '/rest/streamed-author?' + query)
+            chunks = list(resp.app_iter)
+
+            # with head and tail
+            self.assertEqual(len(chunks), n + 2, query)
+            self.assertEqual(json.loads(b''.join(chunks)),
+                self.call('GET', '/rest/uncounted-author?' + query).json_body, query)
+
+        resp = json.loads(self.call('GET', '/rest/streamed-author?o=id&l=5').body)
+        self.assertEqual(([el['id'] for el in resp['data']], resp['has_more']), ([1, 2, 3, 4, 5], True))
+
+        resp = json.loads(self.call('GET', '/rest/streamed-author?o=id&l=7').body)
+        self.assertEqual(([el['id'] for el in resp['data']], resp['has_more']), ([1, 2, 3, 4, 5, 6, 7], False))
+
+
+class FieldsTest(ViewsTestCase):
+
+    def test_narrowing(self):
+        resp = self.call('GET', '/rest/author?o=id&fields=id,name').json_body
+        self.assertEqual(resp['data'], [{'id': 1, 'name': 'a1'}, {'id': 2, 'name': 'a2'}, {'id': 3, 'name': 'a3'}])
+
+        resp = self.call('GET', '/rest/author/2?fields=rating').json_body
+        self.assertEqual(resp['data'], {'rating': 2})
+
+    def test_unknown_field(self):
+        for path in ('/rest/author?fields=id,nothing', '/rest/author/1?fields=name.first'):
+            resp = self.call('GET', path).json_body
+            self.assertEqual(resp['code'], 'bad-fields', path)
+
+    def test_nested(self):
+        resp = self.call('GET', '/rest/post-with-comments/1?fields=title,comments.text').json_body
+        self.assertEqual(resp['data'], {'title': 'p1', 'comments': [{'text': 'c1'}]})
+
+        resp = self.call('GET', '/rest/post-with-comments/1?fields=comments').json_body
+        self.assertEqual(resp['data'], {'comments': [{'id': 1, 'text': 'c1', 'post_id': 1}]})
+
+        resp = self.call('GET', '/rest/post-with-comments/1?fields=comments.nothing').json_body
+        self.assertEqual(resp['code'], 'bad-fields')
+
+    def test_entities_cache_bounded(self):
+        with mock.patch.object(serialize, '_max_field_spec_entities', 2):
+            serialize._field_spec_entities.clear()
+            for fields in ('id', 'title', 'comments'):
+                self.call('GET', '/rest/post-with-comments/1?fields=' + fields)
+                self.assertLessEqual(len(serialize._field_spec_entities), 2)
+
+
+class ProjectionTest(ViewsTestCase):
+
+    def get_list(self, path):
+        resp = self.call('GET', path)
+        self.assertEqual(resp.json_body['status'], 'ok', path)
+        return resp.json_body
+
+    def selects(self):
+        return [st for st in self.statements if st.startswith('SELECT') and 'count(*)' not in st]
+
+    def test_columns(self):
+        self.assertEqual(self.get_list('/rest/projected-author?o=-id'), self.get_list('/rest/author?o=-id'))
+
+        resp = self.get_list('/rest/projected-author?o=id&fields=id,name&s=1&l=1')
+        self.assertEqual(resp['data'], [{'id': 2, 'name': 'a2'}])
+        # the outer select list, the paging subquery selects all columns
+        self.assertNotIn('rating', self.selects()[0].split('FROM')[0])
+
+    def test_fallback(self):
+        # nested comments: full objects
+        self.assertIsNone(serialize.get_projection_keys(Post, {'*': True, 'comments': {'*': True}}))
+        self.assertEqual(self.get_list('/rest/projected-post?o=id'), self.get_list('/rest/post-with-comments?o=id'))
+        self.assertTrue(any('post_comment' in st for st in self.selects()))
+
+        # callables too
+        self.assertIsNone(serialize.get_projection_keys(Author, {'*': True, 'n': lambda obj: 1}))
+
+        # narrowed to plain columns: projected again
+        resp = self.get_list('/rest/projected-post?o=id&fields=id,title')
+        self.assertEqual(resp['data'], [{'id': 1, 'title': 'p1'}, {'id': 2, 'title': 'p2'}])
+        self.assertEqual(len(self.selects()), 1)
+        self.assertNotIn('post_comment', self.selects()[0])
+
+
+class KeysetTest(ViewsTestCase):
+
+    def setUp(self):
+        super(KeysetTest, self).setUp()
+        # ties on rating: ordered by id within a rating
+        self.session.add_all([Author(id=i, name='a%d' % i, rating=rating) for i, rating in ((4, 2), (5, 2), (6, 1))])
+        self.session.commit()
+        self.session.remove()
+
+    def pages(self, order):
+        """
+        :return: list of pages of ids, following cursors from the first page of two
+        """
+        pages = []
+        cursor = ''
+        while cursor is not None:
+            resp = self.call('GET', '/rest/keyset-author?l=2&o=%s&c=%s' % (order, cursor)).json_body
+            self.assertEqual(resp['status'], 'ok', resp)
+            pages.append([el['id'] for el in resp['data']])
+            cursor = resp['cursor']
+        return pages
+
+    # a full last page has a cursor, to an empty page
+
+    def test_asc(self):
+        self.assertEqual(self.pages('rating'), [[1, 6], [2, 4], [5, 3], []])
+        self.assertEqual(self.pages('id'), [[1, 2], [3, 4], [5, 6], []])
+
+    def test_desc(self):
+        self.assertEqual(self.pages('-rating'), [[3, 5], [4, 2], [6, 1], []])
+        self.assertEqual(self.pages('-name'), [[6, 5], [4, 3], [2, 1], []])
+
+    def test_bad_cursor(self):
+        cursor = self.call('GET', '/rest/keyset-author?l=2&o=rating').json_body['cursor']
+
+        for query in ('o=-rating&c=' + cursor, 'o=rating&c=garbage'):
+            resp = self.call('GET', '/rest/keyset-author?l=2&' + query).json_body
+            self.assertEqual(resp['code'], 'bad-cursor', query)
+
+
+class RoutingTest(ViewsTestCase):
+
+    def status(self, method, path):
+        return self.call(method, path, headers={'X-Role': 'editor'}).status_int
+
+    def test_found(self):
+        self.assertEqual(self.status('GET', '/rest/author'), 200)
+        self.assertEqual(self.status('GET', '/rest/author/1'), 200)
+
+        resp = self.call('DELETE', '/rest/bulk-author/_bulk', [], headers={'X-Role': 'editor'})
+        self.assertEqual(resp.json_body, {'status': 'ok', 'results': []})
+
+    def test_not_found(self):
+        for path in ('/rest/nothing', '/rest/nothing/1', '/rest/author/1/nothing', '/rest/author/1/2/3'):
+            self.assertEqual(self.status('GET', path), 404, path)
+
+    def test_method_not_allowed(self):
+        for method, path in (('PATCH', '/rest/author'), ('DELETE', '/rest/author'), ('POST', '/rest/author/1'),
+                ('GET', '/rest/bulk-author/_bulk'), ('PATCH', '/rest/bulk-author/_bulk')):
+            self.assertEqual(self.status(method, path), 405, (method, path))
+
+
+class CompactRoutingTest(RoutingTest):
+    """
+    The same requests through the catch-all route and the dispatch table
+    """
+
+    compact = True
+
+
+class FilterTest(ViewsTestCase):
+
+    def get_ids(self, query):
+        resp = self.call('GET', '/rest/author?o=id&' + query).json_body
+        return [el['id'] for el in resp['data']] if resp['status'] == 'ok' else resp['code']
+
+    def test_filters(self):
+        self.assertEqual(self.get_ids('fgte_rating=2'), [2, 3])
+        self.assertEqual(self.get_ids('fin_id=1,3&fne_name=a3'), [1])
+
+    def test_not_filters(self):
+        self.assertEqual(self.get_ids('fbclid=x&format=json&foo_bar=1'), [1, 2, 3])
+        self.assertEqual(self.get_ids('first_name=x&from_id=2'), [1, 2, 3])
+
+    def test_bad_filters(self):
+        self.assertEqual(self.get_ids('fe_nothing=1'), 'bad-filter')
+        self.assertEqual(self.get_ids('fge_rating=2'), 'bad-filter')
+        self.assertEqual(self.get_ids('feq_rating=1'), 'bad-filter')
+        self.assertEqual(self.get_ids('fnul_rating=1'), 'bad-filter')
+        self.assertEqual(self.get_ids('fgte_rating=many'), 'bad-filter')
+
+    def test_datetime_utc_suffix(self):
+        column = sa.Column(sa.DateTime(timezone=True))
+        utc = datetime.datetime(2024, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc)
+
+        self.assertEqual(model._parse_key_value(column, '2024-01-02T03:04:05Z'), utc)
+        self.assertEqual(model._parse_key_value(column, '2024-01-02T03:04:05+00:00'), utc)
+
+
+class GetByIdsTest(ViewsTestCase):
+
+    def test_ids(self):
+        resp = self.call('GET', '/rest/post?ids=2,1,7,x').json_body
+
+        self.assertEqual([el['id'] for el in resp['data']], [2, 1])
+        self.assertEqual(resp['missing'], ['7', 'x'])
+
+    def test_custom_getters(self):
+        self.execute('UPDATE post SET hidden = 1 WHERE id = 2')
+
+        resp = self.call('GET', '/rest/visible-post?ids=1,2').json_body
+        self.assertEqual(resp['code'], 'ids-not-supported')
+
+        self.assertFalse(VisiblePostEndpoint.uses_default_getter())
+        self.assertFalse(VisiblePostEndpoint.uses_default_list_getter())
+        self.assertTrue(PostEndpoint.uses_default_getter())
+        self.assertTrue(PostEndpoint.uses_default_list_getter())
+
+
+class EntityGetterOverrideTest(ViewsTestCase):
+    """
+    Page overrides rest_get_by_id(cls, id) without the eager loading parameters
+    """
+
+    def test_get_by_id(self):
+        resp = self.call('GET', '/rest/page/1').json_body
+        self.assertEqual(resp['data']['title'], 'visible')
+
+        resp = self.call('GET', '/rest/page/2').json_body
+        self.assertEqual(resp['code'], 'object-not-found')
+
+    def test_writes(self):
+        self.assertFalse(PageEndpoint.uses_default_getter())
+
+        resp = self.call('PATCH', '/rest/page/2', {'title': 'changed'}).json_body
+        self.assertEqual(resp['code'], 'object-not-found')
+
+        resp = self.call('PUT', '/rest/page/1', {'title': 'changed'}).json_body
+        self.assertEqual(resp['status'], 'ok')
+        self.assertEqual([p.title for p in self.session.query(Page).order_by(Page.id)], ['changed', 'hidden'])
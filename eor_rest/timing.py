@@ -0,0 +1,192 @@
+# coding: utf-8
+
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+import sqlalchemy
+from sqlalchemy.engine import Engine
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class RequestTimings(object):
+    """
+    Monotonic per-phase timings of one request, plus SQL statement and row counts.
+
+    Phases recorded by eor_rest: parse, validate, count, query, serialize, render.
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self.start = time.monotonic()
+        self.endpoint = None  # route name, set by RestViews
+        self.total = None
+        self.phases = {}  # name -> seconds
+        self.statements = 0
+        self.sql_time = 0.0
+        self.rows = 0
+
+    @contextmanager
+    def phase(self, name):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.monotonic() - start
+
+    def finish(self):
+        self.total = time.monotonic() - self.start
+
+    def server_timing(self):
+        """
+        :return: Server-Timing header value, durations in milliseconds
+        """
+        metrics = ['%s;dur=%.2f' % (name, seconds * 1000) for name, seconds in self.phases.items()]
+        metrics.append('sql;desc="%d statements, %d rows";dur=%.2f' % (self.statements, self.rows, self.sql_time * 1000))
+        if self.total is not None:
+            metrics.append('total;dur=%.2f' % (self.total * 1000))
+
+        return ', '.join(metrics)
+
+
+class _NullPhase(object):
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class NullTimings(object):
+    """
+    Used when timing is disabled: phase() returns a shared no-op context manager
+    """
+
+    enabled = False
+    rows = 0
+
+    _null_phase = _NullPhase()
+
+    def phase(self, name):
+        return self._null_phase
+
+    def __setattr__(self, name, value):
+        pass  # timings.rows += n etc. are ignored
+
+
+null_timings = NullTimings()
+
+
+class Histogram(object):
+    """
+    Log-scale histogram of durations: buckets grow by 25% from 0.05 ms to ~2 min
+    """
+
+    bounds = [0.00005 * 1.25 ** i for i in range(100)]
+
+    def __init__(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+
+    def add(self, seconds):
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+
+    def percentile(self, p):
+        """
+        :param p: 0..100
+        :return: upper bound of the bucket containing the p-th percentile, seconds; None if empty
+        """
+        if not self.count:
+            return None
+
+        rank = self.count * p / 100.0
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return self.bounds[min(index, len(self.bounds) - 1)]
+
+        return self.bounds[-1]
+
+
+class StatsAggregator(object):
+    """
+    Timing sink keeping a histogram per (endpoint, phase); endpoint is the eor_rest route name
+    """
+
+    def __init__(self):
+        self.histograms = {}  # (endpoint, phase) -> Histogram
+        self._lock = threading.Lock()
+
+    def __call__(self, request, timings):
+        endpoint = timings.endpoint
+
+        values = dict(timings.phases)
+        values['sql'] = timings.sql_time
+        values['total'] = timings.total
+
+        with self._lock:
+            for phase, seconds in values.items():
+                key = (endpoint, phase)
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    histogram = self.histograms[key] = Histogram()
+                histogram.add(seconds)
+
+    def percentiles(self, endpoint, phase, ps=(50, 90, 99)):
+        """
+        :return: dict percentile -> seconds
+        """
+        histogram = self.histograms.get((endpoint, phase))
+        if histogram is None:
+            return {}
+
+        return {p: histogram.percentile(p) for p in ps}
+
+    def report(self, ps=(50, 90, 99)):
+        """
+        :return: {endpoint: {phase: {'count': n, percentile: seconds, ...}}}
+        """
+        report = {}
+        for (endpoint, phase), histogram in sorted(self.histograms.items(), key=lambda item: str(item[0])):
+            stats = {'count': histogram.count}
+            stats.update({p: histogram.percentile(p) for p in ps})
+            report.setdefault(endpoint, {})[phase] = stats
+
+        return report
+
+
+stats = StatsAggregator()
+
+
+# SQL statements are attributed to the timings of the request being handled by the current thread
+_current = threading.local()
+
+
+def set_current(timings):
+    _current.timings = timings
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timings = getattr(_current, 'timings', None)
+    if timings is not None:
+        _current.statement_start = time.monotonic()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timings = getattr(_current, 'timings', None)
+    if timings is not None:
+        timings.statements += 1
+        timings.sql_time += time.monotonic() - _current.statement_start
+
+
+def install_sql_counters():
+    if not sqlalchemy.event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        sqlalchemy.event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        sqlalchemy.event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
@@ -0,0 +1,104 @@
+# coding: utf-8
+
+import sqlalchemy
+from sqlalchemy.orm import Session
+
+import logging
+log = logging.getLogger(__name__)
+
+
+def _current_transaction(session):
+    """
+    :return: innermost SessionTransaction of session; None outside SAVEPOINTs on SQLAlchemy >= 1.4
+    """
+    if hasattr(session, 'get_nested_transaction'):
+        return session.get_nested_transaction()
+
+    return session.transaction
+
+
+class TransactionQueue(object):
+    """
+    Values queued in session.info[key] during a transaction and handed to
+    on_commit(session, values) once the outermost transaction commits (or at each flush,
+    for event='after_flush'). A rollback drops the queue; rolling back a SAVEPOINT
+    (Session.begin_nested()) drops only the values queued inside it.
+
+        _files = TransactionQueue('eor_rest_files', _after_commit)
+        _files.add(session, file_id)
+    """
+
+    def __init__(self, key, on_commit=None, event='after_commit'):
+        """
+        :param key: session.info key
+        :param on_commit: callable(session, list of values), or None to only keep the values
+            for get() until the transaction ends
+        :param event: 'after_commit' or 'after_flush'
+        """
+        self.key = key
+        self.on_commit = on_commit
+        self.event = event
+
+        # bound once: event.contains() compares listeners by identity
+        self._listener = self._after_flush if event == 'after_flush' else self._after_commit
+        self._rollback_listener = self._after_rollback
+
+    def install(self):
+        """
+        Listen to all sessions; add() installs the listeners on first use
+        """
+        if not sqlalchemy.event.contains(Session, self.event, self._listener):
+            sqlalchemy.event.listen(Session, self.event, self._listener)
+            sqlalchemy.event.listen(Session, 'after_soft_rollback', self._rollback_listener)
+
+    def add(self, session, value):
+        self.install()
+        session.info.setdefault(self.key, []).append((_current_transaction(session), value))
+
+    def get(self, session):
+        """
+        :return: list of values queued in the current transaction of session
+        """
+        return [value for transaction, value in session.info.get(self.key, ())]
+
+    def _pop(self, session):
+        return [value for transaction, value in session.info.pop(self.key, ())]
+
+    def _after_commit(self, session):
+        transaction = _current_transaction(session)
+        if transaction is not None and transaction.parent is not None:
+            # SAVEPOINT released, its values wait for the outer transaction
+            return
+
+        values = self._pop(session)
+        if values and self.on_commit is not None:
+            self.on_commit(session, values)
+
+    def _after_flush(self, session, flush_context):
+        values = self._pop(session)
+        if values and self.on_commit is not None:
+            self.on_commit(session, values)
+
+    def _after_rollback(self, session, previous_transaction):
+        if previous_transaction.parent is None:
+            session.info.pop(self.key, None)
+            return
+
+        queued = session.info.get(self.key)
+        if not queued:
+            return
+
+        kept = [(transaction, value) for transaction, value in queued
+            if not self._is_inside(transaction, previous_transaction)]
+        if len(kept) != len(queued):
+            log.debug('%s: dropping %d values of a rolled back savepoint', self.key, len(queued) - len(kept))
+            session.info[self.key] = kept
+
+    @staticmethod
+    def _is_inside(transaction, outer):
+        while transaction is not None:
+            if transaction is outer:
+                return True
+            transaction = transaction.parent
+
+        return False
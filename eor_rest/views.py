@@ -1,5 +1,10 @@
 # coding: utf-8
 
+import datetime
+import hashlib
+
+import tzlocal
+
 import logging
 log = logging.getLogger(__name__)
 
@@ -7,41 +12,56 @@ from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm.exc import NoResultFound
 
 from pyramid.renderers import render_to_response
+from pyramid.response import Response
 from pyramid.httpexceptions import HTTPNotFound, HTTPMethodNotAllowed
 from pyramid.session import check_csrf_token
 
 from .config import config
 from .exceptions import *
+from .json import get_json_encoder
+from .cache import response_cache
+from .timing import RequestTimings, null_timings, set_current
+from .sessions import reading
 
 
 class RestViews(object):
 
     apis = dict()
+    routes = dict()  # pyramid route name -> (delegate class, route name) or, for compact routes, (RestAPI, None)
 
     def __init__(self, request):
         self.request = request
         self.json = None  # for delegate
         self.obj = None   # for delegate
 
-        # parse route name: eor-rest.default.user.get
-
-        route_name = request.matched_route.name
-        route_split = request.matched_route.name.split('.', 4)
+        self.timings = null_timings
+        if config.timing:
+            self.timings = RequestTimings()
+            set_current(self.timings)
+            request.add_response_callback(self._timings_done)
 
-        if not route_name.startswith('eor-rest'):
-            log.error('RestViews: bad route name: %r', route_name)
-            raise HTTPNotFound()
-
-        api = route_split[1]
-        delegate = route_split[2]
+        # route name: eor-rest.default.user.get-list
 
         try:
-            self.delegate = self.apis[api].delegates[delegate](self)
+            target, self.route_name = self.routes[request.matched_route.name]
         except KeyError:
-            log.error('RestViews: group %r / entity %r not registered but route exists',
-                group, entity_name)
+            log.error('RestViews: route %r not registered by RestAPI', request.matched_route.name)
             raise HTTPNotFound()
 
+        self.dispatch_attr = None
+        if self.route_name is None:
+            # compact routes: target is the RestAPI
+            target, self.route_name, self.dispatch_attr = target.dispatch(request)
+
+        self.timings.endpoint = self.route_name
+        self.delegate = target(self)
+
+    def dispatch(self):
+        """
+        view of compact routes, see RestAPI.add_routes()
+        """
+        return getattr(self, self.dispatch_attr)()
+
     def get_list(self):
         """
         GET /prefix/{entity}[?qs]
@@ -51,7 +71,8 @@ class RestViews(object):
         log.info('get list %s, %s', self.delegate.name, self._log_user())
 
         try:
-            return self.delegate.get_list_handler()
+            with reading(self._use_read_session()):
+                return self._get(self.delegate.get_list_handler, self.delegate.get_list_version)
         except SQLAlchemyError as e:
             raise RESTException(code='database-error', exc=e)
 
@@ -64,7 +85,8 @@ class RestViews(object):
             self._log_user())
 
         try:
-            return self.delegate.get_item_handler()
+            with reading(self._use_read_session()):
+                return self._get(self.delegate.get_item_handler, self.delegate.get_item_version)
         except NoResultFound:
             raise RESTException(code='object-not-found')
         except SQLAlchemyError as e:
@@ -97,6 +119,22 @@ class RestViews(object):
         except SQLAlchemyError as e:
             raise RESTException(code='database-error', exc=e)
 
+    def patch(self):
+        """
+        PATCH /prefix/{entity}/{id}
+        """
+
+        log.info('patch %s id %r, %s', self.delegate.name, self.delegate.get_id_from_request(),
+            self._log_user())
+
+        try:
+            self._security_check()
+            return self.delegate.patch_handler()
+        except NoResultFound:
+            raise RESTException(code='object-not-found')
+        except SQLAlchemyError as e:
+            raise RESTException(code='database-error', exc=e)
+
     def delete(self):
         """
         DELETE /prefix/{entity}/{id}
@@ -122,20 +160,74 @@ class RestViews(object):
         except SQLAlchemyError as e:
             raise RESTException(code='database-error', exc=e)
 
+    def delete_by_filter(self):
+        """
+        DELETE /prefix/{entity}?fe_foo=1
+        """
+
+        log.info('delete by filter %s %r, %s', self.delegate.name, dict(self.request.params),
+            self._log_user())
+
+        try:
+            self._security_check()
+            return self.delegate.delete_by_filter_handler()
+        except SQLAlchemyError as e:
+            raise RESTException(code='database-error', exc=e)
+
+    def bulk_create(self):
+        """
+        POST /prefix/{entity}/_bulk
+        """
+
+        log.info('bulk create %s, %s', self.delegate.name, self._log_user())
+
+        try:
+            self._security_check()
+            return self.delegate.bulk_create_handler()
+        except SQLAlchemyError as e:
+            raise RESTException(code='database-error', exc=e)
+
+    def bulk_update(self):
+        """
+        PUT /prefix/{entity}/_bulk
+        """
+
+        log.info('bulk update %s, %s', self.delegate.name, self._log_user())
+
+        try:
+            self._security_check()
+            return self.delegate.bulk_update_handler()
+        except SQLAlchemyError as e:
+            raise RESTException(code='database-error', exc=e)
+
+    def bulk_delete(self):
+        """
+        DELETE /prefix/{entity}/_bulk
+        """
+
+        log.info('bulk delete %s, %s', self.delegate.name, self._log_user())
+
+        try:
+            self._security_check()
+            return self.delegate.bulk_delete_handler()
+        except SQLAlchemyError as e:
+            raise RESTException(code='database-error', exc=e)
+
     def custom_method(self):
-        method = self.request.matched_route.name.split('.', 4)[3]
+        method = self.route_name.split('.', 4)[3]
         method = method[len('custom-'):]
         d = self.delegate.custom_methods[method]
 
         log.info('custom [%s] %s id %r, %s', method, self.delegate.name,
-            self.delegate.get_id_from_request(), self._log_user())
+            self.request.matchdict.get('id'), self._log_user())
 
         try:
-            if d['item']:
-                obj = self.obj = self.delegate.get_obj_by_id()
-                return getattr(self.delegate, method)(obj)
-            else:
-                return getattr(self.delegate, method)()
+            with reading(d.get('read_only', False) and self.delegate.use_read_session):
+                if d['item']:
+                    obj = self.obj = self.delegate.get_obj_by_id()
+                    return getattr(self.delegate, method)(obj)
+                else:
+                    return getattr(self.delegate, method)()
         except NoResultFound:
             raise RESTException(code='object-not-found')
         except SQLAlchemyError as e:
@@ -145,6 +237,123 @@ class RestViews(object):
         #log.warn(TODO)
         raise HTTPMethodNotAllowed()
 
+    def _get(self, handler, get_version):
+        """
+        Conditional GET: answer If-None-Match / If-Modified-Since with 304 from the version
+        before calling handler if the delegate provides one, otherwise from the hash of the
+        rendered body. The version is only queried for conditional requests; their responses
+        carry the version ETag, so that the next revalidation can skip the handler.
+        Rendered bodies are cached if enabled for the delegate. The body is set on
+        request.response, so headers and cookies set by the handler are sent.
+        """
+        use_etags = self.delegate.etags
+        use_cache = config.response_cache and self.delegate.cache_responses
+
+        if not (use_etags or use_cache or self.timings.enabled):
+            return handler()
+
+        etag = last_modified = None
+
+        if use_etags and (self.request.if_none_match or self.request.if_modified_since):
+            version = get_version()
+            if version is not None:
+                etag, last_modified = self._version_validators(version)
+                if self._is_not_modified(etag, last_modified):
+                    return self._not_modified_response(etag, last_modified)
+
+        body = None
+
+        if use_cache:
+            # key is computed before the handler reads from the database
+            key = self.delegate.get_cache_key()
+            body = response_cache.get(key)
+            if body is not None:
+                log.debug('response cache hit %s', self.delegate.name)
+
+        if body is None:
+            result = handler()
+            if isinstance(result, Response):  # e.g. streamed
+                return result
+
+            with self.timings.phase('render'):
+                body = get_json_encoder(self.request)(result)
+            if use_cache:
+                response_cache.set(key, body)
+
+        # headers and cookies the handler set on request.response are kept
+        response = self.request.response
+        response.content_type = 'application/json'
+        response.charset = 'utf-8'
+        response.body = body
+
+        if use_etags:
+            body_etag = hashlib.sha1(body).hexdigest()
+            if self._is_not_modified(body_etag, None):
+                return self._not_modified_response(etag or body_etag, last_modified)
+
+            response.etag = etag or body_etag
+            response.last_modified = last_modified
+
+        return response
+
+    def _use_read_session(self):
+        """
+        Cached responses are not read from the read session: a body rendered from a lagging replica
+        after a write would be stored under the new generation and stay stale until the next write
+        """
+        return self.delegate.use_read_session and not (config.response_cache and self.delegate.cache_responses)
+
+    def _version_validators(self, version):
+        """
+        :param version: from delegate.get_item_version() or get_list_version()
+        :return: (etag, last modified datetime or None)
+        """
+        etag = hashlib.sha1(repr((
+            self.route_name,
+            self.request.matchdict.get('id'),
+            sorted(self.request.params.items()),
+            self.delegate.get_cache_scope(),
+            version
+        )).encode('utf-8')).hexdigest()
+
+        # item: version; list: (count, max version)
+        timestamp = version[1] if isinstance(version, tuple) else version
+        last_modified = None
+        if isinstance(timestamp, datetime.datetime):
+            if timestamp.tzinfo is None:
+                timestamp = tzlocal.get_localzone().localize(timestamp)
+            last_modified = timestamp.astimezone(datetime.timezone.utc).replace(microsecond=0)
+
+        return etag, last_modified
+
+    def _is_not_modified(self, etag, last_modified):
+        if self.request.if_none_match:
+            return etag in self.request.if_none_match
+
+        if_modified_since = self.request.if_modified_since
+        return bool(last_modified and if_modified_since and last_modified <= if_modified_since)
+
+    def _not_modified_response(self, etag, last_modified):
+        response = self.request.response
+        response.status = 304
+        response.body = b''
+        response.content_type = None
+        response.etag = etag
+        response.last_modified = last_modified
+        return response
+
+    def _timings_done(self, request, response):
+        set_current(None)
+        self.timings.finish()
+
+        if config.timing_server_header:
+            response.headers['Server-Timing'] = self.timings.server_timing()
+
+        try:
+            config.timing_sink(request, self.timings)
+        except Exception:
+            log.exception('RestViews: timing sink failed')
+
     def _security_check(self):
         if config.do_csrf_checks:
             check_csrf_token(self.request)  # TODO proper response
@@ -11,6 +11,15 @@ requires = [
     'tzlocal >= 1.4'
 ]
 
+extras_require = {
+    # eor_rest.aio and eor_rest.asgi
+    'async': [
+        'SQLAlchemy >= 1.4',
+        'aiosqlite',
+        'greenlet',
+    ],
+}
+
 setup(
     name='eor-rest',
     version='3.2.0',
@@ -31,4 +40,5 @@ setup(
     zip_safe=False,
     test_suite='eor_rest',
     install_requires=requires,
+    extras_require=extras_require,
 )